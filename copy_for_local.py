@@ -10,8 +10,15 @@ URL = 'https://raw.githubusercontent.com/dclaar/purple_air/main/flash'
 FILES = [
     'aqi.py',
     'aqi_and_color.py',
+    'async_requests.py',
+    'history.py',
+    'json_fields.py',
     'm5stickc.py',
+    'nowcast.py',
     'nurequests.py',
+    'renderer.py',
+    'scheduler.py',
+    'storage.py',
     'apps/LocalAQI.py']
 
 def ShowText(text, error=False):
@@ -7,6 +7,7 @@ import wifiCfg
 initial_config = (
     '{"sensor_location": '
     '"00000", '          #  <-- Purple air sensor index here!
+                         #  (apps/MultiWebAQI.py: "00000,11111,...")
     '"read_api_key": '
     '"########-####-####-####-############"' #  <-- API read key here!
     '}')
@@ -15,8 +16,16 @@ URL = 'https://raw.githubusercontent.com/dclaar/purple_air/main/flash'
 FILES = [
     'aqi.py',
     'aqi_and_color.py',
+    'async_requests.py',
+    'history.py',
+    'json_fields.py',
     'm5stickc.py',
+    'nowcast.py',
     'nurequests.py',
+    'renderer.py',
+    'scheduler.py',
+    'storage.py',
+    'apps/MultiWebAQI.py',
     'apps/WebAQI.py']
 
 def ShowText(text, error=False):
@@ -44,8 +53,9 @@ if '#####' in initial_config:
    ShowText('Put in API read key!', error=True)
 
 Connect()
-with open(b'aqi_web.json', 'w+') as fh:
-  fh.write('%s\n' % initial_config)
+for config_file in (b'aqi_web.json', b'aqi_multi.json'):
+  with open(config_file, 'w+') as fh:
+    fh.write('%s\n' % initial_config)
 for file in FILES:
   url = '%s/%s' % (URL, file)
   ShowText('copying %r' % file)
@@ -6,6 +6,15 @@ import sys
 CONFIG_FILE = 'aqi.json'
 URL_TEMPLATE = 'http://{sensor_location}/json?live=false'
 
+# The only fields dict_to_data looks at.
+JSON_FIELDS = {
+    'pm2_5_atm': None, 'pm2_5_atm_b': None,
+    'pm2_5_cf_1': None, 'pm2_5_cf_1_b': None,
+    'pm2.5_aqi': None, 'pm2.5_aqi_b': None,
+    'p25aqic': None, 'p25aqic_b': None,
+    'current_humidity': None,
+}
+
 
 class PurpleLocal():
   """Interface specific details for local web."""
@@ -13,6 +22,7 @@ class PurpleLocal():
   def __init__(self):
     self.config_file = CONFIG_FILE
     self.url_template = URL_TEMPLATE
+    self.json_fields = JSON_FIELDS
     self.pm2_5_atm = None
     self.pm2_5_cf_1 = None
     self.humidity = None
@@ -43,7 +53,7 @@ def main():
   my_aqi = aqi.AQI(interface)
   while True:
     try:
-      my_aqi.Run()
+      my_aqi.Start()
     except Exception as e:
       # Yes, I know that this is ugly, but it's for debugging bogies.
       print('Oops! Fell through!\n:')
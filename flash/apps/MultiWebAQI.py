@@ -0,0 +1,95 @@
+"""Display the worst AQI from several purple air monitors on the web."""
+import aqi
+import sys
+
+CONFIG_FILE = 'aqi_multi.json'
+# sensor_location is a comma separated list of sensor indices.
+URL_TEMPLATE = 'https://api.purpleair.com/v1/sensors?api_key={read_api_key}&fields={fields}&show_only={sensor_location}'
+
+# All of the sensors come back in one compact response:
+# {'fields': [names], 'data': [[values], [values], ...]}.
+API_FIELDS = ('sensor_index', 'pm2.5_atm', 'pm2.5_cf_1', 'humidity')
+JSON_FIELDS = {
+    'fields': None,
+    'data': None,
+}
+
+
+class PurpleMultiWeb():
+  """Device specific details for a group of web sensors.
+
+  All of the sensors are fetched with one request. The Correction is
+  applied to each one that has readings and the worst is shown.
+  """
+
+  def __init__(self):
+    self.config_file = CONFIG_FILE
+    self.url_template = URL_TEMPLATE
+    self.json_fields = JSON_FIELDS
+    self.api_fields = API_FIELDS
+    self.pm2_5_atm = None
+    self.pm2_5_cf_1 = None
+    self.humidity = None
+    self.seconds_between = 60
+    # The API sends PM2.5, not AQI, so there's no 'raw' correction.
+    self.reports_aqi = False
+    self.sensors = []
+    self.sensor_count = 0
+    self.sensor_index = None
+
+  def dict_to_data(self, data):
+    """Extract all of the sensors' data, and select the first one.
+
+    Args:
+      data: Dictionary of sensor(s) data.
+    Raises:
+      ValueError: There are no sensors in data.
+      aqi.Error: None of the sensors has PM2.5 readings (all offline).
+    """
+    fields = data['fields']
+    self.sensors = [dict(zip(fields, row)) for row in data['data']]
+    self.sensor_count = len(self.sensors)
+    if not self.sensor_count:
+      raise ValueError('No sensors in response')
+    for sensor in self.sensors:
+      if (sensor.get('pm2.5_atm') is not None and
+          sensor.get('pm2.5_cf_1') is not None):
+        break
+    else:
+      raise aqi.Error('No sensor has PM2.5 readings')
+    self.Select(0)
+
+  def Select(self, index):
+    """Make sensor number index the current one.
+
+    An offline sensor's PM2.5 readings are None.
+
+    Args:
+      index: 0 to sensor_count - 1.
+    """
+    sensor = self.sensors[index]
+    self.sensor_index = sensor.get('sensor_index')
+    self.pm2_5_atm = sensor.get('pm2.5_atm')
+    self.pm2_5_cf_1 = sensor.get('pm2.5_cf_1')
+    self.humidity = None
+    if sensor.get('humidity') is not None:
+      self.humidity = float(sensor['humidity'])
+
+
+def main():
+  """Main loop. Runs forever."""
+  interface = PurpleMultiWeb()
+  my_aqi = aqi.AQI(interface)
+  while True:
+    try:
+      my_aqi.Start()
+    except Exception as e:
+      # Yes, I know that this is ugly, but it's for debugging bogies.
+      print('Oops! Fell through!\n:')
+      my_aqi.hw.print_exception(e)
+      my_aqi.hw.ShowError('%s' % e)
+      my_aqi.hw.WaitMS(5000)
+
+# The M5StickC doesn't use the name __main__, it uses m5ucloud.
+if __name__ in ('__main__', 'm5ucloud'):
+  main()
@@ -4,7 +4,19 @@ from aqi_and_color import RGBStringToList
 import sys
 
 CONFIG_FILE = 'aqi_web.json'
-URL_TEMPLATE = 'https://api.purpleair.com/v1/sensors/{sensor_location}?api_key={read_api_key}'
+URL_TEMPLATE = 'https://api.purpleair.com/v1/sensors/{sensor_location}?api_key={read_api_key}&fields={fields}'
+
+# The only fields dict_to_data looks at. Asking the API for just these
+# keeps the response small and costs fewer API points.
+API_FIELDS = ('pm2.5_atm', 'pm2.5_cf_1', 'humidity')
+
+# Response is either {'sensor': {...}} or the compact
+# {'fields': [names], 'data': [[values]]}.
+JSON_FIELDS = {
+    'sensor': {'pm2.5_atm': None, 'pm2.5_cf_1': None, 'humidity': None},
+    'fields': None,
+    'data': None,
+}
 
 
 class PurpleWeb():
@@ -13,6 +25,8 @@ class PurpleWeb():
   def __init__(self):
     self.config_file = CONFIG_FILE
     self.url_template = URL_TEMPLATE
+    self.json_fields = JSON_FIELDS
+    self.api_fields = API_FIELDS
     self.pm2_5_atm = None
     self.pm2_5_cf_1 = None
     self.humidity = None
@@ -24,7 +38,10 @@ class PurpleWeb():
     Args:
       data: Dictionary of sensor(s) data.
     """
-    sensor = data['sensor']
+    if 'sensor' in data:
+      sensor = data['sensor']
+    else:
+      sensor = dict(zip(data['fields'], data['data'][0]))
     self.pm2_5_atm = sensor['pm2.5_atm']
     self.pm2_5_cf_1 = sensor['pm2.5_cf_1']
     if 'humidity' in sensor:
@@ -39,7 +56,7 @@ def main():
   my_aqi = aqi.AQI(interface)
   while True:
     try:
-      my_aqi.Run()
+      my_aqi.Start()
     except Exception as e:
       # Yes, I know that this is ugly, but it's for debugging bogies.
       print('Oops! Fell through!\n:')
@@ -1,20 +1,84 @@
 """Display AQI from purple air monitor."""
 import json
 import aqi_and_color
+import history
+import json_fields
+import nowcast
+import scheduler
+import storage
+
+try:
+  import uasyncio as asyncio
+except ImportError:
+  import asyncio
+try:
+  import urandom as random
+except ImportError:
+  import random
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
 
 try:
   import gui_m5stick as hardware
 except ImportError:
   import m5stickc as hardware
 
+
+def SetHardware(module):
+  """Use a different hardware module, e.g. headless. Call before AQI.Run."""
+  global hardware
+  hardware = module
+
 # If you don't like the "marching ants" chaser, set to False.
 CHASER = True
+# Set to True to fetch data in the background with (u)asyncio, so that the
+# buttons & animations keep going while waiting on the network.
+ASYNC = False
+# Set to True to pick the interface's json_fields out of the sensor's JSON as
+# it arrives, rather than json.loads of the whole body. That never holds the
+# whole body or the fields we don't use in memory, but it is several times
+# slower: json.loads is C, json_fields is Python.
+STREAM_JSON = False
 FORGETFUL_USER_MINUTES = 2
-
-# This is only approximate, but close enough.
-SECONDS_TO_LOOP_COUNTER_MULTIPLIER = 100
-ORIENTATION_CHECK_POINT = 20
-HEARTBEAT_CHECK_POINT = 100
+# Set to True to keep settings changed on the device (brightness,
+# correction) in the ESP32's NVS rather than rewriting the config file.
+SETTINGS_IN_NVS = False
+# Save changed settings once they have been left alone this long, so that
+# clicking through them doesn't write each one to flash.
+SAVE_DELAY_MS = 5000
+
+FORGETFUL_USER_MS = FORGETFUL_USER_MINUTES * 60 * 1000
+
+ORIENTATION_MS = 200
+HEARTBEAT_MS = 1000
+CORRECTION_BLINK_MS = 300
+BUTTON_POLL_MS = 10
+
+# Poll less often while the air isn't changing. Set to False to always poll
+# every seconds_between seconds.
+ADAPTIVE_POLLING = True
+# By default, back off to at most this many times seconds_between.
+MAX_POLL_MULTIPLIER = 6
+# Each steady poll waits this much longer than the last.
+POLL_BACKOFF = 1.5
+# An AQI change of at least this much means things are moving.
+POLL_CHANGE_THRESHOLD = 3
+# Within this much of a category boundary, keep a close eye on it.
+POLL_NEAR_BOUNDARY = 5
+
+# After a failed poll, retry after RETRY_BASE_MS, doubling each time (with
+# some randomness) up to RETRY_MAX_MS. After FAILURES_TO_OPEN failures in a
+# row, give the sensor a rest for CIRCUIT_OPEN_MS, then try once.
+RETRY_BASE_MS = 5000
+RETRY_MAX_MS = 5 * 60 * 1000
+FAILURES_TO_OPEN = 5
+CIRCUIT_OPEN_MS = 10 * 60 * 1000
+
+# Where the "this data is stale" marker goes.
+STALE_MARKER = [146, 60, 8, 8]
 
 
 class Error(Exception):
@@ -29,12 +93,30 @@ class BadJSONError(Error):
   """Couldn't convert the JSON we got back."""
 
 class Defaults():
-  """Storage backed defaults."""
+  """Storage backed defaults.
+
+  Changes are kept in memory until Flush is called with the time, and only
+  written once they have been left alone for delay_ms, so that several
+  changes in a row are written once. With delay_ms=0, every change is
+  written straight away.
+  """
 
-  def __init__(self, config_file, url_template):
+  def __init__(self, config_file, url_template, fields=None, store=None,
+               delay_ms=0):
     self.defaults = None
     self.config_file = config_file
     self.url_template = url_template
+    self.fields = fields
+    if store is None:
+      if SETTINGS_IN_NVS and storage.esp32:
+        store = storage.NVSStore(config_file)
+      else:
+        store = storage.FileStore(config_file)
+    self.store = store
+    self.delay_ms = delay_ms
+    self.dirty = False
+    self.changed_ms = None
+    self.saves = 0
 
   def _getDefaults(self):
     """Get default configuration from a JSON file.
@@ -42,29 +124,50 @@ class Defaults():
     Rather than hard-coding the ip address of the sensor, put it in
     a config file. We also store user's brightness selection there so
     that the device comes back up at the same brightness.
+
+    If the interface says which fields it needs, they are put in the URL so
+    that the server only sends those.
     """
-    with open(self.config_file) as pc:
-      try:
-        self.defaults = json.load(pc)
-      except ValueError:
-        raise BadJSONError('Bad JSON: {}'.format(self.config_file))
+    try:
+      self.defaults = self.store.Load()
+    except ValueError:
+      raise BadJSONError('Bad JSON: {}'.format(self.config_file))
     if 'sensor_location' not in self.defaults:
       raise Error('"sensor_location" not found in {}'.format(self.config_file))
     kwargs = {'sensor_location': self.defaults['sensor_location']}
     if 'read_api_key' in self.defaults:
       kwargs['read_api_key'] = self.defaults['read_api_key']
+    if self.fields:
+      kwargs['fields'] = ','.join(self.fields)
     self.defaults['url'] = self.url_template.format(**kwargs)
 
   def _SaveDefaults(self):
     """Save default to "disk" for next time."""
-    with open(self.config_file, 'w') as pc:
-      pc.write(json.dumps(self.defaults))
+    self.store.Save(self.defaults)
+    self.dirty = False
+    self.saves += 1
+
+  def Flush(self, now_ms=None):
+    """Write out changes, if they have been left alone for long enough.
+
+    Args:
+      now_ms: Hardware.TicksMS(). None: Write any changes now.
+    """
+    if not self.dirty:
+      return
+    if now_ms is not None:
+      if self.changed_ms is None:
+        self.changed_ms = now_ms  # Changed before we knew the time.
+      if now_ms - self.changed_ms < self.delay_ms:
+        return
+    self._SaveDefaults()
 
   def Update(self, name, value):
     """(Possibly) update a default & write to disk.
 
     If the value passed in matches the existing value, don't do anything,
-    otherwise set the value as default and write all defaults to disk.
+    otherwise set the value as default and write all defaults to disk (now,
+    or on a later Flush).
 
     Args:
       name: Name of default to update.
@@ -75,7 +178,10 @@ class Defaults():
     if name in self.defaults and value == self.defaults[name]:
       return
     self.defaults[name] = value
-    self._SaveDefaults()
+    self.dirty = True
+    self.changed_ms = None
+    if not self.delay_ms:
+      self._SaveDefaults()
 
   def Get(self, name, default_value):
     """Get existing default, or set it to default_value write out defaults.
@@ -93,6 +199,122 @@ class Defaults():
     return self.defaults[name]
 
 
+class PollPolicy():
+  """Decide how long to wait before the next poll.
+
+  Back off when readings are flat; go back to the fastest rate when AQI is
+  changing or close to a category boundary (where the color changes). Never
+  poll faster than the sensor updates, or than the web API points budget
+  allows.
+  """
+
+  def __init__(self, min_seconds, max_seconds, points_per_poll=0,
+               points_per_day=None):
+    """Initialize class.
+
+    Args:
+      min_seconds: Fastest rate: How often the sensor's data updates.
+      max_seconds: Slowest rate.
+      points_per_poll: Web API points each poll costs.
+      points_per_day: Web API points we can spend per day, or None.
+    """
+    if points_per_day:
+      min_seconds = max(min_seconds, 24 * 60 * 60 * points_per_poll /
+                        points_per_day)
+    self.min_ms = int(min_seconds * 1000)
+    self.max_ms = max(self.min_ms, int(max_seconds * 1000))
+    self.interval_ms = self.min_ms
+    self.last_aqi = None
+
+  def _NearBoundary(self, aqi):
+    for lower_edge, unused_color in aqi_and_color.RGB_BREAKS[1:]:
+      if abs(aqi - lower_edge) <= POLL_NEAR_BOUNDARY:
+        return True
+    return False
+
+  def Next(self, aqi):
+    """Work out the next interval after a successful poll.
+
+    Args:
+      aqi: AQI we got (after correction), or None if there isn't one.
+    Returns:
+      Milliseconds until the next poll.
+    """
+    if (aqi is None or self.last_aqi is None or
+        abs(aqi - self.last_aqi) >= POLL_CHANGE_THRESHOLD or
+        self._NearBoundary(aqi)):
+      self.interval_ms = self.min_ms
+    else:
+      self.interval_ms = min(int(self.interval_ms * POLL_BACKOFF), self.max_ms)
+    self.last_aqi = aqi
+    return self.interval_ms
+
+
+class FailurePolicy():
+  """Decide when to retry after polls fail.
+
+  Exponential backoff with jitter, plus a circuit breaker: After
+  FAILURES_TO_OPEN failures in a row the circuit "opens" and we leave the
+  sensor alone for CIRCUIT_OPEN_MS. The next poll is a "half open" trial:
+  If it works we are back to normal, if not the circuit opens again.
+
+  The counters are there for diagnostics.
+  """
+
+  CLOSED = 'closed'
+  OPEN = 'open'
+  HALF_OPEN = 'half open'
+
+  def __init__(self):
+    self.state = self.CLOSED
+    self.consecutive_failures = 0
+    self.total_failures = 0
+    self.first_failure_ms = None
+    self.last_recovery_ms = None  # How long the last outage lasted.
+
+  def _Jitter(self, delay_ms):
+    """Somewhere between half and all of delay_ms."""
+    return delay_ms // 2 + (delay_ms // 2) * random.getrandbits(8) // 255
+
+  def Attempt(self):
+    """Called when a poll starts."""
+    if self.state == self.OPEN:
+      self.state = self.HALF_OPEN
+
+  def Failed(self, now_ms):
+    """Record a failure.
+
+    Args:
+      now_ms: Hardware.TicksMS().
+    Returns:
+      Milliseconds to wait before trying again.
+    """
+    self.consecutive_failures += 1
+    self.total_failures += 1
+    if self.first_failure_ms is None:
+      self.first_failure_ms = now_ms
+    if (self.state == self.HALF_OPEN or
+        self.consecutive_failures >= FAILURES_TO_OPEN):
+      self.state = self.OPEN
+      return self._Jitter(CIRCUIT_OPEN_MS)
+    delay_ms = RETRY_BASE_MS << (self.consecutive_failures - 1)
+    return self._Jitter(min(delay_ms, RETRY_MAX_MS))
+
+  def Succeeded(self, now_ms):
+    """Record a success.
+
+    Returns:
+      True if this ended a run of failures.
+    """
+    self.state = self.CLOSED
+    if not self.consecutive_failures:
+      return False
+    self.last_recovery_ms = now_ms - self.first_failure_ms
+    self.consecutive_failures = 0
+    self.first_failure_ms = None
+    return True
+
+
 class Brightness():
   """Class to manage device brightness.
 
@@ -103,16 +325,18 @@ class Brightness():
   # 20 is barely visible in the dark. 100 is maximum. Start at full bright.
   BRIGHTNESS = [100, 90, 80, 70, 60, 50, 40, 30, 20]
 
+  # The outline is drawn in hardware.WHITE, looked up when drawing, as
+  # SetHardware may change it.
   GAUGE = [
-    {'shape': 'Triangle', 'args': [150, 10, 154, 2, 158, 10, hardware.WHITE]},  #100
-    {'shape': 'Rect', 'args': [150, 12, 7, 7, hardware.WHITE]}, # 90
-    {'shape': 'Rect', 'args': [150, 20, 7, 7, hardware.WHITE]}, #80
-    {'shape': 'Rect', 'args': [150, 28, 7, 7, hardware.WHITE]}, #70
-    {'shape': 'Rect', 'args': [150, 36, 7, 7, hardware.WHITE]}, #60
-    {'shape': 'Rect', 'args': [150, 44, 7, 7, hardware.WHITE]}, # 60
-    {'shape': 'Rect', 'args': [150, 52, 7, 7, hardware.WHITE]}, #40
-    {'shape': 'Rect', 'args': [150, 60, 7, 7, hardware.WHITE]}, #30
-    {'shape': 'Triangle', 'args': [150, 68, 154, 75, 158, 68, hardware.WHITE]},  #20
+    {'shape': 'Triangle', 'args': [150, 10, 154, 2, 158, 10]},  #100
+    {'shape': 'Rect', 'args': [150, 12, 7, 7]}, # 90
+    {'shape': 'Rect', 'args': [150, 20, 7, 7]}, #80
+    {'shape': 'Rect', 'args': [150, 28, 7, 7]}, #70
+    {'shape': 'Rect', 'args': [150, 36, 7, 7]}, #60
+    {'shape': 'Rect', 'args': [150, 44, 7, 7]}, # 60
+    {'shape': 'Rect', 'args': [150, 52, 7, 7]}, #40
+    {'shape': 'Rect', 'args': [150, 60, 7, 7]}, #30
+    {'shape': 'Triangle', 'args': [150, 68, 154, 75, 158, 68]},  #20
   ]
 
   def __init__(self, hw, brightness_index):
@@ -136,7 +360,7 @@ class Brightness():
       bg_color: Current background color. Used to show empty elements.
     """
     for br in range(len(self.BRIGHTNESS)):
-      args = self.GAUGE[br]['args'][:]
+      args = self.GAUGE[br]['args'] + [hardware.WHITE]
       args.append(bg_color if br < self.brightness_index else hardware.WHITE)
       getattr(self.hw, self.GAUGE[br]['shape'])(*args)
 
@@ -157,24 +381,35 @@ class Brightness():
       B: Go to next brightness (up or down).
     """
     self.DrawGauge(bg_color)
-    forgetful_user_count = (SECONDS_TO_LOOP_COUNTER_MULTIPLIER * 60 *
-                            FORGETFUL_USER_MINUTES)
-    while True:
-      button = self.hw.CheckForButton()
-      if button == hardware.BUTTONA or forgetful_user_count <= 0:
-        return self.brightness_index
-      elif button == hardware.BUTTONB:
-        self.brightness_index = self.brightness_index + self.brightness_incr
-        if self.brightness_index >= len(self.BRIGHTNESS):
-          self.brightness_index = len(self.BRIGHTNESS) -1
-          self.brightness_incr = -1
-        elif self.brightness_index < 0:
-          self.brightness_incr = 1
-          self.brightness_index = 0
-        self.hw.SetBrightness(self.BRIGHTNESS[self.brightness_index])
-        self.DrawGauge(bg_color)
-      self.hw.WaitMS(10)
-      forgetful_user_count -= 1
+    tasks = scheduler.Scheduler(self.hw)
+    tasks.After(FORGETFUL_USER_MS, lambda: self.brightness_index)
+    return tasks.Run(lambda button: self._HandleButton(button, bg_color))
+
+  async def RunAsync(self, bg_color):
+    """Run, but as a (u)asyncio task so other tasks keep running."""
+    self.DrawGauge(bg_color)
+    end = self.hw.TicksMS() + FORGETFUL_USER_MS
+    while self.hw.TicksMS() < end:
+      result = self._HandleButton(self.hw.CheckForButton(), bg_color)
+      if result is not None:
+        return result
+      await asyncio.sleep(BUTTON_POLL_MS / 1000)
+    return self.brightness_index
+
+  def _HandleButton(self, button, bg_color):
+    if button == hardware.BUTTONA:
+      return self.brightness_index
+    elif button == hardware.BUTTONB:
+      self.brightness_index = self.brightness_index + self.brightness_incr
+      if self.brightness_index >= len(self.BRIGHTNESS):
+        self.brightness_index = len(self.BRIGHTNESS) -1
+        self.brightness_incr = -1
+      elif self.brightness_index < 0:
+        self.brightness_incr = 1
+        self.brightness_index = 0
+      self.hw.SetBrightness(self.BRIGHTNESS[self.brightness_index])
+      self.DrawGauge(bg_color)
+    return None
 
 
 class Correction(aqi_and_color.AqiAndColor):
@@ -185,14 +420,58 @@ class Correction(aqi_and_color.AqiAndColor):
     self.hw = hw
     self.interface = interface
     self.correction_index = correction_index
+    self.display_symbol = True
     self.corrections= [
-        {'name': 'none', 'function': self.PMNoCorrection, 'symbol': 'N'},
-        {'name': 'raw', 'function': self.NoCorrection, 'symbol': 'R'},
-        {'name': 'epa', 'function': self.EPACorrection, 'symbol': 'E'},
-        {'name': 'aqu', 'function': self.AQandUCorrection, 'symbol': 'A'},
-        {'name': 'lrapa', 'function': self.LRAPACorrection, 'symbol': 'L'},
-        {'name': 'pm25', 'function': self.PMNoCorrection, 'symbol': 'P'},
+        {'name': 'none', 'function': self.PMNoCorrection, 'symbol': 'N',
+         'array_function': self.PMNoCorrectionArray},
+        {'name': 'raw', 'function': self.NoCorrection, 'symbol': 'R',
+         'array_function': None},
+        {'name': 'epa', 'function': self.EPACorrection, 'symbol': 'E',
+         'array_function': self.EPACorrectionArray},
+        {'name': 'aqu', 'function': self.AQandUCorrection, 'symbol': 'A',
+         'array_function': self.AQandUCorrectionArray},
+        {'name': 'lrapa', 'function': self.LRAPACorrection, 'symbol': 'L',
+         'array_function': self.LRAPACorrectionArray},
+        {'name': 'pm25', 'function': self.PMNoCorrection, 'symbol': 'P',
+         'array_function': self.PMNoCorrectionArray},
+        {'name': 'nowcast', 'function': self.NowCastCorrection, 'symbol': 'C',
+         'array_function': None},
     ]
+    # Interfaces whose endpoint doesn't send an AQI (MultiWebAQI) have
+    # nothing for 'raw' to show, so it is skipped.
+    self.reports_aqi = getattr(interface, 'reports_aqi', True)
+    if not self._Usable(correction_index):
+      self.correction_index = self._Next(correction_index)
+    # NowCast per sensor_index (None if the interface has one sensor).
+    self.nowcasts = {}
+    # Look colors up rather than calculating them every poll.
+    self.native_colors = self.hw.ColorTableToNative(self.getAQIColorTable())
+    self.pm25_color = self.hw.ColorListToNative([200, 200, 200])
+
+  def _Usable(self, index):
+    return self.reports_aqi or self.corrections[index]['name'] != 'raw'
+
+  def _Next(self, index):
+    """The next correction after index that works with the interface."""
+    while True:
+      index = (index + 1) % len(self.corrections)
+      if self._Usable(index):
+        return index
+
+  def _Sensors(self):
+    """Select each of the interface's sensors that has readings, in turn.
+
+    Offline sensors come back with no PM2.5, and are skipped. Afterwards,
+    the first sensor is selected, as after dict_to_data.
+    """
+    try:
+      for index in range(self.interface.sensor_count):
+        self.interface.Select(index)
+        if (self.interface.pm2_5_atm is not None and
+            self.interface.pm2_5_cf_1 is not None):
+          yield index
+    finally:
+      self.interface.Select(0)
 
   def CorrectionSymbol(self):
     return self.corrections[self.correction_index]['symbol']
@@ -210,7 +489,11 @@ class Correction(aqi_and_color.AqiAndColor):
     """Use the EPA correction from
     https://youtu.be/G7CNziDkUok?t=1779
 
+    It needs the humidity: Sensors without it (MultiWebAQI may have some)
+    get no correction.
     """
+    if self.interface.humidity is None:
+      return self.PMNoCorrection()
     if self.interface.pm2_5_cf_1 <= 343:
       aqi = (0.52 * self.interface.pm2_5_cf_1 -
           0.086 * self.interface.humidity + 5.75)
@@ -229,22 +512,130 @@ class Correction(aqi_and_color.AqiAndColor):
     aqi = 0.5 * self.interface.pm2_5_atm - 0.68
     return 0 if aqi < 0 else aqi
 
+  def NowCastCorrection(self):
+    """EPA NowCast of the EPA corrected PM2.5.
+
+    Until there's enough history for a NowCast, this is the EPA correction.
+    """
+    engine = self.nowcasts.get(getattr(self.interface, 'sensor_index', None))
+    pm = engine.Value() if engine else None
+    return self.EPACorrection() if pm is None else pm
+
+  def Record(self, now_ms):
+    """Add the interface's readings to the NowCast of each sensor.
+
+    Args:
+      now_ms: Hardware.TicksMS().
+    """
+    if not getattr(self.interface, 'sensor_count', 0):
+      self._Record(now_ms)
+      return
+    for unused in self._Sensors():
+      self._Record(now_ms)
+
+  def _Record(self, now_ms):
+    key = getattr(self.interface, 'sensor_index', None)
+    engine = self.nowcasts.get(key)
+    if engine is None:
+      engine = self.nowcasts[key] = nowcast.NowCast()
+    engine.Add(now_ms, self.EPACorrection())
+
+  # The *Array versions of the corrections work on numpy arrays of
+  # readings rather than the interface. The arithmetic is kept in the same
+  # order as the scalar versions so the results are identical.
+
+  def PMNoCorrectionArray(self, pm2_5_atm, pm2_5_cf_1, humidity):
+    return pm2_5_atm
+
+  def EPACorrectionArray(self, pm2_5_atm, pm2_5_cf_1, humidity):
+    low = 0.52 * pm2_5_cf_1 - 0.086 * humidity + 5.75
+    high = 0.46 * pm2_5_cf_1 + 3.93 * 10**-4 * pm2_5_cf_1**2 + 2.97
+    aqi = numpy.where(pm2_5_cf_1 <= 343, low, high)
+    aqi = numpy.where(aqi < 0, 0, aqi)
+    return numpy.where(numpy.isnan(humidity), pm2_5_atm, aqi)
+
+  def AQandUCorrectionArray(self, pm2_5_atm, pm2_5_cf_1, humidity):
+    aqi = 0.778 * pm2_5_atm + 2.65
+    return numpy.where(aqi < 0, 0, aqi)
+
+  def LRAPACorrectionArray(self, pm2_5_atm, pm2_5_cf_1, humidity):
+    aqi = 0.5 * pm2_5_atm - 0.68
+    return numpy.where(aqi < 0, 0, aqi)
+
+  def CorrectArrays(self, pm2_5_atm, pm2_5_cf_1, humidity, aqi=None):
+    """Apply every correction to arrays of readings.
+
+    This is for comparing corrections over historical data on a PC, and
+    requires numpy.
+
+    Args:
+      pm2_5_atm: Array-like of pm2_5_atm readings.
+      pm2_5_cf_1: Array-like of pm2_5_cf_1 readings.
+      humidity: Array-like of humidity readings. NaN where missing.
+      aqi: Optional array-like of AQI reported by the endpoint, for 'raw'.
+    Returns:
+      dict of correction name to array of what GetAqiAndColor would show
+      for that correction. 'raw' is only included if aqi was given.
+      'nowcast' needs the readings' times, so isn't included.
+    Raises:
+      ImportError: numpy isn't installed.
+    """
+    if numpy is None:
+      raise ImportError('CorrectArrays requires numpy')
+    pm2_5_atm = numpy.asarray(pm2_5_atm, dtype=float)
+    pm2_5_cf_1 = numpy.asarray(pm2_5_cf_1, dtype=float)
+    humidity = numpy.asarray(humidity, dtype=float)
+    results = {}
+    for correction in self.corrections:
+      name = correction['name']
+      if name == 'raw':
+        if aqi is not None:
+          results[name] = numpy.rint(numpy.asarray(aqi, dtype=float)).astype(int)
+      elif correction['array_function'] is None:
+        continue
+      elif name == 'pm25':
+        results[name] = correction['array_function'](
+            pm2_5_atm, pm2_5_cf_1, humidity)
+      else:
+        results[name] = self.aqiFromPMArray(correction['array_function'](
+            pm2_5_atm, pm2_5_cf_1, humidity))
+    return results
+
 
   def GetAqiAndColor(self):
     """Get AQI number and the corresponding color after correction.
+
+    If the interface has several sensors, the correction is applied to each
+    of them that has readings and the worst (highest) AQI is returned.
+
     Returns:
       aqi, color for background, color for text.
+    Raises:
+      Error: None of the sensors has readings.
     """
+    if not getattr(self.interface, 'sensor_count', 0):
+      return self._GetAqiAndColor()
+    worst = None
+    for unused in self._Sensors():
+      result = self._GetAqiAndColor()
+      if worst is None or result[0] > worst[0]:
+        worst = result
+    if worst is None:
+      raise Error('No sensor has PM2.5 readings')
+    return worst
+
+  def _GetAqiAndColor(self):
+    """GetAqiAndColor for the interface's current sensor."""
     if self.corrections[self.correction_index]['name'] == 'raw':
       aqi, color = self.corrections[self.correction_index]['function']()
     elif self.corrections[self.correction_index]['name'] == 'pm25':
       aqi = self.corrections[self.correction_index]['function']()
-      color = self.hw.ColorListToNative([200, 200, 200])
+      color = self.pm25_color
       text_color = hardware.BLACK
     else:
       pm = self.corrections[self.correction_index]['function']()
       aqi = self.aqiFromPM(pm)
-      color = self.hw.ColorListToNative(self.getAQIColorRGB(aqi))
+      color = self.native_colors[self.colorTableIndex(aqi)]
     text_color = hardware.WHITE if aqi >= 150 else hardware.BLACK
     return aqi, color, text_color
 
@@ -273,28 +664,46 @@ class Correction(aqi_and_color.AqiAndColor):
       A: Return correction index.
       B: Go to next correction.
     """
-    counter = 0
-    forgetful_user_count = (SECONDS_TO_LOOP_COUNTER_MULTIPLIER * 60 *
-                            FORGETFUL_USER_MINUTES)
-    display = True
-    while True:
-      button = self.hw.CheckForButton()
-      if button == hardware.BUTTONA or forgetful_user_count <= 0:
-        return self.correction_index
-      elif button == hardware.BUTTONB:
-        self.correction_index += 1
-        self.correction_index %= len(self.corrections)
-        self.DisplayAQI(*self.GetAqiAndColor())
-      else:
-        counter = (counter + 1) % 30
-        if not counter:
-          display = not display
-          if display:
-            self.hw.DisplaySmallRight(color, text_color, self.CorrectionSymbol())
-          else:
-            self.hw.ClearSmallRight(color)
-      self.hw.WaitMS(10)
-      forgetful_user_count -= 1
+    self.display_symbol = True
+    tasks = scheduler.Scheduler(self.hw)
+    tasks.After(FORGETFUL_USER_MS, lambda: self.correction_index)
+    tasks.Every(CORRECTION_BLINK_MS,
+                lambda: self._BlinkSymbol(color, text_color),
+                CORRECTION_BLINK_MS)
+    return tasks.Run(self._HandleButton)
+
+  async def RunAsync(self, color, text_color):
+    """Run, but as a (u)asyncio task so other tasks keep running."""
+    self.display_symbol = True
+    now = self.hw.TicksMS()
+    end = now + FORGETFUL_USER_MS
+    blink = now + CORRECTION_BLINK_MS
+    while now < end:
+      result = self._HandleButton(self.hw.CheckForButton())
+      if result is not None:
+        return result
+      if now >= blink:
+        self._BlinkSymbol(color, text_color)
+        blink += CORRECTION_BLINK_MS
+      await asyncio.sleep(BUTTON_POLL_MS / 1000)
+      now = self.hw.TicksMS()
+    return self.correction_index
+
+  def _BlinkSymbol(self, color, text_color):
+    """Flash the correction symbol so it's obvious we're in this mode."""
+    self.display_symbol = not self.display_symbol
+    if self.display_symbol:
+      self.hw.DisplaySmallRight(color, text_color, self.CorrectionSymbol())
+    else:
+      self.hw.ClearSmallRight(color)
+
+  def _HandleButton(self, button):
+    if button == hardware.BUTTONA:
+      return self.correction_index
+    elif button == hardware.BUTTONB:
+      self.correction_index = self._Next(self.correction_index)
+      self.DisplayAQI(*self.GetAqiAndColor())
+    return None
 
 
 class AQI():
@@ -304,10 +713,22 @@ class AQI():
 
   This device has 2 sensors, and is factory calibrated.
   """
-  def __init__(self, interface):
+  def __init__(self, interface, hw=None):
+    """Initialize class.
+
+    Args:
+      interface: Where the data comes from, e.g. LocalAQI.PurpleLocal.
+      hw: Hardware instance to use. Default is a new hardware.Hardware.
+    """
     self.interface = interface
+    self.given_hw = hw
     self.hw = None
-    self.loop_count = 0
+    self.tasks = None
+    self.poll_task = None
+    self.poll_policy = None
+    self.failures = FailurePolicy()
+    self.history = history.History()
+    self.stale = False
     self.color = None
     self.text_color = None
     self.aqi = None
@@ -316,12 +737,19 @@ class AQI():
     self.corrections = None
     self.defaults = None
     self.brightness = None
+    # Which sub-mode RunAsync is in, if any.
+    self.mode = None
 
 
   def GetData(self):
     """Get data from purple air.
 
-    The device returns a bunch of values for each of the 2 sensors.
+    The device returns a bunch of values for each of the 2 sensors. With
+    STREAM_JSON, if the interface declares json_fields, only those are
+    extracted, as the data arrives.
+
+    Returns:
+      True if there is new data, False if the server says it hasn't changed.
 
     Raises:
       BadJSONError: We couldn't parse the data we got back into JSON.
@@ -330,84 +758,315 @@ class AQI():
     This is a bit sloppy, in that it catches any hardware Error, rather
     than specific ones, e.g. HTTPRequestFailedError & HTTPGetFailedError.
     """
+    fields = getattr(self.interface, 'json_fields', None)
+    try:
+      if STREAM_JSON and fields:
+        resp = self.hw.GetURIChunks(self.url)
+      else:
+        resp = self.hw.GetURI(self.url)
+    except hardware.Error as hwe:
+      raise HTTPError(hwe)
+    if resp is None:
+      return False
+    self._ParseData(resp)
+    return True
+
+  async def GetDataAsync(self):
+    """GetData, but lets other (u)asyncio tasks run while waiting."""
     try:
-      resp = self.hw.GetURI(self.url)
+      resp = await self.hw.GetURIAsync(self.url)
     except hardware.Error as hwe:
       raise HTTPError(hwe)
+    if resp is None:
+      return False
+    self._ParseData(resp)
+    return True
+
+  def _ParseData(self, resp):
+    """Parse the response and hand it to the interface.
+
+    Args:
+      resp: Body as a string, or (from GetURIChunks) an iterator over chunks
+          of it.
+    """
     try:
-      weather_dict = json.loads(resp)  # Could raise
+      if isinstance(resp, (str, bytes)):
+        weather_dict = json.loads(resp)  # Could raise
+      else:
+        weather_dict = json_fields.extract(  # Could raise
+            resp, self.interface.json_fields)
+        # extract stops at the end of the object: Read the rest, so that a
+        # kept-alive connection can be used again.
+        for unused in resp:
+          pass
+    except hardware.Error as hwe:
+      # Reading the rest of the chunks failed.
+      raise HTTPError(hwe)
     except ValueError:
       raise BadJSONError("GetURI: Couldn't load json")
     self.interface.dict_to_data(weather_dict)
+    now = self.hw.TicksMS()
+    # With several sensors (MultiWebAQI), this is the first one's readings.
+    self.history.Add(now, self.interface.pm2_5_atm,
+                     self.interface.pm2_5_cf_1, self.interface.humidity)
+    if self.corrections:
+      self.corrections.Record(now)
 
   def Run(self):
     """Display AQI from purple air device.
 
-    Initialize, then run an endless loop to report AQI and process buttons.
+    Initialize, then run forever, reporting AQI and processing buttons.
 
-    We need to poll the buttons often (event-driven didn't work, so...),
-    but we don't want to beat on the device, which only goes so fast
-    anyway. So we only check AQI ever seconds_between seconds.
+    We don't want to beat on the device, which only goes so fast
+    anyway. So we only check AQI every seconds_between seconds, or less
+    often if the AQI isn't changing (see PollPolicy).
 
     We only change the display if the AQI changes, so we show a little pulsing
     heart in the upper right corner to show "it's not dead, it's sleeping!"
 
-    We check orientation every ORIENTATION_CHECK_POINT times through the
-    loop and respond if it has changed. Why not, it's cheap, and we're not
-    doing anything anyway.
+    We check orientation every ORIENTATION_MS and respond if it has changed.
+    Why not, it's cheap, and we're not doing anything anyway.
+
+    In between, the scheduler sleeps until something is due or a button is
+    pressed.
 
     Button usage:
     A: Change Correction factor.
     B: Change brightness.
     """
-    self.hw = hardware.Hardware()
+    self._Setup()
+    self.tasks = scheduler.Scheduler(self.hw)
+    self.poll_task = self.tasks.Every(self.poll_policy.interval_ms, self.Poll)
+    self.tasks.Every(HEARTBEAT_MS, self.HeartBeat)
+    self.tasks.Every(ORIENTATION_MS, self.CheckOrientation)
+    self.tasks.Every(HEARTBEAT_MS, self.FlushDefaults)
+    self.tasks.Run(self.HandleButton)
+
+  def _Setup(self):
+    """Set up the hardware & read the defaults."""
+    self.hw = self.given_hw or hardware.Hardware()
     self.defaults = Defaults(
-        self.interface.config_file, self.interface.url_template)
+        self.interface.config_file, self.interface.url_template,
+        getattr(self.interface, 'api_fields', None), delay_ms=SAVE_DELAY_MS)
     self.url = self.defaults.Get('url', None)
     self.brightness = Brightness(self.hw, self.defaults.Get('brightness', 0))
     self.corrections = Correction(
         self.hw, self.interface, self.defaults.Get('correction_index', 0))
     self.hw.CheckWifi()
+    seconds_between = self.interface.seconds_between
+    if ADAPTIVE_POLLING:
+      max_seconds_between = getattr(self.interface, 'max_seconds_between',
+                                    seconds_between * MAX_POLL_MULTIPLIER)
+    else:
+      max_seconds_between = seconds_between
+    # Optional web API points budget, from the config file.
+    self.poll_policy = PollPolicy(
+        seconds_between, max_seconds_between,
+        self.defaults.defaults.get('api_points_per_poll', 0),
+        self.defaults.defaults.get('api_points_per_day'))
+
+  def Start(self):
+    """Run forever, with RunAsync if ASYNC is set, otherwise Run."""
+    if ASYNC:
+      asyncio.run(self.RunAsync())
+    else:
+      self.Run()
+
+  async def RunAsync(self):
+    """Like Run, but with (u)asyncio tasks.
 
+    The fetch runs in its own task, so the buttons, heartbeat and chaser keep
+    going while we wait on the network, and data keeps being refreshed while
+    in the brightness and correction sub-modes.
+    """
+    self._Setup()
+    asyncio.create_task(self._PollForeverAsync())
+    asyncio.create_task(self._EveryAsync(HEARTBEAT_MS, self._HeartBeatAsync))
+    asyncio.create_task(self._EveryAsync(
+        HEARTBEAT_MS, self._FlushDefaultsAsync))
+    asyncio.create_task(self._EveryAsync(
+        ORIENTATION_MS, self._CheckOrientationAsync))
     while True:
-      if not self.loop_count:
-        # Top of loop: Check AQI.
-        try:
-          self.GetData()
-        except Error as e:
-          # Show the error and wait a bit, then re-show previous AQI.
-          print('GetData raised: %r' % e)
-          self.hw.ShowError(e)
-          self.hw.WaitMS(5000)
-          self.corrections.DisplayAQI(self.aqi, self.color, self.text_color)
-        else:
-          aqi, color, text_color = self.corrections.GetAqiAndColor()
-          if not self.aqi or not self.color or self.aqi != aqi or self.color != color:
-            # AQI changed: Update display.
-            self.aqi = aqi
-            self.color = color
-            self.text_color = text_color
-            self.corrections.DisplayAQI(self.aqi, self.color, self.text_color)
-      if (self.loop_count % HEARTBEAT_CHECK_POINT) == 0:
-        heart_color = hardware.BLUE if aqi > 100 else hardware.RED
-        self.hw.HeartBeat(heart_color if self.heart_beat else self.color)
-        self.heart_beat = not self.heart_beat
-      if (self.loop_count % ORIENTATION_CHECK_POINT) == 0:
-        if CHASER:
-          self.hw.Chase(self.text_color, self.color)
-        if self.hw.SetOrientation():
+      await self.HandleButtonAsync(self.hw.CheckForButton())
+      await asyncio.sleep(BUTTON_POLL_MS / 1000)
+
+  async def _EveryAsync(self, interval_ms, coroutine):
+    """Await coroutine() every interval_ms, without drifting."""
+    deadline = self.hw.TicksMS()
+    while True:
+      await coroutine()
+      deadline += interval_ms
+      delay = deadline - self.hw.TicksMS()
+      if delay < 0:
+        deadline -= delay
+        delay = 0
+      await asyncio.sleep(delay / 1000)
+
+  async def _PollForeverAsync(self):
+    """PollAsync at the intervals the PollPolicy & FailurePolicy pick."""
+    while True:
+      try:
+        delay_ms = await self.PollAsync()
+      except Exception as e:
+        # Anything else (e.g. a KeyError from an unexpected body) would end
+        # this task, and the display would silently stop updating.
+        delay_ms = self._PollFailed(e)
+      await asyncio.sleep(delay_ms / 1000)
+
+  async def PollAsync(self):
+    """Poll, as a task. Only draws when not in a sub-mode.
+
+    Returns:
+      Milliseconds until the next poll.
+    """
+    self.failures.Attempt()
+    try:
+      changed = await self.GetDataAsync()
+    except Error as e:
+      return self._PollFailed(e)
+    # If nothing changed since last time, skip the parse & redraw.
+    if changed:
+      aqi, color, text_color = self.corrections.GetAqiAndColor()
+      if (not self.aqi or not self.color or self.aqi != aqi or
+          self.color != color):
+        self.aqi = aqi
+        self.color = color
+        self.text_color = text_color
+        # The brightness gauge would get erased; the correction sub-mode
+        # shows the AQI anyway.
+        if self.mode != 'brightness':
           self.corrections.DisplayAQI(self.aqi, self.color, self.text_color)
+    return self._PollSucceeded()
 
-      # Check and process buttons
-      button = self.hw.CheckForButton()
-      if button == hardware.BUTTONB:
-        self.defaults.Update('brightness', self.brightness.Run(self.color))
-        self.corrections.DisplayAQI(self.aqi, self.color, self.text_color)
-      elif button == hardware.BUTTONA:
-        self.defaults.Update('correction_index', self.corrections.Run(
-          self.color, self.text_color))
-        self.aqi, self.color, self.text_color = self.corrections.GetAqiAndColor()
+  # Nothing to draw on until the first poll has set a color.
+
+  async def _HeartBeatAsync(self):
+    if self.mode is None and self.color is not None:
+      self.HeartBeat()
+
+  async def _FlushDefaultsAsync(self):
+    self.FlushDefaults()
+
+  async def _CheckOrientationAsync(self):
+    if self.mode is None and self.color is not None:
+      self.CheckOrientation()
+
+  async def HandleButtonAsync(self, button):
+    """HandleButton, with the sub-modes running as tasks."""
+    if self.color is None:
+      return
+    if button == hardware.BUTTONB:
+      self.mode = 'brightness'
+      try:
+        self.defaults.Update(
+            'brightness', await self.brightness.RunAsync(self.color))
+      finally:
+        self.mode = None
+      self.corrections.DisplayAQI(self.aqi, self.color, self.text_color)
+    elif button == hardware.BUTTONA:
+      self.mode = 'correction'
+      try:
+        self.defaults.Update('correction_index', await self.corrections.RunAsync(
+            self.color, self.text_color))
+      finally:
+        self.mode = None
+      self.aqi, self.color, self.text_color = self.corrections.GetAqiAndColor()
+      self.corrections.DisplayAQI(self.aqi, self.color, self.text_color)
+
+  def Poll(self):
+    """Check AQI, and update the display if it changed."""
+    self.failures.Attempt()
+    try:
+      changed = self.GetData()
+    except Error as e:
+      self._SetPollInterval(self._PollFailed(e))
+      return
+    # If nothing changed since last time, skip the parse & redraw.
+    if changed:
+      aqi, color, text_color = self.corrections.GetAqiAndColor()
+      if not self.aqi or not self.color or self.aqi != aqi or self.color != color:
+        # AQI changed: Update display.
+        self.aqi = aqi
+        self.color = color
+        self.text_color = text_color
         self.corrections.DisplayAQI(self.aqi, self.color, self.text_color)
-      self.hw.WaitMS(10)
-      self.loop_count = (self.loop_count + 1) % (
-          self.interface.seconds_between * SECONDS_TO_LOOP_COUNTER_MULTIPLIER)
+    self._SetPollInterval(self._PollSucceeded())
+
+  def _SetPollInterval(self, interval_ms):
+    if interval_ms != self.poll_task.interval_ms:
+      self.tasks.Reschedule(self.poll_task, interval_ms)
+
+  def _PollFailed(self, e):
+    """Note the failure, and show it without stopping everything.
+
+    If we have something on the display, keep it there with a marker to
+    show that it is stale, otherwise show the error.
+
+    Returns:
+      Milliseconds until the next poll.
+    """
+    print('GetData raised: %r' % e)
+    if self.color is None:
+      if self.mode is None:
+        self.hw.ShowError(e)
+    else:
+      self.stale = True
+      self.ShowStale()
+    return self.failures.Failed(self.hw.TicksMS())
+
+  def _PollSucceeded(self):
+    """Clear any failure state.
+
+    Returns:
+      Milliseconds until the next poll.
+    """
+    self.failures.Succeeded(self.hw.TicksMS())
+    if self.stale:
+      self.stale = False
+      self.ShowStale()
+    return self.poll_policy.Next(self.aqi)
+
+  def ShowStale(self):
+    """Draw (or erase) the stale data marker in the bottom right."""
+    if self.mode is not None or self.color is None:
+      return
+    x, y, width, height = STALE_MARKER
+    color = self.text_color if self.stale else self.color
+    self.hw.Rect(x, y, width, height, color, color)
+
+  def FlushDefaults(self):
+    """Save any changed settings, once they have settled."""
+    self.defaults.Flush(self.hw.TicksMS())
+
+  def HeartBeat(self):
+    """Pulse the heart to show that we're still running."""
+    if self.color is None:
+      return  # Until the first poll has set a color.
+    heart_color = hardware.BLUE if self.aqi and self.aqi > 100 else hardware.RED
+    self.hw.HeartBeat(heart_color if self.heart_beat else self.color)
+    self.heart_beat = not self.heart_beat
+    if self.stale:
+      # In case the display was redrawn over it.
+      self.ShowStale()
+
+  def CheckOrientation(self):
+    """Move the chaser along, and flip the display if the device flipped."""
+    if self.color is None:
+      return
+    if CHASER:
+      self.hw.Chase(self.text_color, self.color)
+    if self.hw.SetOrientation():
+      self.corrections.DisplayAQI(self.aqi, self.color, self.text_color)
+
+  def HandleButton(self, button):
+    """Go into the brightness or correction sub-mode."""
+    if self.color is None:
+      return  # Nothing to adjust yet.
+    if button == hardware.BUTTONB:
+      self.defaults.Update('brightness', self.brightness.Run(self.color))
+      self.corrections.DisplayAQI(self.aqi, self.color, self.text_color)
+    elif button == hardware.BUTTONA:
+      self.defaults.Update('correction_index', self.corrections.Run(
+        self.color, self.text_color))
+      self.aqi, self.color, self.text_color = self.corrections.GetAqiAndColor()
+      self.corrections.DisplayAQI(self.aqi, self.color, self.text_color)
@@ -1,7 +1,43 @@
 """Class for calculating AQI from PM, and colors for that AQI."""
 
+from array import array
 import sys
 
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# Lower edge of each AQI color band and the color at that edge.
+RGB_BREAKS = [
+    (0, [0, 228, 0]),  # 0-50
+    (51, [255, 255, 0]),  # 51-100
+    (101, [255, 126, 0]),  # 101-150
+    (151, [255, 0, 0]),  # 151-200
+    (201, [153, 0, 76]),  # 201-300
+    (301, [126, 0, 35]),  # 301+
+]
+
+# Range of AQI values covered by the color table. aqiFromPM returns -1 for
+# bad PM; anything above MAX_AQI has the same color as MAX_AQI.
+MIN_AQI = -1
+MAX_AQI = 500
+
+# Breakpoint table equivalent to the if-chain in aqiFromPM, used by the
+# batch functions. PM2.5 values strictly above PM_THRESHOLDS[i] fall into
+# PM_BREAKPOINTS[i + 1]; everything from 0 up to the first threshold falls
+# into PM_BREAKPOINTS[0]. Each entry is (aqi_hi, aqi_low, pm25_hi, pm25_low).
+PM_THRESHOLDS = [12.1, 35.5, 55.5, 150.5, 250.5, 350.5]
+PM_BREAKPOINTS = [
+    (50, 0, 12, 0),
+    (100, 51, 35.4, 12.1),
+    (150, 101, 55.4, 35.5),
+    (200, 151, 150.4, 55.5),
+    (300, 201, 250.4, 150.5),
+    (400, 301, 350.4, 250.5),
+    (500, 401, 500, 350.5),
+]
+
 
 def RGBStringToList(rgb_string):
   """Convert string "rgb(red,green,blue)" into a list of ints.
@@ -43,15 +79,7 @@ class AqiAndColor():
       Returns:
         Array of [r, g, b]
     """
-    rgb_breaks = [
-        (0, [0, 228, 0]),  # 0-50
-        (51, [255, 255, 0]),  # 51-100
-        (101, [255, 126, 0]),  # 101-150
-        (151, [255, 0, 0]),  # 151-200
-        (201, [153, 0, 76]),  # 201-300
-        (301, [126, 0, 35]),  # 301+
-    ]
-
+    rgb_breaks = RGB_BREAKS
     if aqi < 0:
       return [200, 200, 200]
     if aqi >= 301:
@@ -63,6 +91,29 @@ class AqiAndColor():
             (aqi - rgb_breaks[b-1][0]) / (rgb_breaks[b][0] - 1 - rgb_breaks[b-1][0]))
         return color
 
+  def getAQIColorTable(self):
+    """Build a table of colors for every AQI from MIN_AQI to MAX_AQI.
+
+    AQI is an integer, so rather than interpolating each time, do it once
+    up front. Index the table with colorTableIndex(aqi).
+
+    Returns:
+      array('I') of 24 bit #RRGGBB values.
+    """
+    table = array('I')
+    for aqi in range(MIN_AQI, MAX_AQI + 1):
+      r, g, b = self.getAQIColorRGB(aqi)
+      table.append((r << 16) | (g << 8) | b)
+    return table
+
+  def colorTableIndex(self, aqi):
+    """Get the index into the getAQIColorTable table for an AQI value."""
+    if aqi > MAX_AQI:
+      aqi = MAX_AQI
+    elif aqi < MIN_AQI:
+      aqi = MIN_AQI
+    return aqi - MIN_AQI
+
   def _calcAQI(self, pm25, aqi_hi, aqi_low, pm25_hi, pm25_low):
     """Calculate AQI from PM2.5
 
@@ -119,3 +170,74 @@ class AqiAndColor():
     else:
       print('WARNING: UNDEFINED PM: %s' % pm, file=sys.stderr)
       return -1
+
+  def aqiFromPMArray(self, pm):
+    """Vectorized aqiFromPM for a whole array of PM values.
+
+    Uses the PM_BREAKPOINTS table rather than the if-chain, but does the
+    arithmetic in the same order so that results match aqiFromPM exactly.
+    Requires numpy.
+
+    Args:
+      pm: Array-like of PM values.
+    Returns:
+      numpy integer array of AQI values; -1 where PM is negative (or NaN).
+    Raises:
+      ImportError: numpy isn't installed.
+    """
+    if numpy is None:
+      raise ImportError('aqiFromPMArray requires numpy')
+    pm = numpy.asarray(pm, dtype=float)
+    invalid = ~(pm >= 0)
+    if invalid.any():
+      print('WARNING: %d PM values less than zero or undefined' %
+            numpy.count_nonzero(invalid), file=sys.stderr)
+    index = numpy.searchsorted(PM_THRESHOLDS, pm, side='left')
+    table = numpy.array(PM_BREAKPOINTS, dtype=float)
+    aqi_hi, aqi_low, pm25_hi, pm25_low = table[index].T
+    aqi = (aqi_hi - aqi_low) / (pm25_hi - pm25_low) * (pm - pm25_low) + aqi_low
+    with numpy.errstate(invalid='ignore'):
+      aqi = numpy.rint(aqi)
+    aqi[invalid] = -1
+    return aqi.astype(int)
+
+  def getAQIColorRGBArray(self, aqi):
+    """Vectorized getAQIColorRGB for a whole array of integer AQI values.
+
+    Requires numpy.
+
+    Args:
+      aqi: Array-like of integer AQI values.
+    Returns:
+      numpy integer array of shape (len(aqi), 3) holding [r, g, b] rows.
+    Raises:
+      ImportError: numpy isn't installed.
+    """
+    if numpy is None:
+      raise ImportError('getAQIColorRGBArray requires numpy')
+    aqi = numpy.asarray(aqi)
+    breaks = numpy.array([b[0] for b in RGB_BREAKS])
+    colors = numpy.array([b[1] for b in RGB_BREAKS])
+    # First break with aqi+1 <= break, clipped so out of range values
+    # still index; those are overwritten below.
+    index = numpy.clip(
+        numpy.searchsorted(breaks, aqi + 1, side='left'), 1, len(breaks) - 1)
+    low = breaks[index - 1]
+    weight = (aqi - low) / (breaks[index] - 1 - low)
+    color1 = colors[index - 1]
+    color2 = colors[index]
+    rgb = numpy.rint(color1 + weight[:, None] * (color2 - color1)).astype(int)
+    rgb[aqi >= 301] = RGB_BREAKS[-1][1]
+    rgb[aqi < 0] = [200, 200, 200]
+    return rgb
+
+  def aqiAndColorFromPMArray(self, pm):
+    """Get AQI and [r, g, b] arrays for an array of PM values in one call.
+
+    Args:
+      pm: Array-like of PM values.
+    Returns:
+      (aqi, rgb) as returned by aqiFromPMArray and getAQIColorRGBArray.
+    """
+    aqi = self.aqiFromPMArray(pm)
+    return aqi, self.getAQIColorRGBArray(aqi)
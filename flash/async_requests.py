@@ -0,0 +1,185 @@
+"""Minimal HTTP client for (u)asyncio.
+
+nurequests blocks until the whole response is in; this does the same job
+with asyncio streams, so other tasks (buttons, animations) keep running
+while we wait on the network. Works with uasyncio on the device and asyncio
+on a PC. HTTPS needs an (u)asyncio whose open_connection takes ssl.
+
+Session works like nurequests.Session: Connections are kept open between
+requests (HTTP/1.1 keep-alive), addresses come from nurequests' DNS cache,
+and with conditional=True a resource that hasn't changed comes back as a
+304 with no body. Redirects aren't followed.
+"""
+try:
+  import uasyncio as asyncio
+except ImportError:
+  import asyncio
+
+import nurequests
+from nurequests import _parse_url
+
+TIMEOUT_MS = 10000
+
+
+async def _read_body(reader, headers):
+  if b'chunked' in headers.get(b'transfer-encoding', b''):
+    body = bytearray()
+    while True:
+      size = int((await reader.readline()).split(b';', 1)[0], 16)
+      if not size:
+        break
+      body.extend(await reader.readexactly(size))
+      await reader.readline()  # CRLF after the chunk data.
+    # Skip any trailers.
+    while True:
+      line = await reader.readline()
+      if not line or line == b'\r\n':
+        break
+    return bytes(body)
+  if b'content-length' in headers:
+    return await reader.readexactly(int(headers[b'content-length']))
+  body = bytearray()
+  while True:
+    data = await reader.read(512)
+    if not data:
+      return bytes(body)
+    body.extend(data)
+
+
+async def _connect(proto, host, port):
+  """Open a connection, looking the host up in nurequests' DNS cache."""
+  address = nurequests._resolve(host, port)[-1]
+  try:
+    if proto == 'https:':
+      return await asyncio.open_connection(
+          address[0], address[1], ssl=True, server_hostname=host)
+    return await asyncio.open_connection(address[0], address[1])
+  except OSError:
+    nurequests.forget_host(host, port)
+    raise
+
+
+async def _send(reader, writer, method, host, path, headers):
+  """Send the request and read the status and headers."""
+  request = ('%s /%s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\n' %
+             (method, path, host))
+  for k in headers:
+    value = headers[k]
+    if isinstance(value, bytes):
+      value = value.decode()
+    request += '%s: %s\r\n' % (k, value)
+  writer.write((request + '\r\n').encode())
+  await writer.drain()
+
+  line = await reader.readline()
+  if not line:
+    raise OSError('connection closed')
+  l_split = line.split(None, 2)
+  try:
+    status = int(l_split[1])
+  except IndexError:
+    raise ValueError('bad status line: %r' % line)
+  response_headers = {}
+  while True:
+    line = await reader.readline()
+    if not line:
+      raise OSError('connection closed in headers')
+    if line == b'\r\n':
+      break
+    k, v = line.split(b':', 1)
+    response_headers[k.strip().lower()] = v.strip()
+  return status, response_headers
+
+
+class Session(nurequests.Session):
+  """nurequests.Session, for (u)asyncio.
+
+  The kept connections are (reader, writer) pairs. As they belong to the
+  event loop they were made in, use a Session within one loop.
+  """
+
+  def close(self):
+    for key in self._sockets:
+      self._sockets[key][1].close()
+    self._sockets = {}
+
+  async def request(self, method, url, headers={}, conditional=False,
+                    timeout_ms=TIMEOUT_MS):
+    """Make a HTTP request.
+
+    Args:
+      method: 'GET', 'HEAD', ...
+      url: Full URL.
+      headers: dict of extra headers to send.
+      conditional: Send the validators from the last 200 for url.
+      timeout_ms: Give up (asyncio's TimeoutError) after this long.
+    Returns:
+      (status code, body as bytes). A 304 has an empty body.
+    Raises:
+      OSError: Connection problems.
+      ValueError: The server's response didn't make sense.
+    """
+    return await asyncio.wait_for(
+        self._request(method, url, headers, conditional), timeout_ms / 1000)
+
+  async def _request(self, method, url, headers, conditional):
+    if conditional:
+      headers = self._conditional_headers(url, headers)
+    proto, host, port, path = _parse_url(url)
+    key = (proto, host, port)
+    stream = self._sockets.pop(key, None)
+    if stream is not None:
+      try:
+        status, response_headers = await _send(
+            stream[0], stream[1], method, host, path, headers)
+      except (OSError, ValueError, EOFError):
+        # Stale keep-alive connection: Start over.
+        stream[1].close()
+        stream = None
+    try:
+      if stream is None:
+        stream = await _connect(proto, host, port)
+        status, response_headers = await _send(
+            stream[0], stream[1], method, host, path, headers)
+      # Without a length or chunks, the body ends when the server hangs up.
+      until_closed = False
+      if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+        body = b''
+      else:
+        until_closed = (
+            b'content-length' not in response_headers and
+            b'chunked' not in response_headers.get(b'transfer-encoding', b''))
+        body = await _read_body(stream[0], response_headers)
+    except:
+      # Including being cancelled by wait_for: Half a response is useless.
+      if stream is not None:
+        stream[1].close()
+      raise
+
+    if conditional and status == 200:
+      self._remember_validators(url, response_headers)
+    if (until_closed or
+        response_headers.get(b'connection', b'').lower() == b'close'):
+      stream[1].close()
+    else:
+      self._sockets[key] = stream
+    return status, body
+
+  async def get(self, url, **kw):
+    return await self.request('GET', url, **kw)
+
+
+async def request(method, url, headers={}, timeout_ms=TIMEOUT_MS):
+  """Make a single HTTP request, on a connection of its own.
+
+  Args and return value as for Session.request.
+  """
+  session = Session()
+  try:
+    return await session.request(method, url, headers, timeout_ms=timeout_ms)
+  finally:
+    session.close()
+
+
+async def get(url, **kw):
+  return await request('GET', url, **kw)
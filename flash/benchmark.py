@@ -0,0 +1,243 @@
+"""Benchmarks for the work done on every poll.
+
+Times the AQI math, the interfaces' dict_to_data, every correction, parsing
+the sensor's JSON in AQI.GetData, and the HTTP clients against a loopback
+server (purpleair_server). Run it on a PC, from the flash directory:
+
+  python benchmark.py -o before.json
+  ... change things ...
+  python benchmark.py -c before.json
+
+Each benchmark is run in batches long enough to time reliably, several
+times over, and the fastest batch is reported (as time per call): It is the
+one least disturbed by everything else the machine was doing, so it is the
+most repeatable number. With -c, each result is compared with the same
+benchmark in an earlier run, and anything more than --threshold slower is
+flagged. Results are only comparable from the same machine and Python.
+
+On a PC, nurequests runs on usocket_shim (CPython's socket with
+MicroPython's stream methods), so the numbers are for the client's own
+work: Parsing headers, chunked decoding, keep-alive.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import re
+import subprocess
+import sys
+import time
+
+import aqi
+import aqi_and_color
+import async_requests
+import headless
+import history
+import nurequests
+from apps import LocalAQI
+from apps import MultiWebAQI
+from apps import WebAQI
+import nowcast
+import purpleair_server
+from purpleair_server import LOCAL_RESPONSE
+from purpleair_server import MULTI_WEB_RESPONSE
+from purpleair_server import WEB_FIELDS_RESPONSE
+from purpleair_server import WEB_RESPONSE
+
+# Time batches of calls until a batch takes at least this long.
+MIN_BATCH_S = 0.05
+REPEAT = 5
+# With --compare, flag anything more than this much slower.
+THRESHOLD = 1.10
+
+
+def Time(function, per_call=1):
+  """Time function.
+
+  Args:
+    function: Does the work; no arguments.
+    per_call: How many operations one call of function does.
+  Returns:
+    (fastest, median) seconds per operation.
+  """
+  loops = 1
+  while True:
+    start = time.perf_counter()
+    for unused in range(loops):
+      function()
+    elapsed = time.perf_counter() - start
+    if elapsed >= MIN_BATCH_S:
+      break
+    loops *= 2 if elapsed < MIN_BATCH_S / 10 else 4
+  times = [elapsed]
+  for unused in range(REPEAT - 1):
+    start = time.perf_counter()
+    for unused in range(loops):
+      function()
+    times.append(time.perf_counter() - start)
+  times.sort()
+  ops = loops * per_call
+  return times[0] / ops, times[len(times) // 2] / ops
+
+
+def _Interface(interface, response):
+  interface.dict_to_data(response)
+  return interface
+
+
+def _GetData(interface, response, streaming):
+  """GetData of response from a headless Hardware, with STREAM_JSON set."""
+  my_aqi = aqi.AQI(interface)
+  my_aqi.hw = headless.Hardware(json.dumps(response))
+  my_aqi.url = 'http://sensor/json'
+
+  def GetData():
+    stream_json = aqi.STREAM_JSON
+    aqi.STREAM_JSON = streaming
+    try:
+      return my_aqi.GetData()
+    finally:
+      aqi.STREAM_JSON = stream_json
+  return GetData
+
+
+def Benchmarks(url=None):
+  """All the benchmarks.
+
+  Args:
+    url: Server for the HTTP client benchmarks. Default: Start one.
+  Returns:
+    List of (name, function, operations per call) tuples.
+  """
+  color = aqi_and_color.AqiAndColor()
+  pms = (0.5, 8.0, 20.0, 40.0, 100.0, 200.0, 400.0)
+  aqis = (0, 25, 75, 125, 175, 250, 400)
+  rgbs = (LOCAL_RESPONSE['p25aqic'], LOCAL_RESPONSE['p25aqic_b'])
+  benchmarks = [
+      ('aqiFromPM', lambda: [color.aqiFromPM(pm) for pm in pms], len(pms)),
+      ('getAQIColorRGB',
+       lambda: [color.getAQIColorRGB(a) for a in aqis], len(aqis)),
+      ('RGBStringToList',
+       lambda: [aqi_and_color.RGBStringToList(s) for s in rgbs], len(rgbs)),
+      ('PurpleLocal.dict_to_data',
+       lambda: LocalAQI.PurpleLocal().dict_to_data(LOCAL_RESPONSE), 1),
+      ('PurpleWeb.dict_to_data',
+       lambda: WebAQI.PurpleWeb().dict_to_data(WEB_RESPONSE), 1),
+      ('PurpleWeb.dict_to_data fields',
+       lambda: WebAQI.PurpleWeb().dict_to_data(WEB_FIELDS_RESPONSE), 1),
+      ('PurpleMultiWeb.dict_to_data',
+       lambda: MultiWebAQI.PurpleMultiWeb().dict_to_data(MULTI_WEB_RESPONSE),
+       1),
+  ]
+
+  readings = history.History()
+  benchmarks.append((
+      'History.Add',
+      lambda: readings.Add(readings.count * history.RESOLUTION_MS, 12.3, 14.5,
+                           40.0), 1))
+  benchmarks.append((
+      'History.Average', lambda: readings.Average(history.DAY_MS), 1))
+  engine = nowcast.NowCast()
+  ticks = [0]
+
+  def NowCastAdd():
+    ticks[0] += 60 * 1000
+    engine.Add(ticks[0], 12.3 + ticks[0] % 7)
+    return engine.Value()
+
+  benchmarks.append(('NowCast.Add+Value', NowCastAdd, 1))
+
+  hw = headless.Hardware()
+  local = _Interface(LocalAQI.PurpleLocal(), LOCAL_RESPONSE)
+  multi = _Interface(MultiWebAQI.PurpleMultiWeb(), MULTI_WEB_RESPONSE)
+  for index, correction in enumerate(aqi.Correction(hw, local, 0).corrections):
+    for interface in (local, multi):
+      corrections = aqi.Correction(hw, interface, index)
+      if corrections.correction_index != index:
+        continue  # Not for this interface: 'raw' with MultiWebAQI.
+      benchmarks.append((
+          'GetAqiAndColor %s %s' % (correction['name'],
+                                    type(interface).__name__),
+          corrections.GetAqiAndColor, 1))
+
+  for streaming in (True, False):
+    how = 'json_fields' if streaming else 'json.loads'
+    benchmarks.append((
+        'GetData PurpleLocal %s' % how,
+        _GetData(LocalAQI.PurpleLocal(), LOCAL_RESPONSE, streaming), 1))
+    benchmarks.append((
+        'GetData PurpleWeb %s' % how,
+        _GetData(WebAQI.PurpleWeb(), WEB_RESPONSE, streaming), 1))
+
+  url = url or purpleair_server.Start().url + '/json?live=false'
+  benchmarks.append((
+      'async_requests.get',
+      lambda: asyncio.run(async_requests.get(url)), 1))
+  session = nurequests.Session()
+  benchmarks.append((
+      'nurequests.get', lambda: nurequests.get(url).content, 1))
+  benchmarks.append((
+      'nurequests.Session.get keep-alive',
+      lambda: session.get(url).content, 1))
+  benchmarks.append((
+      'nurequests.Session.get iter_content',
+      lambda: b''.join(session.get(url).iter_content(256)), 1))
+  return benchmarks
+
+
+def _Commit():
+  try:
+    return subprocess.check_output(
+        ['git', 'describe', '--always', '--dirty'],
+        stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('-o', '--output', help='Save results to this file.')
+  parser.add_argument('-c', '--compare', help='Compare with saved results.')
+  parser.add_argument('-k', '--filter', help='Only run benchmarks matching.')
+  parser.add_argument('--url', help='Server for the HTTP benchmarks.')
+  parser.add_argument('--threshold', type=float, default=THRESHOLD)
+  args = parser.parse_args(argv)
+
+  baseline = {}
+  if args.compare:
+    with open(args.compare) as f:
+      saved = json.load(f)
+    baseline = saved['results']
+    print('Comparing with %s (%s)' % (args.compare, saved.get('commit')))
+  results = {}
+  slower = []
+  for name, function, per_call in Benchmarks(args.url):
+    if args.filter and not re.search(args.filter, name):
+      continue
+    fastest, median = Time(function, per_call)
+    results[name] = {'fastest_us': fastest * 1e6, 'median_us': median * 1e6}
+    line = '%-45s %10.2f us %10.2f us' % (name, fastest * 1e6, median * 1e6)
+    if name in baseline:
+      ratio = fastest * 1e6 / baseline[name]['fastest_us']
+      line += '  x%.2f' % ratio
+      if ratio > args.threshold:
+        line += ' SLOWER'
+        slower.append(name)
+    print(line)
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump({
+          'commit': _Commit(),
+          'python': '%s %s' % (platform.python_implementation(),
+                               platform.python_version()),
+          'machine': platform.machine(),
+          'results': results,
+      }, f, indent=1, sort_keys=True)
+  if slower:
+    print('%d slower than %s' % (len(slower), args.compare))
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
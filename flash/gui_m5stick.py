@@ -1,8 +1,11 @@
+import async_requests
+import collections
 import math
 import sys
 import time
 import traceback
 import pygame
+import renderer
 import requests as urequests
 
 MAX_X = 160
@@ -10,6 +13,16 @@ MAX_Y = 80
 CHASE_INCR = 8  # Must be evenly divisible.
 CHASE_WIDTH = 4
 
+FONT_FAMILY = 'DejaVu Sans Mono'
+FONTS = {
+    'big': 72,
+    'medium': 40,
+    'small': 24,
+    'error': 18,
+}
+# How many rendered strings to keep.
+TEXT_CACHE_SIZE = 64
+
 RED = (255, 0, 0)
 GREEN = (0, 255, 0)
 BLUE = (0, 0, 255)
@@ -31,6 +44,54 @@ class HTTPGetFailedError(Error):
   """HTTP GET failed."""
 
 
+class TextCache():
+  """Fonts, and recently rendered text.
+
+  pygame.font.SysFont looks the font up every time, and the same few
+  strings (AQI values, correction symbols) get rendered over and over, so
+  keep both. Rendered text is kept in least recently used order, up to
+  size entries.
+  """
+
+  def __init__(self, size=TEXT_CACHE_SIZE):
+    self.size = size
+    self.fonts = {}  # (family, size): Font
+    self.surfaces = collections.OrderedDict()  # (text, color, family, size)
+    self.hits = 0
+    self.misses = 0
+
+  def Font(self, family, size):
+    key = (family, size)
+    font = self.fonts.get(key)
+    if font is None:
+      font = self.fonts[key] = pygame.font.SysFont(family, size, False, False)
+    return font
+
+  def Render(self, family, size, text, color):
+    """Render text in color, or get it from the cache."""
+    key = (text, tuple(color), family, size)
+    surface = self.surfaces.get(key)
+    if surface is not None:
+      self.hits += 1
+      self.surfaces.move_to_end(key)
+      return surface
+    self.misses += 1
+    surface = self.Font(family, size).render(text, True, color)
+    self.surfaces[key] = surface
+    if len(self.surfaces) > self.size:
+      self.surfaces.popitem(last=False)
+    return surface
+
+  def Stats(self):
+    """Diagnostics, as a dict."""
+    return {
+        'fonts': len(self.fonts),
+        'surfaces': len(self.surfaces),
+        'hits': self.hits,
+        'misses': self.misses,
+    }
+
+
 class Hardware():
   """Base class for the M5StickC hardware.
 
@@ -47,27 +108,98 @@ class Hardware():
     self.chase_index = 0
     self.old_chase = []
     self.new_chase = []
+    # url: (ETag, Last-Modified) from the last 200 response.
+    self.validators = {}
+    # GetURIAsync keeps its own connections and validators.
+    self.async_session = async_requests.Session()
+    self.renderer = renderer.Renderer(self)
+    self.text_cache = TextCache()
+    # Drawing inside BeginFrame/EndFrame is only shown at the end, in one go.
+    self.frame_depth = 0
+    self.dirty = []  # Areas drawn on but not yet shown.
     self.ResetScreen()
 
-  def Arc(self, x, y, r, unused_thick, start, end, color, fillcolor=None):
+  def BeginFrame(self):
+    """Hold drawing back until the matching EndFrame. Frames can nest."""
+    self.frame_depth += 1
+
+  def EndFrame(self):
+    """Show everything drawn since the outermost BeginFrame."""
+    self.frame_depth -= 1
+    if not self.frame_depth:
+      self._Present()
+
+  def _Update(self, rect=None):
+    """Area rect (None: the whole screen) was drawn on: Show it.
+
+    In a frame, this waits until the end of the frame.
+    """
+    self.dirty.append(pygame.Rect(rect or [0, 0, MAX_X, MAX_Y]))
+    if not self.frame_depth:
+      self._Present()
+
+  def _Present(self):
+    if self.dirty:
+      pygame.display.update(self.dirty)
+      self.dirty = []
+
+  def Arc(self, x, y, r, thick, start, end, color, fillcolor=None):
+    self._Arc(x, y, r, thick, start, end, color, fillcolor)
+    self.renderer.Damage(x - r, y - r, 2 * r, 2 * r)
+    self._Update([x - r, y - r, 2 * r, 2 * r])
+
+  def Rect(self, x, y, width, height, color, fillcolor=None):
+    self._Rect(x, y, width, height, color, fillcolor)
+    self.renderer.Damage(x, y, width, height)
+    self._Update([x, y, width, height])
+
+  def Triangle(self, x, y, x1, y1, x2, y2, color, fillcolor=None):
+    self._Triangle(x, y, x1, y1, x2, y2, color, fillcolor)
+    left = min(x, x1, x2)
+    top = min(y, y1, y2)
+    rect = [left, top, max(x, x1, x2) - left + 1, max(y, y1, y2) - top + 1]
+    self.renderer.Damage(*rect)
+    self._Update(rect)
+
+  # Drawing that doesn't damage the renderer's text (the heart and chaser
+  # look after themselves).
+
+  def _Arc(self, x, y, r, unused_thick, start, end, color, fillcolor=None):
     pygame.draw.arc(self.screen, color, [x-r, y-r, 2*r, 2*r],
                     math.radians(end-90), math.radians(start-90), r)
-    pygame.display.flip()
 
-  def Rect(self, x, y, width, height, color, fillcolor=None):
+  def _Rect(self, x, y, width, height, color, fillcolor=None):
     """Don't know what to do with fillcolor. width=0==fill"""
     pygame.draw.rect(self.screen, color, [x, y, width, height], 1)
     if fillcolor:
       pygame.draw.rect(self.screen, fillcolor, [x+1, y+1, width-2, height-2])
-    pygame.display.flip()
 
-  def Triangle(self, x, y, x1, y1, x2, y2, color, fillcolor=None):
+  def _Triangle(self, x, y, x1, y1, x2, y2, color, fillcolor=None):
     pygame.draw.polygon(self.screen, color, [[x, y], [x1, y1], [x2, y2]])
-    pygame.display.flip()
+
+  # Primitives for renderer.Renderer.
+
+
+  def FillScreen(self, color):
+    self.screen.fill(color)
+    self._Update()
+
+  def FillRect(self, x, y, width, height, color):
+    self._Update(pygame.draw.rect(self.screen, color, [x, y, width, height]))
+
+  def DrawText(self, font, text, x, y, color):
+    self._Update(
+        self.screen.blit(
+            self.text_cache.Render(FONT_FAMILY, FONTS[font], text, color),
+            [x, y]))
+
+  def TextSize(self, font, text):
+    return self.text_cache.Font(FONT_FAMILY, FONTS[font]).size(text)
 
 
   def WaitMS(self, ms):
     """Wait for ms milliseconds."""
+    self._Present()
     time.sleep(ms / 1000)
 
   def ColorListToNative(self, color_list):
@@ -81,18 +213,54 @@ class Hardware():
     """
     return color_list
 
+  def ColorTableToNative(self, color_table):
+    """Convert a table of #RRGGBB integers to HW's native format.
+
+    Args:
+      color_table: Sequence of 24 bit #RRGGBB integers.
+
+    Returns:
+      list of [r, g, b] lists, in the same order.
+    """
+    return [[(c >> 16) & 0xff, (c >> 8) & 0xff, c & 0xff] for c in color_table]
+
+  def TicksMS(self):
+    """Milliseconds since some arbitrary point. Doesn't go backwards."""
+    return int(time.monotonic() * 1000)
+
+  def _EventToButton(self, event):
+    """Turn a pygame event into a button (or quit)."""
+    if event.type == pygame.QUIT:
+      sys.exit()
+    if event.type == pygame.KEYDOWN:
+      if event.unicode.lower() == 'a':
+        return BUTTONA
+      elif event.unicode.lower() == 'b':
+        return BUTTONB
+      elif event.unicode.lower() == 'q':
+        sys.exit()
+    return None
+
+  def WaitForButton(self, ms):
+    """Wait up to ms milliseconds for a button to be pressed.
+
+    Returns:
+      The button pressed, or None if none was.
+    """
+    self._Present()  # Anything drawn so far should be seen while we wait.
+    end = self.TicksMS() + ms
+    while True:
+      left = end - self.TicksMS()
+      if left <= 0:
+        return None
+      button = self._EventToButton(pygame.event.wait(left))
+      if button:
+        return button
+
   def CheckForButton(self):
     button = None
     for event in pygame.event.get():
-      if event.type == pygame.QUIT:
-        sys.exit()
-      if event.type == pygame.KEYDOWN:
-        if event.unicode.lower() == 'a':
-          button = BUTTONA
-        elif event.unicode.lower() == 'b':
-          button = BUTTONB
-        elif event.unicode.lower() == 'q':
-          sys.exit()
+      button = self._EventToButton(event) or button
     return button
 
   def print_exception(self, e):
@@ -123,7 +291,8 @@ class Hardware():
   def ResetScreen(self):
     """Reset the screen to black and to right side up."""
     self.screen.fill(BLACK)
-    pygame.display.flip()
+    self.renderer.Invalidate()
+    self._Update()
 
   def Chase(self, color=WHITE, bg_color=BLACK):
     """Draw a chase around the border to show life.
@@ -146,10 +315,14 @@ class Hardware():
     else:
       self.new_chase = [self.chase_index, 0,
                CHASE_INCR, CHASE_WIDTH, color]
+    self.BeginFrame()
     if self.old_chase:
       self.old_chase[-1] = bg_color
-      self.Rect(*self.old_chase)
-    self.Rect(*self.new_chase)
+      self._Rect(*self.old_chase)
+      self._Update(self.old_chase[:4])
+    self._Rect(*self.new_chase)
+    self._Update(self.new_chase[:4])
+    self.EndFrame()
     self.chase_index = new_index
     self.old_chase = self.new_chase
 
@@ -162,9 +335,10 @@ class Hardware():
       lcd.arc(x, y, r, thick, start, end, color, fillcolor)
       lcd.triangle(x, y, x1, y1, x2, y2, color, fillcolor)
     """
-    self.Triangle(140, 9, 148, 21, 157, 9, color, color)
-    self.Arc(144, 9, 5, 5, 270, 90, color, color)
-    self.Arc(153, 9, 5, 5, 270, 90, color, color)
+    self._Triangle(140, 9, 148, 21, 157, 9, color, color)
+    self._Arc(144, 9, 5, 5, 270, 90, color, color)
+    self._Arc(153, 9, 5, 5, 270, 90, color, color)
+    self._Update([139, 4, 19, 18])
 
   def ShowError(self, error):
     """Show an error message against a red background.
@@ -172,39 +346,35 @@ class Hardware():
     Font is relatively small so you can see more.
     Also good for debugging.
     """
-    font = pygame.font.SysFont('DejaVu Sans Mono', 18, False, False)
-    text = font.render('%s' % error, True, WHITE)
+    text = self.text_cache.Render(
+        FONT_FAMILY, FONTS['error'], '%s' % error, WHITE)
     self.screen.fill(RED)
+    self.renderer.Invalidate()
     self.screen.blit(text, [10, 10])
-    pygame.display.flip()
+    self._Update()
 
   def ClearSmallRight(self, bg_color):
-    font = pygame.font.SysFont('DejaVu Sans Mono', 24, False, False)
-    text_size = font.size('E')
-    pygame.draw.rect(self.screen, bg_color, [140, 30, *text_size])
-    pygame.display.flip()
+    self.BeginFrame()
+    self.renderer.Text('small', 140, 30, 'small', bg_color, None, '')
+    self.EndFrame()
 
   def DisplaySmallRight(self, bg_color, text_color, text_string):
     """Display small text on the right."""
-    self.ClearSmallRight(bg_color)
-    font = pygame.font.SysFont('DejaVu Sans Mono', 24, False, False)
-    text = font.render('%s' % text_string, True, text_color)
-    self.screen.blit(text, [140, 30])
-    pygame.display.flip()
+    self.BeginFrame()
+    self.renderer.Text(
+        'small', 140, 30, 'small', bg_color, text_color, text_string)
+    self.EndFrame()
 
   def DisplayBig(self, bg_color, text_color, text):
     """Display text using the biggest font possible.
 
-    Not much fits at this size: Really just 3 characters.
+    Not much fits at this size: Really just 3 characters. Only the parts
+    that changed are redrawn.
     """
-    if type(text) == int:
-      font = pygame.font.SysFont('DejaVu Sans Mono', 72, False, False)
-    else:
-      font = pygame.font.SysFont('DejaVu Sans Mono', 40, False, False)
-    text = font.render('%s' % text, True, text_color)
-    self.screen.fill(bg_color)
-    self.screen.blit(text, [5, 5])
-    pygame.display.flip()
+    font = 'big' if type(text) == int else 'medium'
+    self.BeginFrame()
+    self.renderer.Text('big', 5, 5, font, bg_color, text_color, text)
+    self.EndFrame()
 
   def _GetDefaults(self):
     pass
@@ -212,6 +382,36 @@ class Hardware():
   def CheckWifi(self):
     pass
 
+  def _Request(self, url, stream=False):
+    """Make the GET request for GetURI & GetURIChunks.
+
+    Returns:
+      The response, or None if the server says nothing has changed (304).
+
+    Raises:
+      HTTPRequestFailedError: If HTTP request fails.
+      HTTPGetFailedError: If HTTP GET returns something other than 200.
+    """
+    headers = {}
+    etag, last_modified = self.validators.get(url, (None, None))
+    if etag:
+      headers['If-None-Match'] = etag
+    if last_modified:
+      headers['If-Modified-Since'] = last_modified
+    try:
+      resp = urequests.request(
+          method='GET', url=url, headers=headers, stream=stream)
+    except OSError as ose:
+      raise HTTPRequestFailedError('_GetURI request: {}'.format(ose))
+    if resp.status_code == 304:
+      resp.close()
+      return None
+    if resp.status_code != 200:
+      raise HTTPGetFailedError('Status code={}'.format(resp.status_code))
+    self.validators[url] = (
+        resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+    return resp
+
   def GetURI(self, url):
     """Get data from the given URI.
 
@@ -220,18 +420,65 @@ class Hardware():
     Args:
       url: Full URL to fetch.
 
+    Returns:
+      The body as text, or None if it hasn't changed since the last call.
+
     Raises:
       HTTPRequestFailedError: If HTTP request fails.
       HTTPGetFailedError: If HTTP GET returns something other than 200.
     """
+    resp = self._Request(url)
+    if resp is None:
+      return None
     try:
-      resp = urequests.request(method='GET', url=url)
+      return resp.text
     except OSError as ose:
-      raise HTTPRequestFailedError('_GetURI request: {}'.format(ose))
-    if resp.status_code != 200:
-      raise HTTPGetFailedError('Status code={}'.format(resp.status_code))
+      raise HTTPRequestFailedError('_GetURI resp.text: {}'.format(ose))
+
+  def GetURIChunks(self, url, chunk_size=256):
+    """Get data from the given URI a piece at a time.
 
+    Returns:
+      Iterator over the body, or None if it hasn't changed since the last call.
+
+    Raises:
+      HTTPRequestFailedError: If HTTP request fails (possibly while iterating).
+      HTTPGetFailedError: If HTTP GET returns something other than 200.
+    """
+    resp = self._Request(url, stream=True)
+    if resp is None:
+      return None
+    return self._Chunks(resp, chunk_size)
+
+  def _Chunks(self, resp, chunk_size):
     try:
-      return resp.text
+      for chunk in resp.iter_content(chunk_size):
+        yield chunk
     except OSError as ose:
-      raise HTTPRequestFailedError('_GetURI resp.text: {}'.format(ose))
+      raise HTTPRequestFailedError('_GetURI resp chunks: {}'.format(ose))
+    finally:
+      resp.close()
+
+  async def GetURIAsync(self, url):
+    """Get data from the given URI without blocking other tasks.
+
+    Args:
+      url: Full URL to fetch.
+
+    Returns:
+      The body as text, or None if it hasn't changed since the last call.
+
+    Raises:
+      HTTPRequestFailedError: If HTTP request fails or times out.
+      HTTPGetFailedError: If HTTP GET returns something other than 200.
+    """
+    try:
+      status, body = await self.async_session.get(url, conditional=True)
+    except (OSError, ValueError, EOFError,
+            async_requests.asyncio.TimeoutError) as err:
+      raise HTTPRequestFailedError('_GetURIAsync request: {}'.format(err))
+    if status == 304:
+      return None
+    if status != 200:
+      raise HTTPGetFailedError('Status code={}'.format(status))
+    return str(body, 'utf-8')
@@ -0,0 +1,275 @@
+"""Hardware abstraction that draws nothing, for testing and profiling.
+
+Same interface as m5stickc and gui_m5stick, but instead of drawing it
+records what would have been drawn, and instead of going to the network
+it asks a "source" for the data. No display, pygame or network needed, so
+aqi.AQI can be run in CI, or under a profiler, without GUI overhead:
+
+  def source(url):
+    return '{"pm2_5_atm": 12.0, ...}'
+
+  aqi.SetHardware(headless)
+  my_aqi = aqi.AQI(interface, hw=headless.Hardware(source, stop_ms=60000))
+  try:
+    my_aqi.Run()
+  except headless.Stop:
+    pass
+  print(my_aqi.hw.counts)
+
+With virtual_clock=True, time only passes when the program waits, and then
+instantly: A week of AQI.Run takes seconds. Button presses can be scheduled
+for a given time with PressButton, and the source can be a list of
+(time_ms, response) pairs to replay the sensor changing over time:
+
+  hw = headless.Hardware(
+      [(0, low_json), (3600000, high_json), (7200000, OSError('down'))],
+      stop_ms=7 * 24 * 3600 * 1000, virtual_clock=True)
+  hw.PressButton(headless.BUTTONB, at_ms=60000)
+
+Only Run uses the virtual clock: RunAsync's (u)asyncio sleeps are real.
+
+Colors are #RRGGBB integers, like on the device, and anything else (e.g.
+None) raises TypeError, as drawing on the device would.
+"""
+import bisect
+import collections
+import heapq
+import json
+import sys
+import time
+import traceback
+
+MAX_X = 160
+MAX_Y = 80
+
+RED = 0xff0000
+GREEN = 0x00ff00
+BLUE = 0x0000ff
+WHITE = 0xffffff
+BLACK = 0x000000
+
+BUTTONA = 1
+BUTTONB = 2
+
+# Keep this many of the most recent draw commands.
+LOG_SIZE = 1000
+
+
+class Error(Exception):
+  """Base error class."""
+
+
+class HTTPRequestFailedError(Error):
+  """HTTP request failed."""
+
+
+class HTTPGetFailedError(Error):
+  """HTTP GET failed."""
+
+
+class Stop(Exception):
+  """The run is over (see Hardware's stop_ms).
+
+  Not an Error, so that nothing in aqi catches it.
+  """
+
+
+class Hardware():
+  """Records drawing, and gets data from a source instead of the network."""
+
+  def __init__(self, source=None, stop_ms=None, virtual_clock=False):
+    """Set up the fake hardware.
+
+    Args:
+      source: Where GetURI gets the data: A function taking the URL and
+          returning a response, or a list of (time_ms, response) pairs, in
+          time order, each in effect from time_ms on. Or a response, which is
+          used for every request. A response is the body (str or dict), None
+          for "not changed" (304), or an exception to raise (OSError,
+          HTTPRequestFailedError or HTTPGetFailedError).
+      stop_ms: Raise Stop when waiting after this many milliseconds.
+      virtual_clock: If True, don't really wait: Just move the clock on.
+    """
+    self.source = source
+    self.stop_ms = stop_ms
+    self.virtual_clock = virtual_clock
+    self.now = 0  # Virtual clock.
+    self.start = time.monotonic()
+    # Draw commands, as tuples: (name, args...).
+    self.log = collections.deque((), LOG_SIZE)
+    self.counts = {}  # name: How many times it was called.
+    self.buttons = collections.deque()  # Presses waiting to be noticed.
+    self.scheduled = []  # Heap of future presses: (time_ms, count, button).
+    self.requests = 0
+    self.brightness = None
+
+  def _Log(self, *command):
+    self.log.append(command)
+    self.counts[command[0]] = self.counts.get(command[0], 0) + 1
+
+  def _Check(self, *colors):
+    for color in colors:
+      if not isinstance(color, int):
+        raise TypeError('invalid color argument: %r' % (color,))
+
+  def Arc(self, x, y, r, thick, start, end, color, fillcolor=None):
+    self._Check(color)
+    self._Log('Arc', x, y, r, color)
+
+  def Rect(self, x, y, width, height, color, fillcolor=None):
+    self._Check(color)
+    self._Log('Rect', x, y, width, height, color)
+
+  def Triangle(self, x, y, x1, y1, x2, y2, color, fillcolor=None):
+    self._Check(color)
+    self._Log('Triangle', x, y, color)
+
+  def BeginFrame(self):
+    """Nothing is shown, so there is nothing to batch."""
+
+  def EndFrame(self):
+    pass
+
+  def WaitMS(self, ms):
+    """Wait for ms milliseconds."""
+    self._CheckStop(ms)
+    if self.virtual_clock:
+      self.now += ms
+    else:
+      time.sleep(ms / 1000)
+
+  def TicksMS(self):
+    """Milliseconds since this Hardware was made."""
+    if self.virtual_clock:
+      return self.now
+    return int((time.monotonic() - self.start) * 1000)
+
+  def _CheckStop(self, ms):
+    if self.stop_ms is not None and self.TicksMS() + ms > self.stop_ms:
+      raise Stop('Stopped at %d ms' % self.TicksMS())
+
+  def PressButton(self, button, at_ms=None):
+    """Press a button, now or at TicksMS() == at_ms."""
+    if at_ms is None:
+      self.buttons.append(button)
+    else:
+      heapq.heappush(self.scheduled, (at_ms, len(self.scheduled), button))
+
+  def WaitForButton(self, ms):
+    """Wait up to ms milliseconds for a button to be pressed.
+
+    Returns:
+      The button pressed, or None if none was.
+    """
+    button = self.CheckForButton()
+    if button:
+      return button
+    if self.scheduled:
+      wait_ms = self.scheduled[0][0] - self.TicksMS()
+      if wait_ms <= ms:
+        self.WaitMS(wait_ms)
+        return heapq.heappop(self.scheduled)[2]
+    self.WaitMS(ms)
+    return None
+
+  def CheckForButton(self):
+    if self.buttons:
+      return self.buttons.popleft()
+    if self.scheduled and self.scheduled[0][0] <= self.TicksMS():
+      return heapq.heappop(self.scheduled)[2]
+    return None
+
+  def print_exception(self, e):
+    traceback.print_exception(None, e, sys.exc_info()[2])
+
+  def ColorListToNative(self, color_list):
+    """Convert list [r, g, b] to #RRGGBB."""
+    color = 0
+    for el in color_list:
+      color = (color << 8) + int(el)
+    return color
+
+  def ColorTableToNative(self, color_table):
+    """#RRGGBB is already native."""
+    return color_table
+
+  def SetBrightness(self, level):
+    self.brightness = level
+
+  def SetOrientation(self):
+    """The fake device never turns over."""
+    return False
+
+  def ResetScreen(self):
+    self._Log('ResetScreen')
+
+  def Chase(self, color=WHITE, bg_color=BLACK):
+    self._Check(color, bg_color)
+    self._Log('Chase', color)
+
+  def HeartBeat(self, color=RED):
+    self._Check(color)
+    self._Log('HeartBeat', color)
+
+  def ShowError(self, error):
+    self._Log('ShowError', '%s' % error)
+
+  def ClearSmallRight(self, bg_color):
+    self._Check(bg_color)
+    self._Log('ClearSmallRight', bg_color)
+
+  def DisplaySmallRight(self, bg_color, text_color, text):
+    self._Check(bg_color, text_color)
+    self._Log('DisplaySmallRight', bg_color, text_color, text)
+
+  def DisplayBig(self, bg_color, text_color, text):
+    self._Check(bg_color, text_color)
+    self._Log('DisplayBig', bg_color, text_color, text)
+
+  def CheckWifi(self):
+    pass
+
+  def GetURI(self, url):
+    """Get the data for url from the source.
+
+    Returns:
+      The body as text, or None if it hasn't changed since the last call.
+
+    Raises:
+      HTTPRequestFailedError: If there's no source, or it raised OSError.
+      HTTPGetFailedError: If the source says so.
+    """
+    self.requests += 1
+    source = self.source
+    if source is None:
+      raise HTTPRequestFailedError('No source for {}'.format(url))
+    try:
+      if callable(source):
+        body = source(url)
+      elif isinstance(source, list):
+        # Replay: The latest response whose time has come.
+        i = bisect.bisect_right([t for t, unused in source], self.TicksMS())
+        if not i:
+          raise HTTPRequestFailedError('No response yet for {}'.format(url))
+        body = source[i - 1][1]
+      else:
+        body = source
+      if isinstance(body, Exception):
+        raise body
+    except OSError as ose:
+      raise HTTPRequestFailedError('GetURI source: {}'.format(ose))
+    if isinstance(body, dict):
+      body = json.dumps(body)
+    return body
+
+  def GetURIChunks(self, url, chunk_size=256):
+    """GetURI, as an iterator over chunks of the body (or None)."""
+    body = self.GetURI(url)
+    if body is None:
+      return None
+    body = body.encode()
+    return (body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+
+  async def GetURIAsync(self, url):
+    """GetURI, for (u)asyncio."""
+    return self.GetURI(url)
@@ -0,0 +1,137 @@
+"""A day of readings, in a fixed amount of memory.
+
+History keeps pm2_5_atm, pm2_5_cf_1 and humidity in arrays of 16-bit
+integers (tenths, so up to 6553.4), one entry per RESOLUTION_MS: Readings
+that arrive within the same RESOLUTION_MS are averaged into one entry. So
+however often the sensor is polled, a day is 720 entries, 7200 bytes.
+
+For each window (10 minutes, an hour and a day) it keeps the sums of the
+entries in the window, adding each reading as it comes in and taking the
+oldest entries out as they leave the window, so an average is a division,
+not a loop over the history. The sums are integers, so they don't drift
+however long it runs.
+
+  history = History()
+  history.Add(hw.TicksMS(), pm2_5_atm, pm2_5_cf_1, humidity)
+  history.Average(HOUR_MS, 'pm2_5_atm')
+"""
+from array import array
+
+FIELDS = ('pm2_5_atm', 'pm2_5_cf_1', 'humidity')
+SCALE = 10
+MISSING = 0xffff  # No value, e.g. a sensor without humidity.
+RESOLUTION_MS = 2 * 60 * 1000
+TEN_MINUTES_MS = 10 * 60 * 1000
+HOUR_MS = 60 * 60 * 1000
+DAY_MS = 24 * HOUR_MS
+WINDOWS_MS = (TEN_MINUTES_MS, HOUR_MS, DAY_MS)
+# The arrays may not be bigger than this in total.
+MAX_BYTES = 8 * 1024
+
+
+class History():
+  """Ring buffer of readings, with rolling averages."""
+
+  def __init__(self, windows_ms=WINDOWS_MS, resolution_ms=RESOLUTION_MS):
+    """Allocate the buffer.
+
+    Args:
+      windows_ms: The windows to average over.
+      resolution_ms: Average readings over this long into one entry.
+    Raises:
+      ValueError: The buffer needed for the longest window is bigger than
+          MAX_BYTES.
+    """
+    self.resolution_ms = resolution_ms
+    self.windows = {}  # window_ms: Index into the lists below.
+    self.window_slots = []  # How many slots each window covers.
+    for index, window_ms in enumerate(windows_ms):
+      self.windows[window_ms] = index
+      self.window_slots.append(window_ms // resolution_ms)
+    self.capacity = max(self.window_slots)
+    zeros = [0] * self.capacity
+    self.slots = array('I', zeros)  # Which RESOLUTION_MS each entry is for.
+    self.values = [array('H', zeros) for unused in FIELDS]
+    size = self.slots.itemsize + sum(v.itemsize for v in self.values)
+    if size * self.capacity > MAX_BYTES:
+      raise ValueError('History needs %d bytes' % (size * self.capacity))
+    self.count = 0  # Entries ever added; the newest is at count - 1.
+    # Per window: The oldest entry in it, and per field, sum & count.
+    self.tails = [0 for unused in windows_ms]
+    self.sums = [[0 for unused in FIELDS] for unused in windows_ms]
+    self.counts = [[0 for unused in FIELDS] for unused in windows_ms]
+    # Readings averaged into the newest entry, per field: sum & count.
+    self.newest_sums = [0.0 for unused in FIELDS]
+    self.newest_counts = [0 for unused in FIELDS]
+
+  def __len__(self):
+    return min(self.count, self.capacity)
+
+  def _Evict(self, slot):
+    """Take entries from before slot's windows out of the sums."""
+    for w, window_slots in enumerate(self.window_slots):
+      tail = self.tails[w]
+      sums = self.sums[w]
+      counts = self.counts[w]
+      while (tail < self.count and
+             self.slots[tail % self.capacity] <= slot - window_slots):
+        i = tail % self.capacity
+        for f, values in enumerate(self.values):
+          if values[i] != MISSING:
+            sums[f] -= values[i]
+            counts[f] -= 1
+        tail += 1
+      self.tails[w] = tail
+
+  def Add(self, now_ms, pm2_5_atm, pm2_5_cf_1, humidity):
+    """Add a reading. Any of the values may be None.
+
+    Args:
+      now_ms: Hardware.TicksMS(). Never less than last time.
+    """
+    slot = now_ms // self.resolution_ms
+    if not self.count or self.slots[(self.count - 1) % self.capacity] != slot:
+      self._Evict(slot)
+      i = self.count % self.capacity
+      self.slots[i] = slot
+      for f, values in enumerate(self.values):
+        values[i] = MISSING
+        self.newest_sums[f] = 0.0
+        self.newest_counts[f] = 0
+      self.count += 1
+    i = (self.count - 1) % self.capacity
+    for f, value in enumerate((pm2_5_atm, pm2_5_cf_1, humidity)):
+      if value is None:
+        continue
+      self.newest_sums[f] += value
+      self.newest_counts[f] += 1
+      scaled = int(self.newest_sums[f] / self.newest_counts[f] * SCALE + 0.5)
+      scaled = min(max(scaled, 0), MISSING - 1)
+      old = self.values[f][i]
+      self.values[f][i] = scaled
+      for w in range(len(self.window_slots)):
+        if self.tails[w] == self.count:
+          continue  # Average was asked about a later time.
+        if old == MISSING:
+          self.counts[w][f] += 1
+        else:
+          self.sums[w][f] -= old
+        self.sums[w][f] += scaled
+
+  def Average(self, window_ms, field='pm2_5_atm', now_ms=None):
+    """Average of field over the window.
+
+    Args:
+      window_ms: One of the windows_ms History was made with.
+      field: One of FIELDS.
+      now_ms: Hardware.TicksMS(). Default: The time of the newest reading.
+    Returns:
+      The average, or None if there are no readings in the window.
+    """
+    if now_ms is not None:
+      self._Evict(now_ms // self.resolution_ms)
+    w = self.windows[window_ms]
+    f = FIELDS.index(field)
+    if not self.counts[w][f]:
+      return None
+    return self.sums[w][f] / self.counts[w][f] / SCALE
@@ -0,0 +1,203 @@
+"""Pull just the fields we want out of a JSON document as it streams in.
+
+The sensors return dozens of fields and we only use a handful. Rather than
+building the whole document with json.loads, scan the bytes and only
+materialize the values that were asked for. Everything else is skipped
+without allocating anything.
+
+The fields wanted are described by a "shape": A dict whose keys are the
+object keys wanted. A value of None means "give me this value, whatever
+it is"; a dict means "this is an object, descend into it and pick these
+keys". For example:
+
+  {'sensor': {'pm2.5_atm': None, 'humidity': None}}
+
+The result has the same structure, containing only the keys that were
+found, so it can be passed to the same code that took json.loads output.
+"""
+import json
+
+_WHITESPACE = b' \t\r\n'
+_QUOTE = 0x22  # "
+_BACKSLASH = 0x5c  # \
+_COMMA = 0x2c  # ,
+_COLON = 0x3a  # :
+_OPEN = b'{['
+_CLOSE = b'}]'
+_OBJECT_OPEN = 0x7b  # {
+_OBJECT_CLOSE = 0x7d  # }
+
+
+class _Reader():
+  """Read bytes one at a time from an iterable of chunks."""
+
+  def __init__(self, chunks):
+    if isinstance(chunks, str):
+      chunks = chunks.encode()
+    if isinstance(chunks, (bytes, bytearray)):
+      chunks = [chunks]
+    self.chunks = iter(chunks)
+    self.buf = b''
+    self.pos = 0
+    # While capturing, consumed bytes are also appended here.
+    self.capture = None
+
+  def _fill(self):
+    if self.capture is not None:
+      self.capture.extend(self.buf)
+    for chunk in self.chunks:
+      if chunk:
+        self.buf = chunk
+        self.pos = 0
+        return True
+    self.buf = b''
+    self.pos = 0
+    return False
+
+  def next(self):
+    if self.pos >= len(self.buf) and not self._fill():
+      raise ValueError('JSON ended early')
+    c = self.buf[self.pos]
+    self.pos += 1
+    return c
+
+  def peek(self):
+    if self.pos >= len(self.buf) and not self._fill():
+      raise ValueError('JSON ended early')
+    return self.buf[self.pos]
+
+  def skip_whitespace(self):
+    while self.peek() in _WHITESPACE:
+      self.pos += 1
+
+  def expect(self, c):
+    self.skip_whitespace()
+    if self.next() != c:
+      raise ValueError('Expected %r at offset %d' % (chr(c), self.pos))
+
+  def start_capture(self):
+    self.capture = bytearray()
+    self.capture_start = self.pos
+
+  def end_capture(self):
+    """Stop capturing and return everything read since start_capture."""
+    if self.capture:
+      self.capture.extend(self.buf[:self.pos])
+      # The first chunk was only captured from capture_start on.
+      data = bytes(self.capture[self.capture_start:])
+    else:
+      data = bytes(self.buf[self.capture_start:self.pos])
+    self.capture = None
+    return data
+
+  def skip_string(self):
+    """Skip the rest of a string whose opening quote has been read."""
+    while True:
+      if self.pos >= len(self.buf) and not self._fill():
+        raise ValueError('JSON ended in a string')
+      quote = self.buf.find(b'"', self.pos)
+      backslash = self.buf.find(b'\\', self.pos)
+      if backslash >= 0 and (quote < 0 or backslash < quote):
+        # Skip the backslash and whatever it escapes.
+        self.pos = backslash + 1
+        self.next()
+      elif quote < 0:
+        self.pos = len(self.buf)
+      else:
+        self.pos = quote + 1
+        return
+
+  def read_key(self):
+    """Read an object key, returning its raw (unescaped) bytes."""
+    self.expect(_QUOTE)
+    start = self.pos
+    end = self.buf.find(b'"', start)
+    if end >= 0 and self.buf.find(b'\\', start, end) < 0:
+      # Common case: Whole key is in this chunk, no escapes.
+      self.pos = end + 1
+      return bytes(self.buf[start:end])
+    key = bytearray()
+    while True:
+      c = self.next()
+      if c == _QUOTE:
+        return bytes(key)
+      key.append(c)
+      if c == _BACKSLASH:
+        key.append(self.next())
+
+  def skip_value(self):
+    """Skip over one value of any type."""
+    self.skip_whitespace()
+    c = self.next()
+    if c == _QUOTE:
+      self.skip_string()
+    elif c in _OPEN:
+      depth = 1
+      while depth:
+        c = self.next()
+        if c == _QUOTE:
+          self.skip_string()
+        elif c in _OPEN:
+          depth += 1
+        elif c in _CLOSE:
+          depth -= 1
+    else:
+      # Number, true, false or null: Runs until a delimiter.
+      while True:
+        c = self.peek()
+        if c == _COMMA or c in _CLOSE or c in _WHITESPACE:
+          return
+        self.pos += 1
+
+  def read_value(self):
+    """Read one value of any type and convert it."""
+    self.skip_whitespace()
+    self.start_capture()
+    self.skip_value()
+    return json.loads(self.end_capture())
+
+
+def _extract_object(reader, shape):
+  result = {}
+  reader.expect(_OBJECT_OPEN)
+  reader.skip_whitespace()
+  if reader.peek() == _OBJECT_CLOSE:
+    reader.pos += 1
+    return result
+  while True:
+    key = reader.read_key()
+    reader.expect(_COLON)
+    name = key.decode()
+    if name not in shape:
+      reader.skip_value()
+    else:
+      sub_shape = shape[name]
+      reader.skip_whitespace()
+      if sub_shape is None or reader.peek() != _OBJECT_OPEN:
+        result[name] = reader.read_value()
+      else:
+        result[name] = _extract_object(reader, sub_shape)
+    reader.skip_whitespace()
+    c = reader.next()
+    if c == _OBJECT_CLOSE:
+      return result
+    if c != _COMMA:
+      raise ValueError('Expected , or } at offset %d' % reader.pos)
+
+
+def extract(chunks, shape):
+  """Extract the fields in shape from a JSON object.
+
+  Only the values asked for are parsed; the rest of the document is
+  skipped. Parsing stops at the end of the top level object.
+
+  Args:
+    chunks: The JSON document as str or bytes, or an iterable of bytes
+        chunks (e.g. from Response.iter_content).
+    shape: dict describing the keys to extract (see module docstring).
+  Returns:
+    dict with the same structure as shape, holding the keys found.
+  Raises:
+    ValueError: If the document isn't valid JSON (as far as we looked).
+  """
+  return _extract_object(_Reader(chunks), shape)
@@ -2,8 +2,11 @@
 from m5stack import *
 from m5ui import *
 from uiflow import *
+import async_requests
 import imu
+import renderer
 import sys
+import utime
 import wifiCfg
 try:
   import nurequests as urequests
@@ -25,8 +28,15 @@ BLUE = 0x0000ff
 WHITE = 0xffffff
 BLACK = 0x000000
 
+FONTS = {
+    'big': lcd.FONT_DejaVu72,
+    'medium': lcd.FONT_DejaVu40,
+    'small': lcd.FONT_DejaVu24,
+}
+
 BUTTONA = 1
 BUTTONB = 2
+BUTTON_POLL_MS = 10
 
 class Error(Exception):
    """Base error class."""
@@ -57,21 +67,95 @@ class Hardware():
     self.chase_index = 0
     self.old_chase = []
     self.new_chase = []
+    self.ticks = 0
+    self.last_ticks = utime.ticks_ms()
+    # Keep the connection to the sensor open between polls, and only
+    # download the data if it has changed, if we can.
+    self.conditional = hasattr(urequests, 'Session')
+    if self.conditional:
+      self.session = urequests.Session()
+    else:
+      self.session = urequests
+    # The same, for GetURIAsync.
+    self.async_session = async_requests.Session()
+    self.renderer = renderer.Renderer(self)
     lcd.fill(BLACK)
     self.SetOrientation()
 
-  def Arc(self, *a, **kw):
-    lcd.arc(*a, **kw)
+  def Arc(self, x, y, r, thick, start, end, *a, **kw):
+    lcd.arc(x, y, r, thick, start, end, *a, **kw)
+    self.renderer.Damage(x - r, y - r, 2 * r, 2 * r)
+
+  def Rect(self, x, y, width, height, *a, **kw):
+    lcd.rect(x, y, width, height, *a, **kw)
+    self.renderer.Damage(x, y, width, height)
+
+  def Triangle(self, x, y, x1, y1, x2, y2, *a, **kw):
+    lcd.triangle(x, y, x1, y1, x2, y2, *a, **kw)
+    left = min(x, x1, x2)
+    top = min(y, y1, y2)
+    self.renderer.Damage(
+        left, top, max(x, x1, x2) - left + 1, max(y, y1, y2) - top + 1)
+
+  def BeginFrame(self):
+    """Start a batch of drawing.
+
+    The LCD shows drawing as it happens, so there is nothing to batch here.
+    """
+
+  def EndFrame(self):
+    """End a batch of drawing."""
+
+  # Primitives for renderer.Renderer.
+
+  def FillScreen(self, color):
+    lcd.fill(color)
 
-  def Rect(self, *a, **kw):
-    lcd.rect(*a, **kw)
+  def FillRect(self, x, y, width, height, color):
+    lcd.rect(x, y, width, height, color, color)
 
-  def Triangle(self, *a, **kw):
-    lcd.triangle(*a, **kw)
+  def DrawText(self, font, text, x, y, color):
+    lcd.font(FONTS[font], rotate=0, transparent=True)
+    lcd.print(text, x, y, color)
+
+  def TextSize(self, font, text):
+    lcd.font(FONTS[font], rotate=0, transparent=True)
+    return lcd.textWidth(text), lcd.fontSize()[1]
 
   def WaitMS(self, ms):
     wait_ms(ms)
 
+  def TicksMS(self):
+    """Milliseconds since startup.
+
+    utime.ticks_ms() wraps around, so keep our own count that doesn't.
+    """
+    now = utime.ticks_ms()
+    self.ticks += utime.ticks_diff(now, self.last_ticks)
+    self.last_ticks = now
+    return self.ticks
+
+  def WaitForButton(self, ms):
+    """Wait up to ms milliseconds for a button to be pressed.
+
+    This still wakes up every BUTTON_POLL_MS to check the buttons: UIFlow
+    has no sleep that a button press can cut short (machine.lightsleep
+    would drop the WiFi). So on the stick the scheduler makes the timing
+    exact, but the CPU wakes up as often as before.
+
+    Returns:
+      The button pressed, or None if none was.
+    """
+    end = self.TicksMS() + ms
+    while True:
+      button = self.CheckForButton()
+      if button:
+        return button
+      left = end - self.TicksMS()
+      if left <= 0:
+        return None
+      wait_ms(min(left, BUTTON_POLL_MS))
+
   def CheckForButton(self):
     if btnA.wasPressed():
       return BUTTONA
@@ -97,6 +181,17 @@ class Hardware():
       color = (color << 8) + int(el)
     return color
 
+  def ColorTableToNative(self, color_table):
+    """Convert a table of #RRGGBB integers to HW's native format.
+
+    Args:
+      color_table: Sequence of 24 bit #RRGGBB integers.
+
+    Returns:
+      The table itself: #RRGGBB is already native.
+    """
+    return color_table
+
   def SetBrightness(self, level):
     """Set the brightness.
 
@@ -123,12 +218,14 @@ class Hardware():
     if orientation != self.orientation:
       self.orientation = orientation
       lcd.orient(orientation)
+      self.renderer.Invalidate()
       return True
     return False
 
   def ResetScreen(self):
     """Reset the screen to black and to right side up."""
     lcd.fill(BLACK)
+    self.renderer.Invalidate()
     self.SetOrientation()
 
   def Chase(self, color=WHITE, bg_color=BLACK):
@@ -179,32 +276,27 @@ class Hardware():
     self.SetOrientation()  # Always show text "right side up".
     lcd.font(lcd.FONT_DejaVu18, rotate=0, transparent=True)
     lcd.fill(RED)
+    self.renderer.Invalidate()
     print('ShowError: error=%r' % error)
     self.print_exception(error)
     lcd.print('%s' % error, 10, 10, WHITE)
 
   def ClearSmallRight(self, bg_color):
-    lcd.font(lcd.FONT_DejaVu24, rotate=0, transparent=True)
-    lcd.textClear(140, 30, 'M', bg_color)
+    self.renderer.Text('small', 140, 30, 'small', bg_color, None, '')
 
   def DisplaySmallRight(self, bg_color, text_color, text):
     """Display small text on the right."""
-    lcd.font(lcd.FONT_DejaVu24, rotate=0, transparent=True)
-    self.ClearSmallRight(bg_color)
-    lcd.print(text, 140, 30, text_color)
+    self.renderer.Text('small', 140, 30, 'small', bg_color, text_color, text)
 
   def DisplayBig(self, bg_color, text_color, text):
     """Display text using the biggest font possible.
 
-    Not much fits at this size: Really just 3 characters.
+    Not much fits at this size: Really just 3 characters. Only the parts
+    that changed are redrawn.
     """
     self.SetOrientation()
-    if type(text) == int:
-      lcd.font(lcd.FONT_DejaVu72, rotate=0, transparent=True)
-    else:
-      lcd.font(lcd.FONT_DejaVu40, rotate=0, transparent=True)
-    lcd.fill(bg_color)
-    lcd.print(text, 5, 5, text_color)
+    font = 'big' if type(text) == int else 'medium'
+    self.renderer.Text('big', 5, 5, font, bg_color, text_color, text)
 
   def _GetDefaults(self):
     """The SSID & Password are already on the device: Use them.
@@ -230,13 +322,11 @@ class Hardware():
       wifiCfg.doConnect(self.ssid, self.password)
       self.ShowError('WiFi connected')
 
-  def GetURI(self, url):
-    """Get data from the given URI.
-
-    If we're not on WiFi, connect. Then get the data.
+  def _Request(self, url):
+    """Make the GET request for GetURI & GetURIChunks.
 
-    Args:
-      url: Full URL to fetch.
+    Returns:
+      The response, or None if the server says nothing has changed (304).
 
     Raises:
       HTTPRequestFailedError: If HTTP request fails.
@@ -244,15 +334,104 @@ class Hardware():
     """
     self.CheckWifi()
     try:
-      resp = urequests.request(method='GET', url=url)
+      if self.conditional:
+        resp = self.session.request(method='GET', url=url, conditional=True)
+      else:
+        resp = self.session.request(method='GET', url=url)
     except (OSError, ValueError, NotImplementedError, IndexError) as err:
       # IndexError: https://github.com/micropython/micropython-lib/issues/300
       raise HTTPRequestFailedError('_GetURI request: {}'.format(err))
+    if resp.status_code == 304:
+      resp.content  # Empty: Lets the session reuse the connection.
+      return None
     if resp.status_code != 200:
-      print('%s: %s' % (resp.status_code, resp.text))
+      try:
+        print('%s: %s' % (resp.status_code, resp.text))
+      except OSError:
+        resp.close()
       raise HTTPGetFailedError('Status code={}'.format(resp.status_code))
+    return resp
 
+  def GetURI(self, url):
+    """Get data from the given URI.
+
+    If we're not on WiFi, connect. Then get the data.
+
+    Args:
+      url: Full URL to fetch.
+
+    Returns:
+      The body as text, or None if it hasn't changed since the last call.
+
+    Raises:
+      HTTPRequestFailedError: If HTTP request fails.
+      HTTPGetFailedError: If HTTP GET returns something other than 200.
+    """
+    resp = self._Request(url)
+    if resp is None:
+      return None
     try:
       return resp.text
     except OSError as ose:
       raise HTTPRequestFailedError('_GetURI resp.text: {}'.format(ose))
+
+  def GetURIChunks(self, url, chunk_size=256):
+    """Get data from the given URI a piece at a time.
+
+    Like GetURI, but returns an iterator over the body in chunks of at most
+    chunk_size bytes, so the whole body never has to be in memory.
+
+    Returns:
+      Iterator over the body, or None if it hasn't changed since the last call.
+
+    Raises:
+      HTTPRequestFailedError: If HTTP request fails (possibly while iterating).
+      HTTPGetFailedError: If HTTP GET returns something other than 200.
+    """
+    resp = self._Request(url)
+    if resp is None:
+      return None
+    return self._Chunks(resp, chunk_size)
+
+  def _Chunks(self, resp, chunk_size):
+    try:
+      if hasattr(resp, 'iter_content'):
+        for chunk in resp.iter_content(chunk_size):
+          yield chunk
+      else:
+        yield resp.content
+    except (OSError, ValueError) as err:
+      raise HTTPRequestFailedError('_GetURI resp chunks: {}'.format(err))
+    finally:
+      # Once the body has all been read, the session has the connection
+      # back and this does nothing. If not (we were stopped early), don't
+      # leave the socket open.
+      resp.close()
+
+  async def GetURIAsync(self, url):
+    """Get data from the given URI without blocking other tasks.
+
+    Like GetURI, the connection is kept open between calls, and the body is
+    only downloaded if it has changed.
+
+    Args:
+      url: Full URL to fetch.
+
+    Returns:
+      The body as text, or None if it hasn't changed since the last call.
+
+    Raises:
+      HTTPRequestFailedError: If HTTP request fails or times out.
+      HTTPGetFailedError: If HTTP GET returns something other than 200.
+    """
+    self.CheckWifi()
+    try:
+      status, body = await self.async_session.get(url, conditional=True)
+    except (OSError, ValueError, EOFError,
+            async_requests.asyncio.TimeoutError) as err:
+      raise HTTPRequestFailedError('_GetURIAsync request: {}'.format(err))
+    if status == 304:
+      return None
+    if status != 200:
+      raise HTTPGetFailedError('Status code={}'.format(status))
+    return str(body, 'utf-8')
@@ -0,0 +1,110 @@
+"""EPA NowCast for PM2.5, updated as each reading comes in.
+
+The NowCast is a weighted average of the last 12 hourly averages, c1 (this
+hour, so far) to c12, with weights w**0 to w**11:
+
+  w = max(min(c) / max(c), 0.5)
+  NowCast = sum(w**(i-1) * ci) / sum(w**(i-1))
+
+and needs at least 2 of the 3 most recent hours. This is what AirNow shows.
+
+Recomputing that from the readings on every poll would mean keeping 12
+hours of them, and a loop over them all. Instead, this hour is kept as a
+running sum, and the hours before it as one average each. When the hour
+changes, the minimum and maximum of the hours before are worked out once.
+Then for each reading, w is just the current average compared with them,
+and the weighted sum of the hours before is only redone when w changes.
+
+Hours are counted from startup (Hardware.TicksMS()), not by the clock.
+"""
+
+HOUR_MS = 60 * 60 * 1000
+HOURS = 12
+MIN_WEIGHT = 0.5
+
+
+class NowCast():
+  """Incremental NowCast of one sensor's PM2.5."""
+
+  def __init__(self):
+    self.hour = None  # Which hour since startup this is.
+    self.sum = 0.0  # Of this hour's readings.
+    self.count = 0
+    self.averages = [None] * HOURS  # Hour averages, by hour % HOURS.
+    self.previous = [None] * (HOURS - 1)  # c2 to c12; None where no data.
+    self.low = None  # Of previous.
+    self.high = None
+    # Weighted sums of previous for weight: sum(weight**(i-1) * ci) and
+    # sum(weight**(i-1)), for i from 2.
+    self.weight = None
+    self.weighted_sum = 0.0
+    self.weights = 0.0
+
+  def Add(self, now_ms, pm):
+    """Add a reading.
+
+    Args:
+      now_ms: Hardware.TicksMS(). Never less than last time.
+      pm: PM2.5 in ug/m3.
+    """
+    hour = now_ms // HOUR_MS
+    if hour != self.hour:
+      self._NextHour(hour)
+    self.sum += pm
+    self.count += 1
+
+  def _NextHour(self, hour):
+    """Save the hour that finished, and get ready for the new one."""
+    if self.hour is not None:
+      self.averages[self.hour % HOURS] = self.sum / self.count
+      # No readings at all for any hours in between.
+      for gap in range(max(self.hour + 1, hour - HOURS + 1), hour):
+        self.averages[gap % HOURS] = None
+    else:
+      for i in range(HOURS):
+        self.averages[i] = None
+    self.hour = hour
+    self.sum = 0.0
+    self.count = 0
+    self.averages[hour % HOURS] = None
+    self.previous = [self.averages[(hour - i) % HOURS] for i in range(1, HOURS)]
+    present = [c for c in self.previous if c is not None]
+    self.low = min(present) if present else None
+    self.high = max(present) if present else None
+    self.weight = None
+
+  def Value(self):
+    """The NowCast.
+
+    Returns:
+      PM2.5 in ug/m3, or None if there isn't enough data yet.
+    """
+    current = self.sum / self.count if self.count else None
+    recent = (current, self.previous[0], self.previous[1])
+    if len([c for c in recent if c is not None]) < 2:
+      return None
+    low = self.low
+    high = self.high
+    if current is not None:
+      low = current if low is None or current < low else low
+      high = current if high is None or current > high else high
+    weight = low / high if high else 1.0
+    if weight < MIN_WEIGHT:
+      weight = MIN_WEIGHT
+    if weight != self.weight:
+      self._Weigh(weight)
+    if current is None:
+      return self.weighted_sum / self.weights
+    return (current + self.weighted_sum) / (1 + self.weights)
+
+  def _Weigh(self, weight):
+    """Weigh the previous hours."""
+    self.weight = weight
+    self.weighted_sum = 0.0
+    self.weights = 0.0
+    factor = 1.0
+    for c in self.previous:
+      factor *= weight
+      if c is not None:
+        self.weighted_sum += factor * c
+        self.weights += factor
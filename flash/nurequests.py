@@ -1,11 +1,32 @@
-import usocket
+try:
+    import usocket
+except ImportError:
+    import usocket_shim as usocket  # On a PC.
+try:
+    import utime as time
+except ImportError:
+    import time
+
+# Resolved addresses are cached for this many seconds. Set to 0 to disable.
+DNS_TTL = 300
+DNS_CACHE_SIZE = 4
+_dns_cache = {}
 
 class Response:
 
-    def __init__(self, f):
+    def __init__(self, f, length=None, release=None, chunked=False):
         self.raw = f
         self.encoding = "utf-8"
         self._cached = None
+        # How the body ends: After length bytes, after the last chunk, or
+        # (if neither is known) when the server closes the connection.
+        self._length = length
+        self._remaining = length
+        self._chunked = chunked
+        self._chunk_left = 0
+        # Keep-alive responses hand the socket back to the session when the
+        # body has been read instead of closing it.
+        self._release = release
 
     def close(self):
         if self.raw:
@@ -13,14 +34,93 @@ class Response:
             self.raw = None
         self._cached = None
 
+    def _done(self):
+        if self._release:
+            self._release(self.raw)
+        else:
+            self.raw.close()
+        self.raw = None
+
+    def _readinto(self, mv):
+        n = self.raw.readinto(mv)
+        if not n:
+            raise OSError("connection closed before end of body")
+        return n
+
+    def readinto(self, buf):
+        """Read the next piece of the body into buf.
+
+        Returns:
+          Number of bytes read; 0 once the whole body has been read.
+        """
+        if self.raw is None:
+            return 0
+        mv = memoryview(buf)
+        try:
+            if self._chunked:
+                if not self._chunk_left:
+                    size = int(self.raw.readline().split(b";", 1)[0], 16)
+                    if not size:
+                        # Skip any trailers.
+                        while True:
+                            l = self.raw.readline()
+                            if not l or l == b"\r\n":
+                                break
+                        self._done()
+                        return 0
+                    self._chunk_left = size
+                n = self._readinto(mv[:min(len(buf), self._chunk_left)])
+                self._chunk_left -= n
+                if not self._chunk_left:
+                    self.raw.readline()  # CRLF after the chunk data.
+                return n
+            if self._remaining is not None:
+                if not self._remaining:
+                    self._done()
+                    return 0
+                n = self._readinto(mv[:min(len(buf), self._remaining)])
+                self._remaining -= n
+                return n
+            n = self.raw.readinto(mv)
+            if not n:
+                self._done()
+                return 0
+            return n
+        except:
+            self.close()
+            raise
+
+    def iter_content(self, chunk_size=256):
+        """Iterate over the body chunk_size bytes (or fewer) at a time."""
+        buf = bytearray(chunk_size)
+        while True:
+            n = self.readinto(buf)
+            if not n:
+                return
+            yield bytes(buf[:n])
+
     @property
     def content(self):
         if self._cached is None:
-            try:
-                self._cached = self.raw.read()
-            finally:
-                self.raw.close()
-                self.raw = None
+            if self._chunked:
+                self._cached = b"".join(self.iter_content(512))
+            elif self._length is None:
+                try:
+                    self._cached = self.raw.read()
+                finally:
+                    self.raw.close()
+                    self.raw = None
+            else:
+                buf = bytearray(self._length)
+                mv = memoryview(buf)
+                got = 0
+                while got < self._length:
+                    n = self.readinto(mv[got:])
+                    if not n:
+                        raise OSError("response already closed")
+                    got += n
+                self.readinto(mv)  # Hit the end: Release the socket.
+                self._cached = bytes(buf)
         return self._cached
 
     @property
@@ -32,8 +132,7 @@ class Response:
         return ujson.loads(self.content)
 
 
-def request(method, url, data=None, json=None, headers={}, stream=None):
-    redir_cnt = 1
+def _parse_url(url):
     try:
         proto, dummy, host, path = url.split("/", 3)
     except ValueError:
@@ -42,7 +141,6 @@ def request(method, url, data=None, json=None, headers={}, stream=None):
     if proto == "http:":
         port = 80
     elif proto == "https:":
-        import ussl
         port = 443
     else:
         raise ValueError("Unsupported protocol: " + proto)
@@ -50,55 +148,136 @@ def request(method, url, data=None, json=None, headers={}, stream=None):
     if ":" in host:
         host, port = host.split(":", 1)
         port = int(port)
+    return proto, host, port, path
+
+
+def _absolute_url(proto, host, port, path, location):
+    """Where a Location header points, given the URL that was asked for.
+
+    Location may be relative: "/path", "path" or "//host/path".
+    """
+    if "://" in location:
+        return location
+    if location.startswith("//"):
+        return proto + location
+    if (proto, port) in (("http:", 80), ("https:", 443)):
+        netloc = host
+    else:
+        netloc = "%s:%d" % (host, port)
+    if not location.startswith("/"):
+        # Relative to the directory of the current path.
+        directory = path.split("?", 1)[0].rsplit("/", 1)
+        if len(directory) > 1:
+            location = directory[0] + "/" + location
+        location = "/" + location
+    return "%s//%s%s" % (proto, netloc, location)
+
 
-    ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
-    ai = ai[0]
+def _resolve(host, port):
+    """getaddrinfo, but remember the answer for DNS_TTL seconds."""
+    key = (host, port)
+    now = time.time()
+    entry = _dns_cache.get(key)
+    if entry is not None and now < entry[0]:
+        return entry[1]
+    ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)[0]
+    if DNS_TTL > 0:
+        if key not in _dns_cache and len(_dns_cache) >= DNS_CACHE_SIZE:
+            # Evict whichever entry expires first.
+            oldest = None
+            for k in _dns_cache:
+                if oldest is None or _dns_cache[k][0] < _dns_cache[oldest][0]:
+                    oldest = k
+            del _dns_cache[oldest]
+        _dns_cache[key] = (now + DNS_TTL, ai)
+    return ai
+
+
+def forget_host(host, port):
+    """Drop a cached address, e.g. because connecting to it failed."""
+    _dns_cache.pop((host, port), None)
+
+
+def _connect(proto, host, port):
+    ai = _resolve(host, port)
 
     s = usocket.socket(ai[0], ai[1], ai[2])
     try:
-        # TODO https://docs.micropython.org/en/latest/library/usocket.html
-        # Use uselect.poll() instead of settimeout.
+        # Blocking, with a timeout. With aqi.ASYNC, async_requests fetches
+        # without blocking the rest of the app.
         s.settimeout(10)
         s.connect(ai[-1])
         if proto == "https:":
+            import ussl
             s = ussl.wrap_socket(s, server_hostname=host)
-        s.write(b"%s /%s HTTP/1.0\r\n" % (method, path))
-        if not "Host" in headers:
-            s.write(b"Host: %s\r\n" % host)
-        # Iterate over keys to avoid tuple alloc
-        for k in headers:
-            s.write(k)
-            s.write(b": ")
-            s.write(headers[k])
-            s.write(b"\r\n")
-        if json is not None:
-            assert data is None
-            import ujson
-            data = ujson.dumps(json)
-            s.write(b"Content-Type: application/json\r\n")
-        if data:
-            s.write(b"Content-Length: %d\r\n" % len(data))
-        s.write(b"\r\n")
-        if data:
-            s.write(data)
-
-        l = s.readline()
-        l_split = l.split(None, 2)
-        try:
-          status = int(l_split[1])
-        except IndexError:
-          raise ValueError('bad status line: %r' % l)
-        reason = ""
-        if len(l_split) > 2:
-            reason = l_split[2].rstrip()
+    except OSError:
+        s.close()
+        forget_host(host, port)
+        raise
+    return s
+
+
+def _bytes(s):
+    return s.encode() if isinstance(s, str) else s
+
+
+def _write_request(s, method, host, path, headers, data, json, version,
+                   extra=None):
+    # Send it all in one write: Each small write can be a packet of its own,
+    # and on a kept-alive connection Nagle's algorithm holds each one back
+    # until the server ACKs the last, which it may delay by ~40 ms.
+    out = [("%s /%s %s\r\n" % (method, path, version)).encode()]
+    if not "Host" in headers:
+        out.append(("Host: %s\r\n" % host).encode())
+    if extra:
+        out.append(extra)
+    for k in headers:
+        out.append(_bytes(k))
+        out.append(b": ")
+        out.append(_bytes(headers[k]))
+        out.append(b"\r\n")
+    if json is not None:
+        assert data is None
+        import ujson
+        data = ujson.dumps(json)
+        out.append(b"Content-Type: application/json\r\n")
+    if data:
+        out.append(b"Content-Length: %d\r\n" % len(data))
+    out.append(b"\r\n")
+    if data:
+        out.append(_bytes(data))
+    s.write(b"".join(out))
+
+
+def _read_status(s):
+    l = s.readline()
+    l_split = l.split(None, 2)
+    try:
+      status = int(l_split[1])
+    except IndexError:
+      raise ValueError('bad status line: %r' % l)
+    reason = ""
+    if len(l_split) > 2:
+        reason = l_split[2].rstrip()
+    return status, reason
+
+
+def request(method, url, data=None, json=None, headers={}, stream=None):
+    redir_cnt = 1
+    chunked = False
+    proto, host, port, path = _parse_url(url)
+    s = _connect(proto, host, port)
+    try:
+        _write_request(s, method, host, path, headers, data, json, "HTTP/1.0")
+
+        status, reason = _read_status(s)
         while True:
             l = s.readline()
             if not l or l == b"\r\n":
                 break
             #print(l)
             if l.startswith(b"Transfer-Encoding:"):
-                if b"chunked" in l:
-                    raise ValueError("Unsupported " + l)
+                chunked = b"chunked" in l
             elif l.startswith(b"Location:") and 300 <= status <= 399:
                 if not redir_cnt:
                     raise ValueError("Too many redirects")
@@ -112,12 +291,152 @@ def request(method, url, data=None, json=None, headers={}, stream=None):
         s.close()
         raise
 
-    resp = Response(s)
+    resp = Response(s, chunked=chunked)
     resp.status_code = status
     resp.reason = reason
     return resp
 
 
+class Session:
+    """Reuse connections between requests.
+
+    Sockets are kept open per (protocol, host, port) and requests are made
+    with HTTP/1.1 keep-alive, so repeated polls of the same sensor skip
+    the TCP (and TLS) handshake. The response body must be read (e.g. via
+    .content or .text) before the connection can be reused; a response that
+    isn't read should be closed.
+
+    If a kept connection has gone stale (the server timed it out), the
+    request is transparently retried once on a new connection.
+
+    With conditional=True, the ETag/Last-Modified of the last 200 response
+    for a URL are sent back as If-None-Match/If-Modified-Since. If the
+    resource hasn't changed the server answers 304 with no body.
+    """
+
+    def __init__(self):
+        self._sockets = {}
+        self._validators = {}
+
+    def close(self):
+        for key in self._sockets:
+            self._sockets[key].close()
+        self._sockets = {}
+
+    def _releaser(self, key):
+        def release(s):
+            old = self._sockets.get(key)
+            if old is not None and old is not s:
+                old.close()
+            self._sockets[key] = s
+        return release
+
+    def _send(self, s, method, host, path, headers, data, json):
+        _write_request(s, method, host, path, headers, data, json,
+                       "HTTP/1.1", b"Connection: keep-alive\r\n")
+        status, reason = _read_status(s)
+        hdrs = {}
+        while True:
+            l = s.readline()
+            if not l:
+                raise OSError("connection closed in headers")
+            if l == b"\r\n":
+                break
+            k, v = l.split(b":", 1)
+            hdrs[k.strip().lower()] = v.strip()
+        return status, reason, hdrs
+
+    def _conditional_headers(self, url, headers):
+        validators = self._validators.get(url)
+        if not validators:
+            return headers
+        headers = dict(headers)
+        if validators[0]:
+            headers["If-None-Match"] = validators[0]
+        if validators[1]:
+            headers["If-Modified-Since"] = validators[1]
+        return headers
+
+    def _remember_validators(self, url, hdrs):
+        etag = hdrs.get(b"etag")
+        last_modified = hdrs.get(b"last-modified")
+        if etag or last_modified:
+            self._validators[url] = (etag, last_modified)
+        else:
+            self._validators.pop(url, None)
+
+    def request(self, method, url, data=None, json=None, headers={},
+                stream=None, conditional=False):
+        redir_cnt = 1
+        request_headers = headers
+        while True:
+            if conditional:
+                headers = self._conditional_headers(url, request_headers)
+            proto, host, port, path = _parse_url(url)
+            key = (proto, host, port)
+            s = self._sockets.pop(key, None)
+            if s is not None:
+                try:
+                    status, reason, hdrs = self._send(
+                        s, method, host, path, headers, data, json)
+                except (OSError, ValueError):
+                    # Stale keep-alive connection: Start over.
+                    s.close()
+                    s = None
+            if s is None:
+                s = _connect(proto, host, port)
+                try:
+                    status, reason, hdrs = self._send(
+                        s, method, host, path, headers, data, json)
+                except:
+                    s.close()
+                    raise
+
+            if 300 <= status <= 399 and b"location" in hdrs:
+                s.close()
+                if not redir_cnt:
+                    raise ValueError("Too many redirects")
+                redir_cnt -= 1
+                url = _absolute_url(proto, host, port, path,
+                                    hdrs[b"location"].decode())
+                continue
+            break
+
+        if conditional and status == 200:
+            self._remember_validators(url, hdrs)
+
+        chunked = False
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            length = 0
+        elif b"chunked" in hdrs.get(b"transfer-encoding", b""):
+            chunked = True
+            length = None
+        elif b"content-length" in hdrs:
+            length = int(hdrs[b"content-length"])
+        else:
+            length = None
+        if ((length is None and not chunked) or
+                hdrs.get(b"connection", b"").lower() == b"close"):
+            # No way to tell where the body ends, or the server is going to
+            # hang up anyway: Read to EOF and close.
+            resp = Response(s, chunked=chunked)
+        else:
+            resp = Response(s, length, self._releaser(key), chunked)
+        resp.status_code = status
+        resp.reason = reason
+        resp.headers = hdrs
+        return resp
+
+    def head(self, url, **kw):
+        return self.request("HEAD", url, **kw)
+
+    def get(self, url, **kw):
+        return self.request("GET", url, **kw)
+
+    def post(self, url, **kw):
+        return self.request("POST", url, **kw)
+
+
 def head(url, **kw):
     return request("HEAD", url, **kw)
 
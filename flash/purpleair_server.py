@@ -0,0 +1,371 @@
+"""Stand-in for a PurpleAir sensor and the PurpleAir API, for testing offline.
+
+Serves the same shapes of JSON as the real thing:
+
+  /json?live=false        A sensor on the local network (LocalAQI).
+  /v1/sensors/{id}        The web API for one sensor (WebAQI), with or without
+                          &fields=.
+  /v1/sensors?show_only=  The web API for several sensors (MultiWebAQI).
+  /stats                  Request counters, as JSON.
+
+and can be made to misbehave in the ways a real network does: Slow to
+answer, slow to send the body (a few bytes at a time), chunked encoding,
+redirects, 5xx errors, rate limiting (429) and broken JSON. That's what
+GetURI's throughput and resilience can be measured against.
+
+Responses carry an ETag and Last-Modified, and a request that sends them
+back (If-None-Match, If-Modified-Since) for an unchanged body gets a 304.
+
+Run it on a PC:
+
+  python purpleair_server.py --port 8000 --latency-ms 500 --error-rate 0.1
+
+and point aqi.json's sensor_location at "localhost:8000". For the web
+interfaces, set the interface's url_template to http://localhost:8000/...
+
+Or start it in a test, in the background:
+
+  server = purpleair_server.Start(purpleair_server.Faults(chunked=True))
+  ... fetch from server.url ...
+  print(server.Counters())
+  server.shutdown()
+
+Faults can be changed while it runs, e.g. server.faults.error_rate = 1.
+"""
+import argparse
+import http.server
+import json
+import random
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs
+
+# Last-Modified, for every response: The bodies only change with Faults.
+LAST_MODIFIED = 'Mon, 21 Sep 2020 17:52:37 GMT'
+
+# A full response from a sensor's /json?live=false.
+LOCAL_RESPONSE = {
+    'SensorId': '84:f3:eb:7b:c8:c1', 'DateTime': '2020/09/21T17:52:37z',
+    'Geo': 'PurpleAir-c8c1', 'Mem': 19816, 'memfrag': 13, 'memfb': 17216,
+    'memcs': 872, 'Id': 16578, 'lat': 37.4, 'lon': -122.1, 'Adc': 0.03,
+    'loggingrate': 15, 'place': 'outside', 'version': '6.01',
+    'uptime': 423622, 'rssi': -61, 'period': 120, 'httpsuccess': 7066,
+    'httpsends': 7066, 'hardwareversion': '2.0',
+    'hardwarediscovered': '2.0+BME280+PMSX003-B+PMSX003-A',
+    'current_temp_f': 74, 'current_humidity': 38, 'current_dewpoint_f': 47,
+    'pressure': 1012.61, 'p25aqic_b': 'rgb(255,187,0)', 'pm2.5_aqi_b': 82,
+    'pm1_0_cf_1_b': 18.28, 'p_0_3_um_b': 3616.15, 'pm2_5_cf_1_b': 26.61,
+    'p_0_5_um_b': 1062.11, 'pm10_0_cf_1_b': 28.58, 'p_1_0_um_b': 170.99,
+    'pm1_0_atm_b': 18.28, 'p_2_5_um_b': 16.74, 'pm2_5_atm_b': 26.61,
+    'p_5_0_um_b': 2.23, 'pm10_0_atm_b': 28.58, 'p_10_0_um_b': 0.77,
+    'p25aqic': 'rgb(255,203,0)', 'pm2.5_aqi': 77, 'pm1_0_cf_1': 16.63,
+    'p_0_3_um': 3261.3, 'pm2_5_cf_1': 24.74, 'p_0_5_um': 943.15,
+    'pm10_0_cf_1': 26.64, 'p_1_0_um': 165.27, 'pm1_0_atm': 16.63,
+    'p_2_5_um': 15.46, 'pm2_5_atm': 24.74, 'p_5_0_um': 1.6,
+    'pm10_0_atm': 26.64, 'p_10_0_um': 0.53, 'pa_latency': 231,
+    'response': 201, 'response_date': 1600710680, 'latency': 289,
+    'key1_response': 200, 'key1_response_date': 1600710675,
+    'key1_count': 82374, 'ts_latency': 549, 'key2_response': 200,
+    'key2_response_date': 1600710677, 'key2_count': 82377,
+    'ts_s_latency': 511, 'key1_response_b': 200,
+    'key1_response_date_b': 1600710678, 'key1_count_b': 82365,
+    'ts_latency_b': 496, 'key2_response_b': 200,
+    'key2_response_date_b': 1600710680, 'key2_count_b': 82368,
+    'ts_s_latency_b': 519, 'wlstate': 'Connected', 'status_0': 2,
+    'status_1': 2, 'status_2': 2, 'status_3': 2, 'status_4': 0,
+    'status_5': 0, 'status_6': 2, 'status_7': 0, 'status_8': 2,
+    'status_9': 2, 'ssid': 'example',
+}
+
+# api.purpleair.com/v1/sensors/{id}, without &fields=.
+WEB_RESPONSE = {
+    'api_version': 'V1.0.6-0.0.9', 'time_stamp': 1617819591,
+    'data_time_stamp': 1617819586,
+    'sensor': {
+        'sensor_index': 38889, 'name': 'Example', 'location_type': 0,
+        'model': 'PA-II', 'hardware': '2.0+BME280+PMSX003-B+PMSX003-A',
+        'latitude': 37.4, 'longitude': -122.1, 'altitude': 100,
+        'last_seen': 1617819535, 'humidity': 36, 'temperature': 77,
+        'pressure': 1013.2, 'pm1.0': 2.3, 'pm2.5': 3.9, 'pm10.0': 4.1,
+        'pm2.5_atm': 3.9, 'pm2.5_cf_1': 3.9, 'pm2.5_10minute': 4.2,
+        'pm2.5_30minute': 4.5, 'pm2.5_60minute': 4.7, 'pm2.5_6hour': 5.5,
+        'pm2.5_24hour': 6.1, 'pm2.5_1week': 7.0,
+        'stats': {'pm2.5': 3.9, 'pm2.5_10minute': 4.2, 'time_stamp': 1617819},
+    },
+}
+
+# The same, with &fields=sensor_index,pm2.5_atm,pm2.5_cf_1,humidity.
+WEB_FIELDS_RESPONSE = {
+    'api_version': 'V1.0.6-0.0.9', 'time_stamp': 1617819591,
+    'fields': ['sensor_index', 'pm2.5_atm', 'pm2.5_cf_1', 'humidity'],
+    'data': [[38889, 3.9, 3.9, 36]],
+}
+
+# /v1/sensors?show_only=38889,12345,23456,34567&fields=...
+MULTI_WEB_RESPONSE = {
+    'api_version': 'V1.0.6-0.0.9', 'time_stamp': 1617819591,
+    'fields': ['sensor_index', 'pm2.5_atm', 'pm2.5_cf_1', 'humidity'],
+    'data': [[38889, 3.9, 3.9, 36], [12345, 12.1, 13.0, 40],
+             [23456, 35.7, 40.2, 45], [34567, 8.0, 8.1, 50]],
+}
+
+
+class Faults():
+  """How the server should misbehave. All off by default.
+
+  Attributes:
+    latency_ms: Wait this long before answering.
+    drip_bytes: If set, send the body this many bytes at a time...
+    drip_ms: ...waiting this long between them.
+    chunked: Send the body with Transfer-Encoding: chunked...
+    chunk_size: ...in chunks this big.
+    redirect: Answer each request with a 302 to the same URL, and answer
+        that for real.
+    error_rate: Fraction (0-1) of requests answered with error_status.
+    error_status: e.g. 500, 502, 503.
+    rate_limit_every: If set, every nth request gets a 429.
+    malformed_rate: Fraction (0-1) of bodies cut off half way.
+    pm2_5: If set, the PM2.5 (both channels, all sensors) to report.
+  """
+
+  def __init__(self, **kw):
+    self.latency_ms = 0
+    self.drip_bytes = 0
+    self.drip_ms = 0
+    self.chunked = False
+    self.chunk_size = 64
+    self.redirect = False
+    self.error_rate = 0.0
+    self.error_status = 503
+    self.rate_limit_every = 0
+    self.malformed_rate = 0.0
+    self.pm2_5 = None
+    for name in kw:
+      if not hasattr(self, name):
+        raise TypeError('Unknown fault: %s' % name)
+      setattr(self, name, kw[name])
+
+
+def LocalBody(pm2_5=None):
+  """The sensor's /json response, with pm2_5 if given."""
+  data = dict(LOCAL_RESPONSE)
+  if pm2_5 is not None:
+    for name in ('pm2_5_atm', 'pm2_5_atm_b', 'pm2_5_cf_1', 'pm2_5_cf_1_b'):
+      data[name] = pm2_5
+  return data
+
+
+def WebBody(sensor_index, fields=None, pm2_5=None):
+  """The API's /v1/sensors/{sensor_index} response."""
+  sensor = dict(WEB_RESPONSE['sensor'], sensor_index=sensor_index)
+  if pm2_5 is not None:
+    sensor['pm2.5_atm'] = sensor['pm2.5_cf_1'] = pm2_5
+  if not fields:
+    return dict(WEB_RESPONSE, sensor=sensor)
+  fields = ['sensor_index'] + [f for f in fields if f != 'sensor_index']
+  return {
+      'api_version': WEB_RESPONSE['api_version'],
+      'time_stamp': WEB_RESPONSE['time_stamp'],
+      'fields': fields,
+      'data': [[sensor.get(f) for f in fields]],
+  }
+
+
+def MultiWebBody(sensor_indexes, fields=None, pm2_5=None):
+  """The API's /v1/sensors?show_only= response."""
+  fields = fields or MULTI_WEB_RESPONSE['fields']
+  fields = ['sensor_index'] + [f for f in fields if f != 'sensor_index']
+  data = []
+  for i, sensor_index in enumerate(sensor_indexes):
+    # Make up some different readings for each.
+    row = MULTI_WEB_RESPONSE['data'][i % len(MULTI_WEB_RESPONSE['data'])]
+    sensor = dict(zip(MULTI_WEB_RESPONSE['fields'], row))
+    sensor['sensor_index'] = sensor_index
+    if pm2_5 is not None:
+      sensor['pm2.5_atm'] = sensor['pm2.5_cf_1'] = pm2_5
+    data.append([sensor.get(f) for f in fields])
+  return {
+      'api_version': MULTI_WEB_RESPONSE['api_version'],
+      'time_stamp': MULTI_WEB_RESPONSE['time_stamp'],
+      'fields': fields,
+      'data': data,
+  }
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+  """Answers one connection's requests (kept alive for HTTP/1.1)."""
+  protocol_version = 'HTTP/1.1'
+  # The headers and body are separate writes: Don't hold the body back
+  # waiting for the client to ACK the headers.
+  disable_nagle_algorithm = True
+
+  def log_message(self, *unused_args):
+    pass
+
+  def setup(self):
+    http.server.BaseHTTPRequestHandler.setup(self)
+    self.server.Count('connections')
+
+  def do_GET(self):
+    server = self.server
+    faults = server.faults
+    path, unused_sep, query = self.path.partition('?')
+    params = parse_qs(query)
+    if path == '/stats':
+      self._Send(200, json.dumps(server.Counters()).encode())
+      return
+    count = server.Count('requests')
+    if faults.latency_ms:
+      time.sleep(faults.latency_ms / 1000)
+    if faults.redirect and 'redirected' not in params:
+      server.Count('redirects')
+      location = self.path + ('&' if query else '?') + 'redirected=1'
+      self._Send(302, b'', {'Location': location})
+      return
+    if faults.rate_limit_every and not count % faults.rate_limit_every:
+      self._Send(429, b'{"error": "RateLimitError"}', {'Retry-After': '1'})
+      return
+    if faults.error_rate and server.random.random() < faults.error_rate:
+      self._Send(faults.error_status, b'{"error": "ServerError"}')
+      return
+    fields = params['fields'][0].split(',') if 'fields' in params else None
+    if path == '/json':
+      data = LocalBody(faults.pm2_5)
+    elif path == '/v1/sensors' and 'show_only' in params:
+      data = MultiWebBody([int(s) for s in params['show_only'][0].split(',')],
+                          fields, faults.pm2_5)
+    elif path.startswith('/v1/sensors/'):
+      try:
+        sensor_index = int(path.rsplit('/', 1)[1])
+      except ValueError:
+        self._Send(404, b'{"error": "NotFoundError"}')
+        return
+      data = WebBody(sensor_index, fields, faults.pm2_5)
+    else:
+      self._Send(404, b'{"error": "NotFoundError"}')
+      return
+    body = json.dumps(data).encode()
+    if faults.malformed_rate and server.random.random() < faults.malformed_rate:
+      server.Count('malformed')
+      body = body[:len(body) // 2]
+    etag = '"%08x"' % zlib.crc32(body)
+    if (self.headers.get('If-None-Match') == etag or
+        self.headers.get('If-Modified-Since') == LAST_MODIFIED and
+        'If-None-Match' not in self.headers):
+      self._Send(304, b'', {'ETag': etag})
+      return
+    self._Send(200, body, {'ETag': etag, 'Last-Modified': LAST_MODIFIED})
+
+  def _Send(self, status, body, headers=None):
+    faults = self.server.faults
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    for name in headers or {}:
+      self.send_header(name, headers[name])
+    # HTTP/1.0 clients don't know chunked encoding.
+    chunked = (faults.chunked and status == 200 and
+               self.request_version == 'HTTP/1.1')
+    if chunked:
+      self.send_header('Transfer-Encoding', 'chunked')
+    elif status not in (204, 304):
+      self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.server.Count(str(status))
+    self.server.Count('bytes', len(body))
+    pieces = [body]
+    if chunked:
+      pieces = [body[i:i + faults.chunk_size]
+                for i in range(0, len(body), faults.chunk_size)]
+    for piece in pieces:
+      if chunked:
+        self._Write(b'%x\r\n' % len(piece) + piece + b'\r\n')
+      else:
+        self._Write(piece)
+    if chunked:
+      self._Write(b'0\r\n\r\n')
+
+  def _Write(self, data):
+    drip_bytes = self.server.faults.drip_bytes
+    if not drip_bytes:
+      self.wfile.write(data)
+      return
+    for i in range(0, len(data), drip_bytes):
+      self.wfile.write(data[i:i + drip_bytes])
+      self.wfile.flush()
+      time.sleep(self.server.faults.drip_ms / 1000)
+
+
+class Server(http.server.ThreadingHTTPServer):
+  """The server, with its Faults and counters."""
+  daemon_threads = True
+
+  def __init__(self, address, faults=None, seed=None):
+    http.server.ThreadingHTTPServer.__init__(self, address, Handler)
+    self.faults = faults or Faults()
+    self.random = random.Random(seed)
+    self.lock = threading.Lock()
+    self.counters = {}
+    self.url = 'http://%s:%d' % self.server_address[:2]
+
+  def Count(self, name, n=1):
+    """Add n to counter name. Returns the new count."""
+    with self.lock:
+      self.counters[name] = self.counters.get(name, 0) + n
+      return self.counters[name]
+
+  def Counters(self):
+    """Snapshot of the counters: connections, requests, redirects,
+    malformed, bytes (of body sent), and a count for each status code
+    sent."""
+    with self.lock:
+      return dict(self.counters)
+
+  def Reset(self):
+    with self.lock:
+      self.counters = {}
+
+
+def Start(faults=None, host='127.0.0.1', port=0, seed=None):
+  """Start a Server in a background thread.
+
+  Args:
+    faults: Faults; default is none.
+    host, port: Where to listen. Port 0 picks a free one: See server.url.
+    seed: Seed the random faults, for repeatable runs.
+  Returns:
+    The Server. Call shutdown() to stop it.
+  """
+  server = Server((host, port), faults, seed)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  return server
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8000)
+  parser.add_argument('--seed', type=int)
+  defaults = Faults()
+  for name in sorted(vars(defaults)):
+    value = getattr(defaults, name)
+    flag = '--' + name.replace('_', '-')
+    if isinstance(value, bool):
+      parser.add_argument(flag, action='store_true')
+    else:
+      parser.add_argument(flag, type=type(value) if value is not None else float)
+  args = parser.parse_args()
+  faults = Faults(**{name: getattr(args, name) for name in vars(defaults)
+                     if getattr(args, name) is not None})
+  server = Server((args.host, args.port), faults, args.seed)
+  print('Serving on %s (counters at %s/stats)' % (server.url, server.url))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    print(server.Counters())
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,142 @@
+"""Redraw only the parts of the display that changed.
+
+Filling the whole screen and reprinting everything on every change is slow
+on the device (it all goes over SPI) and flickers. Renderer remembers what
+text it drew where. Given new text, it clears and redraws only the glyphs
+that changed, and only refills the background when the color changes.
+
+Anything else that draws over the text (e.g. the brightness gauge) reports
+the area with Damage. That area is repaired the next time text is shown.
+Things that erase themselves (the heart, the chaser) don't need to.
+
+The hardware provides the drawing primitives:
+
+  FillScreen(color)
+  FillRect(x, y, width, height, color)
+  DrawText(font, text, x, y, color)
+  TextSize(font, text) -> (width, height)
+
+Fonts are just names ('big', 'small', ...) that the hardware maps to its
+own fonts.
+"""
+
+# Past this many separate damaged areas, just repair their bounding box.
+MAX_DAMAGE = 8
+
+
+def _Overlaps(a, b):
+  return (a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and
+          a[1] < b[1] + b[3] and b[1] < a[1] + a[3])
+
+
+def _Union(a, b):
+  x = min(a[0], b[0])
+  y = min(a[1], b[1])
+  return (x, y, max(a[0] + a[2], b[0] + b[2]) - x,
+          max(a[1] + a[3], b[1] + b[3]) - y)
+
+
+class _Text():
+  """Text that is on the screen."""
+
+  def __init__(self):
+    self.text = ''
+    self.font = None
+    self.color = None
+    self.boxes = []  # (x, y, width, height) of each glyph.
+
+
+class Renderer():
+  """Keep track of what is on the screen, and redraw as little as possible."""
+
+  def __init__(self, hw):
+    self.hw = hw
+    self.bg_color = None  # None: We don't know what is on the screen.
+    self.texts = {}  # slot: _Text
+    self.damage = []
+
+  def Invalidate(self):
+    """Something cleared or covered the whole screen: Redraw it all next time."""
+    self.bg_color = None
+
+  def Damage(self, x, y, width, height):
+    """Something else was drawn here, over the background and text."""
+    rect = (x, y, width, height)
+    for i in range(len(self.damage)):
+      if _Overlaps(rect, self.damage[i]):
+        self.damage[i] = _Union(rect, self.damage[i])
+        return
+    self.damage.append(rect)
+    if len(self.damage) > MAX_DAMAGE:
+      merged = self.damage[0]
+      for rect in self.damage[1:]:
+        merged = _Union(merged, rect)
+      self.damage = [merged]
+
+  def _Boxes(self, font, text, x, y):
+    """Bounding box of each glyph of text drawn at (x, y)."""
+    boxes = []
+    if not text:
+      return boxes
+    height = self.hw.TextSize(font, text)[1]
+    left = x
+    for i in range(len(text)):
+      right = x + self.hw.TextSize(font, text[:i + 1])[0]
+      boxes.append((left, y, right - left, height))
+      left = right
+    return boxes
+
+  def Text(self, slot, x, y, font, bg_color, color, text):
+    """Show text at (x, y) on bg_color, replacing what was in slot.
+
+    Args:
+      slot: Name for this piece of text, e.g. 'big'.
+      x, y: Top left corner.
+      font: Font name.
+      bg_color: Background color for the whole screen.
+      color: Text color.
+      text: What to show. Not a str: It is converted.
+    Returns:
+      True if anything was drawn.
+    """
+    text = '%s' % text
+    old = self.texts.get(slot)
+    if old is None:
+      old = self.texts[slot] = _Text()
+    boxes = self._Boxes(font, text, x, y)
+    filled = bg_color != self.bg_color
+    if filled:
+      self.hw.FillScreen(bg_color)
+      self.bg_color = bg_color
+      self.damage = []
+      for other in self.texts.values():
+        other.text = ''
+        other.boxes = []
+    # Damage and the old boxes of changed glyphs need clearing. Glyphs in
+    # those areas, and changed glyphs, need drawing.
+    clear = self.damage
+    self.damage = []
+    redraw = []
+    for i in range(max(len(old.text), len(text))):
+      if (i >= len(old.text) or i >= len(text) or old.text[i] != text[i] or
+          old.boxes[i] != boxes[i] or old.color != color or old.font != font):
+        if i < len(old.text):
+          clear.append(old.boxes[i])
+        if i < len(text):
+          redraw.append(boxes[i])
+    old.text = text
+    old.font = font
+    old.color = color
+    old.boxes = boxes
+    for rect in clear:
+      self.hw.FillRect(rect[0], rect[1], rect[2], rect[3], bg_color)
+    redraw.extend(clear)
+    for item in self.texts.values():
+      for i in range(len(item.text)):
+        for rect in redraw:
+          if _Overlaps(item.boxes[i], rect):
+            self.hw.DrawText(
+                item.font, item.text[i], item.boxes[i][0], item.boxes[i][1],
+                item.color)
+            break
+    return filled or bool(redraw)
@@ -0,0 +1,126 @@
+"""Run tasks at real intervals instead of counting trips around a loop."""
+try:
+  import heapq
+except ImportError:
+  import uheapq as heapq
+
+
+class Task():
+  """Something to run every interval_ms, or just once."""
+
+  def __init__(self, callback, interval_ms, repeat):
+    self.callback = callback
+    self.interval_ms = interval_ms
+    self.repeat = repeat
+    self.deadline = 0
+    self.cancelled = False
+    self.entry = 0  # Which heap entry is current; older ones are ignored.
+
+
+class Scheduler():
+  """Timer heap driven by the hardware's millisecond clock.
+
+  Tasks are kept in a heap ordered by their next deadline. Run sleeps (while
+  watching the buttons) until the next deadline, runs whatever is due, and
+  works out the next deadline from the previous one rather than from "now",
+  so time spent fetching and drawing doesn't make the cadence drift.
+
+  A task, or the button handler, can end Run by returning something other
+  than None; Run returns that value.
+
+  Each batch of due tasks, and each button press, is run in a display frame
+  (Hardware.BeginFrame/EndFrame), so what they draw is shown in one go.
+  """
+
+  def __init__(self, hw):
+    self.hw = hw
+    self.heap = []
+    self.count = 0  # Tie breaker so the heap never compares Tasks.
+
+  def _Push(self, task):
+    self.count += 1
+    task.entry = self.count
+    heapq.heappush(self.heap, (task.deadline, self.count, task))
+
+  def Every(self, interval_ms, callback, delay_ms=0):
+    """Run callback every interval_ms, the first time after delay_ms."""
+    task = Task(callback, interval_ms, True)
+    task.deadline = self.hw.TicksMS() + delay_ms
+    self._Push(task)
+    return task
+
+  def After(self, delay_ms, callback):
+    """Run callback once, delay_ms from now."""
+    task = Task(callback, delay_ms, False)
+    task.deadline = self.hw.TicksMS() + delay_ms
+    self._Push(task)
+    return task
+
+  def Reschedule(self, task, interval_ms, delay_ms=None):
+    """Change a task's interval, and when it next runs.
+
+    Args:
+      task: Task from Every or After.
+      interval_ms: New interval.
+      delay_ms: Run next this far from now. Default is interval_ms.
+    """
+    if delay_ms is None:
+      delay_ms = interval_ms
+    # The old heap entry is left behind, and ignored when it comes up.
+    task.interval_ms = interval_ms
+    task.deadline = self.hw.TicksMS() + delay_ms
+    task.cancelled = False
+    self._Push(task)
+
+  def Cancel(self, task):
+    task.cancelled = True
+
+  def _RunDue(self, now):
+    """Run everything that is due. Returns the first non-None result."""
+    while self.heap and self.heap[0][0] <= now:
+      deadline, entry, task = heapq.heappop(self.heap)
+      if task.cancelled or entry != task.entry:
+        continue
+      if task.repeat:
+        task.deadline = deadline + task.interval_ms
+        if task.deadline <= now:
+          # Fell more than an interval behind (e.g. in a sub-mode): Don't
+          # try to catch up, just carry on from now.
+          task.deadline = now + task.interval_ms
+        self._Push(task)
+      result = task.callback()
+      if result is not None:
+        return result
+    return None
+
+  def Run(self, on_button):
+    """Run tasks until one of them, or on_button, returns non-None.
+
+    Args:
+      on_button: Called with the button when one is pressed.
+    Returns:
+      Whatever ended the run.
+    """
+    while True:
+      # Everything drawn while running the tasks is shown at once.
+      self.hw.BeginFrame()
+      try:
+        result = self._RunDue(self.hw.TicksMS())
+      finally:
+        self.hw.EndFrame()
+      if result is not None:
+        return result
+      if self.heap:
+        wait_ms = self.heap[0][0] - self.hw.TicksMS()
+      else:
+        wait_ms = 1000
+      if wait_ms > 0:
+        button = self.hw.WaitForButton(wait_ms)
+        if button:
+          self.hw.BeginFrame()
+          try:
+            result = on_button(button)
+          finally:
+            self.hw.EndFrame()
+          if result is not None:
+            return result
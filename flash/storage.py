@@ -0,0 +1,98 @@
+"""Where Defaults keeps its settings.
+
+FileStore keeps them in a JSON file, as always, but never leaves a half
+written file behind: It writes a temporary file and renames it over the old
+one. If the power goes at the wrong moment, one of the two is complete, and
+Load uses that.
+
+NVSStore keeps the settings changed on the device in the ESP32's NVS
+(non-volatile storage), which is made for small, frequent writes, and only
+reads the JSON file. It needs the esp32 module.
+"""
+import json
+try:
+  import uos as os
+except ImportError:
+  import os
+try:
+  import esp32
+except ImportError:
+  esp32 = None
+
+NVS_NAMESPACE = 'aqi'
+NVS_KEY = 'defaults'
+
+
+def _Read(path):
+  with open(path) as f:
+    return json.load(f)
+
+
+class FileStore():
+  """Settings in a JSON file, replaced atomically."""
+
+  def __init__(self, path):
+    self.path = path
+    self.tmp_path = path + '.tmp'
+
+  def Load(self):
+    """Read the settings.
+
+    Returns:
+      dict of settings.
+    Raises:
+      OSError: There's no file.
+      ValueError: The file isn't JSON.
+    """
+    try:
+      return _Read(self.path)
+    except (OSError, ValueError) as e:
+      # Did we lose power between removing the old file and renaming the
+      # new one (see Save)?
+      try:
+        return _Read(self.tmp_path)
+      except (OSError, ValueError):
+        raise e
+
+  def Save(self, data):
+    with open(self.tmp_path, 'w') as f:
+      f.write(json.dumps(data))
+    try:
+      os.rename(self.tmp_path, self.path)
+    except OSError:
+      # Some file systems (FAT) won't rename over an existing file.
+      os.remove(self.path)
+      os.rename(self.tmp_path, self.path)
+
+
+class NVSStore():
+  """Settings from a JSON file, with the ones changed since kept in NVS."""
+
+  def __init__(self, path, namespace=NVS_NAMESPACE):
+    self.path = path
+    self.nvs = esp32.NVS(namespace)
+    self.base = {}
+
+  def Load(self):
+    """Read the file, then apply the changes saved in NVS."""
+    self.base = _Read(self.path)
+    data = dict(self.base)
+    try:
+      size = self.nvs.get_i32(NVS_KEY + '_len')
+      buf = bytearray(size)
+      self.nvs.get_blob(NVS_KEY, buf)
+      data.update(json.loads(buf))
+    except OSError:
+      pass  # Nothing saved yet.
+    return data
+
+  def Save(self, data):
+    """Save what differs from the file."""
+    changed = {}
+    for name in data:
+      if name not in self.base or self.base[name] != data[name]:
+        changed[name] = data[name]
+    blob = json.dumps(changed).encode()
+    self.nvs.set_blob(NVS_KEY, blob)
+    self.nvs.set_i32(NVS_KEY + '_len', len(blob))
+    self.nvs.commit()
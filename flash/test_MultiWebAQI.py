@@ -0,0 +1,85 @@
+import mock
+import unittest
+
+import aqi
+from apps import MultiWebAQI
+
+
+class MultiWebAQITest(unittest.TestCase):
+
+  def setUp(self):
+    self.interface = MultiWebAQI.PurpleMultiWeb()
+    self.mock_data = {
+      'fields': ['sensor_index', 'pm2.5_atm', 'pm2.5_cf_1', 'humidity'],
+      'data': [
+        [38889, 45.5, 30.5, 60],
+        [12345, 5.5, 4.5, None],
+      ],
+    }
+
+  def test_happy_path(self):
+    self.interface.dict_to_data(self.mock_data)
+    self.assertEqual(self.interface.sensor_count, 2)
+    self.assertEqual(self.interface.sensor_index, 38889)
+    self.assertEqual(self.interface.pm2_5_cf_1, 30.5)
+    self.assertEqual(self.interface.pm2_5_atm, 45.5)
+    self.assertEqual(self.interface.humidity, 60)
+
+  def test_select(self):
+    self.interface.dict_to_data(self.mock_data)
+    self.interface.Select(1)
+    self.assertEqual(self.interface.sensor_index, 12345)
+    self.assertEqual(self.interface.pm2_5_atm, 5.5)
+    self.assertIsNone(self.interface.humidity)
+
+  def test_no_sensors(self):
+    with self.assertRaises(ValueError):
+      self.interface.dict_to_data({'fields': [], 'data': []})
+
+  def test_all_offline(self):
+    self.mock_data['data'] = [[38889, None, None, None]]
+    with self.assertRaises(aqi.Error):
+      self.interface.dict_to_data(self.mock_data)
+
+
+class MultiWebCorrectionTest(unittest.TestCase):
+
+  def setUp(self):
+    self.interface = MultiWebAQI.PurpleMultiWeb()
+    self.interface.dict_to_data({
+      'fields': ['sensor_index', 'pm2.5_atm', 'pm2.5_cf_1', 'humidity'],
+      'data': [[1, None, None, None], [2, 5.0, 5.0, 40]],
+    })
+    self.alive = MultiWebAQI.PurpleMultiWeb()
+    self.alive.dict_to_data({
+      'fields': ['sensor_index', 'pm2.5_atm', 'pm2.5_cf_1', 'humidity'],
+      'data': [[2, 5.0, 5.0, 40]],
+    })
+    self.hw = mock.MagicMock()
+
+  def test_offline_sensor_skipped(self):
+    for index, correction in enumerate(
+        aqi.Correction(self.hw, self.interface, 0).corrections):
+      if correction['name'] == 'raw':
+        continue
+      corrections = aqi.Correction(self.hw, self.interface, index)
+      corrections.Record(0)
+      expected = aqi.Correction(self.hw, self.alive, index).GetAqiAndColor()
+      self.assertEqual(corrections.GetAqiAndColor(), expected,
+                       correction['name'])
+      self.assertEqual(list(corrections.nowcasts), [2])
+      # Back on the first sensor, as after dict_to_data.
+      self.assertEqual(self.interface.sensor_index, 1)
+
+  def test_no_raw(self):
+    names = [c['name'] for c in
+             aqi.Correction(self.hw, self.interface, 0).corrections]
+    raw = names.index('raw')
+    corrections = aqi.Correction(self.hw, self.interface, raw)
+    self.assertNotEqual(corrections.correction_index, raw)
+    corrections.correction_index = raw - 1
+    corrections._HandleButton(aqi.hardware.BUTTONB)
+    self.assertEqual(corrections.correction_index, raw + 1)
+
+if __name__ == '__main__':
+  unittest.main()
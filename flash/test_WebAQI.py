@@ -24,5 +24,14 @@ class WebAQITest(unittest.TestCase):
     self.assertEqual(self.interface.pm2_5_atm, 45.5)
     self.assertEqual(self.interface.humidity, 60)
 
+  def test_compact_fields(self):
+    self.interface.dict_to_data({
+      'fields': ['sensor_index', 'humidity', 'pm2.5_atm', 'pm2.5_cf_1'],
+      'data': [[38889, 60, 45.5, 30.5]],
+    })
+    self.assertEqual(self.interface.pm2_5_cf_1, 30.5)
+    self.assertEqual(self.interface.pm2_5_atm, 45.5)
+    self.assertEqual(self.interface.humidity, 60)
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,210 @@
+import mock
+import unittest
+
+import aqi
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+class FakeInterface():
+
+  def __init__(self, pm2_5_atm, pm2_5_cf_1, humidity):
+    self.pm2_5_atm = pm2_5_atm
+    self.pm2_5_cf_1 = pm2_5_cf_1
+    self.humidity = humidity
+
+
+class CorrectionTest(unittest.TestCase):
+
+  def setUp(self):
+    self.hw = mock.MagicMock()
+    self.correction = aqi.Correction(self.hw, None, 0)
+
+  @unittest.skipUnless(numpy, 'requires numpy')
+  def test_CorrectArrays_matches_scalar(self):
+    rng = numpy.random.default_rng(42)
+    pm2_5_atm = numpy.concatenate(
+        [rng.uniform(0, 600, 2000), [0, 1.3, 12.1, 35.5, 343, 344]])
+    pm2_5_cf_1 = numpy.concatenate(
+        [rng.uniform(0, 700, 2000), [0, 1.3, 12.1, 35.5, 343, 344]])
+    humidity = numpy.concatenate(
+        [rng.uniform(0, 100, 2000), [0, 100, 50, 90, 20, 10]])
+    humidity[::100] = numpy.nan  # Sensors without humidity.
+    results = self.correction.CorrectArrays(pm2_5_atm, pm2_5_cf_1, humidity)
+    self.assertNotIn('raw', results)
+    self.assertNotIn('nowcast', results)
+    for index, correction in enumerate(self.correction.corrections):
+      if correction['name'] not in results:
+        continue
+      self.correction.correction_index = index
+      expected = []
+      for values in zip(pm2_5_atm, pm2_5_cf_1, humidity):
+        values = [float(v) for v in values]
+        if numpy.isnan(values[2]):
+          values[2] = None
+        self.correction.interface = FakeInterface(*values)
+        expected.append(self.correction.GetAqiAndColor()[0])
+      self.assertEqual(results[correction['name']].tolist(), expected)
+
+  def test_CorrectArrays_without_numpy(self):
+    with mock.patch.object(aqi, 'numpy', None):
+      with self.assertRaises(ImportError):
+        self.correction.CorrectArrays([12.0], [12.0], [50.0])
+
+  def test_GetAqiAndColor_worst_sensor(self):
+    sensors = [FakeInterface(10, 10, 50), FakeInterface(80, 80, 50),
+               FakeInterface(30, 30, 50)]
+    interface = mock.Mock(sensor_count=len(sensors))
+    def Select(index):
+      interface.pm2_5_atm = sensors[index].pm2_5_atm
+    interface.Select.side_effect = Select
+    self.correction.interface = interface
+    self.assertEqual(self.correction.GetAqiAndColor()[0],
+                     self.correction.aqiFromPM(80))
+
+
+  def test_EPA_without_humidity(self):
+    epa_index = [c['name'] for c in self.correction.corrections].index('epa')
+    self.correction.correction_index = epa_index
+    sensors = [FakeInterface(10, 10, 50), FakeInterface(80, 90, None)]
+    interface = mock.Mock(sensor_count=len(sensors))
+    def Select(index):
+      interface.pm2_5_atm = sensors[index].pm2_5_atm
+      interface.pm2_5_cf_1 = sensors[index].pm2_5_cf_1
+      interface.humidity = sensors[index].humidity
+    interface.Select.side_effect = Select
+    self.correction.interface = interface
+    # No humidity: Not corrected.
+    self.assertEqual(self.correction.GetAqiAndColor()[0],
+                     self.correction.aqiFromPM(80))
+
+  def test_nowcast(self):
+    nowcast_index = [c['name'] for c in self.correction.corrections].index(
+        'nowcast')
+    self.correction.correction_index = nowcast_index
+    self.correction.interface = FakeInterface(10.0, 10.0, None)
+    # Not enough history yet: The instant value.
+    self.assertEqual(self.correction.NowCastCorrection(), 10.0)
+    self.correction.Record(0)
+    self.correction.interface.pm2_5_atm = 40.0
+    self.correction.Record(aqi.nowcast.HOUR_MS)
+    self.assertEqual(self.correction.NowCastCorrection(), (40 + 0.5 * 10) / 1.5)
+
+  def test_nowcast_sensors(self):
+    sensors = [FakeInterface(10, 10, None), FakeInterface(80, 80, None)]
+    interface = mock.Mock(sensor_count=len(sensors))
+    def Select(index):
+      interface.sensor_index = index
+      interface.pm2_5_atm = sensors[index].pm2_5_atm
+      interface.humidity = None
+    interface.Select.side_effect = Select
+    self.correction.interface = interface
+    self.correction.Record(0)
+    self.assertEqual(sorted(self.correction.nowcasts), [0, 1])
+
+
+class PollPolicyTest(unittest.TestCase):
+
+  def test_backs_off_when_flat(self):
+    policy = aqi.PollPolicy(10, 60)
+    intervals = [policy.Next(20) for unused in range(7)]
+    self.assertEqual(intervals,
+                     [10000, 15000, 22500, 33750, 50625, 60000, 60000])
+
+  def test_tightens_on_change(self):
+    policy = aqi.PollPolicy(10, 60)
+    for unused in range(4):
+      policy.Next(20)
+    self.assertEqual(policy.Next(25), 10000)
+
+  def test_tightens_near_boundary(self):
+    policy = aqi.PollPolicy(10, 60)
+    policy.Next(98)
+    self.assertEqual(policy.Next(98), 10000)
+
+  def test_points_budget(self):
+    # 10 points a poll, 8640 points a day: No more than once every 100 s.
+    policy = aqi.PollPolicy(50, 300, 10, 8640)
+    self.assertEqual(policy.Next(20), 100000)
+
+
+class FailurePolicyTest(unittest.TestCase):
+
+  def test_backoff_with_jitter(self):
+    policy = aqi.FailurePolicy()
+    for n in range(aqi.FAILURES_TO_OPEN - 1):
+      delay = min(aqi.RETRY_BASE_MS << n, aqi.RETRY_MAX_MS)
+      self.assertTrue(delay // 2 <= policy.Failed(0) <= delay)
+    self.assertEqual(policy.state, policy.CLOSED)
+
+  def test_opens_then_half_opens(self):
+    policy = aqi.FailurePolicy()
+    for unused_n in range(aqi.FAILURES_TO_OPEN):
+      delay = policy.Failed(0)
+    self.assertEqual(policy.state, policy.OPEN)
+    self.assertTrue(aqi.CIRCUIT_OPEN_MS // 2 <= delay <= aqi.CIRCUIT_OPEN_MS)
+    policy.Attempt()
+    self.assertEqual(policy.state, policy.HALF_OPEN)
+    # One failure while half open opens it again.
+    policy.Failed(0)
+    self.assertEqual(policy.state, policy.OPEN)
+
+  def test_recovery(self):
+    policy = aqi.FailurePolicy()
+    self.assertFalse(policy.Succeeded(0))
+    policy.Failed(1000)
+    policy.Failed(6000)
+    self.assertTrue(policy.Succeeded(9000))
+    self.assertEqual(policy.state, policy.CLOSED)
+    self.assertEqual(policy.consecutive_failures, 0)
+    self.assertEqual(policy.total_failures, 2)
+    self.assertEqual(policy.last_recovery_ms, 8000)
+
+
+class DefaultsTest(unittest.TestCase):
+
+  def test_url_fields(self):
+    defaults = aqi.Defaults(
+        'aqi_web.json', 'https://x/v1/sensors/{sensor_location}?'
+        'api_key={read_api_key}&fields={fields}', ('pm2.5_atm', 'humidity'))
+    config = mock.mock_open(
+        read_data='{"sensor_location": "1234", "read_api_key": "KEY"}')
+    with mock.patch('builtins.open', config):
+      url = defaults.Get('url', None)
+    self.assertEqual(
+        url, 'https://x/v1/sensors/1234?api_key=KEY&fields=pm2.5_atm,humidity')
+
+  def test_coalesce(self):
+    store = mock.Mock()
+    store.Load.return_value = {'sensor_location': '1234', 'brightness': 0}
+    defaults = aqi.Defaults('aqi.json', '{sensor_location}', store=store,
+                            delay_ms=5000)
+    defaults.Get('brightness', 0)
+    for brightness in (1, 2, 3):
+      defaults.Update('brightness', brightness)
+      defaults.Flush(1000)
+    self.assertEqual(defaults.saves, 0)
+    defaults.Flush(5999)
+    self.assertEqual(defaults.saves, 0)
+    defaults.Flush(6000)
+    self.assertEqual(defaults.saves, 1)
+    store.Save.assert_called_once()
+    self.assertEqual(store.Save.call_args[0][0]['brightness'], 3)
+    defaults.Flush(20000)
+    self.assertEqual(defaults.saves, 1)
+
+  def test_flush_now(self):
+    store = mock.Mock()
+    store.Load.return_value = {'sensor_location': '1234'}
+    defaults = aqi.Defaults('aqi.json', '{sensor_location}', store=store,
+                            delay_ms=5000)
+    defaults.Update('brightness', 1)
+    defaults.Flush()
+    self.assertEqual(defaults.saves, 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
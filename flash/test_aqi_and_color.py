@@ -5,6 +5,11 @@ from parameterized import parameterized
 
 import aqi_and_color
 
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
 class AqiAndColorTest(unittest.TestCase):
 
   def setUp(self):
@@ -23,5 +28,39 @@ class AqiAndColorTest(unittest.TestCase):
       color = self.aqi_and_color.getAQIColorRGB(aqi)
       self.assertEqual(color, expected_color)
 
+  @parameterized.expand([(-1,), (0,), (50,), (51,), (250,), (301,), (500,)])
+  def test_getAQIColorTable(self, aqi):
+    table = self.aqi_and_color.getAQIColorTable()
+    r, g, b = self.aqi_and_color.getAQIColorRGB(aqi)
+    self.assertEqual(
+        table[self.aqi_and_color.colorTableIndex(aqi)], (r << 16) | (g << 8) | b)
+
+  def test_colorTableIndex_clamps(self):
+    table = self.aqi_and_color.getAQIColorTable()
+    self.assertEqual(self.aqi_and_color.colorTableIndex(612), len(table) - 1)
+
+  @unittest.skipUnless(numpy, 'requires numpy')
+  def test_aqiFromPMArray_matches_scalar(self):
+    pm = [-5, -0.1, 0, 6, 12, 12.05, 12.1, 12.11, 35.4, 35.5, 35.51, 55.5,
+          55.6, 150.45, 150.5, 150.6, 250.5, 250.6, 350.5, 350.6, 500, 612.3]
+    pm.extend(i / 10 for i in range(0, 6000, 7))
+    aqi = self.aqi_and_color.aqiFromPMArray(numpy.array(pm))
+    self.assertEqual(
+        aqi.tolist(), [self.aqi_and_color.aqiFromPM(p) for p in pm])
+
+  @unittest.skipUnless(numpy, 'requires numpy')
+  def test_getAQIColorRGBArray_matches_scalar(self):
+    aqi = list(range(-1, 520))
+    rgb = self.aqi_and_color.getAQIColorRGBArray(numpy.array(aqi))
+    self.assertEqual(
+        rgb.tolist(), [self.aqi_and_color.getAQIColorRGB(a) for a in aqi])
+
+  def test_arrays_without_numpy(self):
+    with mock.patch.object(aqi_and_color, 'numpy', None):
+      with self.assertRaises(ImportError):
+        self.aqi_and_color.aqiFromPMArray([12.0])
+      with self.assertRaises(ImportError):
+        self.aqi_and_color.getAQIColorRGBArray([50])
+
 if __name__ == '__main__':
   unittest.main()
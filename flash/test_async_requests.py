@@ -0,0 +1,139 @@
+import asyncio
+import http.server
+import threading
+import unittest
+
+import mock
+
+import async_requests
+import nurequests
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  connections = 0
+
+  def setup(self):
+    http.server.BaseHTTPRequestHandler.setup(self)
+    Handler.connections += 1
+
+  def do_GET(self):
+    body = b'{"path": "%s"}' % self.path.encode()
+    if self.path == '/etag':
+      if self.headers.get('If-None-Match') == '"1"':
+        self.send_response(304)
+        self.end_headers()
+        return
+      self.send_response(200)
+      self.send_header('ETag', '"1"')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+    elif self.path == '/missing':
+      self.send_response(404)
+      self.send_header('Content-Length', '0')
+      self.end_headers()
+    elif self.path == '/chunked':
+      self.send_response(200)
+      self.send_header('Transfer-Encoding', 'chunked')
+      self.end_headers()
+      for i in range(0, len(body), 5):
+        chunk = body[i:i + 5]
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+      self.wfile.write(b'0\r\n\r\n')
+    else:
+      self.send_response(200)
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+class ServerTest(unittest.TestCase):
+  """Runs a Handler for the tests."""
+
+  @classmethod
+  def setUpClass(cls):
+    cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+    cls.url = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    cls.server.server_close()
+
+
+class AsyncRequestsTest(ServerTest):
+
+  def test_get(self):
+    status, body = asyncio.run(async_requests.get(self.url + '/json'))
+    self.assertEqual((status, body), (200, b'{"path": "/json"}'))
+
+  def test_chunked(self):
+    status, body = asyncio.run(async_requests.get(self.url + '/chunked'))
+    self.assertEqual((status, body), (200, b'{"path": "/chunked"}'))
+
+  def test_status(self):
+    status, body = asyncio.run(async_requests.get(self.url + '/missing'))
+    self.assertEqual((status, body), (404, b''))
+
+
+class SessionTest(ServerTest):
+
+  def setUp(self):
+    nurequests._dns_cache.clear()
+    Handler.connections = 0
+    self.session = async_requests.Session()
+
+  def Run(self, *paths, **kw):
+    """GET each of paths in turn, in one event loop."""
+    async def Get():
+      try:
+        return [await self.session.get(self.url + path, **kw)
+                for path in paths]
+      finally:
+        self.session.close()
+    return asyncio.run(Get())
+
+  def test_connection_reuse(self):
+    self.assertEqual(self.Run('/json', '/chunked', '/missing', '/json'), [
+        (200, b'{"path": "/json"}'),
+        (200, b'{"path": "/chunked"}'),
+        (404, b''),
+        (200, b'{"path": "/json"}'),
+    ])
+    self.assertEqual(Handler.connections, 1)
+
+  def test_dns_cache(self):
+    with mock.patch.object(nurequests.usocket, 'getaddrinfo',
+                           wraps=nurequests.usocket.getaddrinfo) as lookup:
+      self.Run('/json', '/json')
+      asyncio.run(async_requests.get(self.url + '/json'))
+    self.assertEqual(lookup.call_count, 1)
+
+  def test_conditional(self):
+    self.assertEqual(self.Run('/etag', '/etag', conditional=True), [
+        (200, b'{"path": "/etag"}'), (304, b'')])
+    self.assertEqual(Handler.connections, 1)
+    # Without conditional=True, the validators aren't sent.
+    self.assertEqual(self.Run('/etag'), [(200, b'{"path": "/etag"}')])
+
+  def test_stale_connection(self):
+    async def Get():
+      try:
+        first = await self.session.get(self.url + '/json')
+        # The kept connection dies, e.g. the server timed it out.
+        for reader, writer in self.session._sockets.values():
+          writer.transport.abort()
+        return first, await self.session.get(self.url + '/json')
+      finally:
+        self.session.close()
+    self.assertEqual(asyncio.run(Get()), (
+        (200, b'{"path": "/json"}'), (200, b'{"path": "/json"}')))
+    self.assertEqual(Handler.connections, 2)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+import pygame
+
+import gui_m5stick
+
+
+class TextCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    pygame.font.init()
+    self.cache = gui_m5stick.TextCache(size=2)
+
+  def test_font_cached(self):
+    family = gui_m5stick.FONT_FAMILY
+    self.assertIs(self.cache.Font(family, 24), self.cache.Font(family, 24))
+    self.assertIsNot(self.cache.Font(family, 24), self.cache.Font(family, 40))
+
+  def test_hits_and_misses(self):
+    family = gui_m5stick.FONT_FAMILY
+    first = self.cache.Render(family, 24, '42', [0, 0, 0])
+    self.assertIs(self.cache.Render(family, 24, '42', (0, 0, 0)), first)
+    self.cache.Render(family, 24, '42', gui_m5stick.WHITE)
+    self.assertEqual(self.cache.Stats(), {
+        'fonts': 1, 'surfaces': 2, 'hits': 1, 'misses': 2})
+
+  def test_least_recently_used_dropped(self):
+    family = gui_m5stick.FONT_FAMILY
+    self.cache.Render(family, 24, 'a', gui_m5stick.WHITE)
+    self.cache.Render(family, 24, 'b', gui_m5stick.WHITE)
+    self.cache.Render(family, 24, 'a', gui_m5stick.WHITE)
+    self.cache.Render(family, 24, 'c', gui_m5stick.WHITE)  # Drops b.
+    self.cache.Render(family, 24, 'a', gui_m5stick.WHITE)
+    self.assertEqual(self.cache.hits, 2)
+    self.cache.Render(family, 24, 'b', gui_m5stick.WHITE)
+    self.assertEqual(self.cache.misses, 4)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import aqi
+from apps import LocalAQI
+import headless
+import history
+
+SENSOR = {
+    'pm2_5_atm': 10.0, 'pm2_5_atm_b': 12.0,
+    'pm2_5_cf_1': 10.0, 'pm2_5_cf_1_b': 12.0,
+    'pm2.5_aqi': 46, 'pm2.5_aqi_b': 50,
+    'p25aqic': 'rgb(0,228,0)', 'p25aqic_b': 'rgb(0,228,0)',
+    'current_humidity': 40,
+}
+
+
+class HardwareTest(unittest.TestCase):
+
+  def test_records_drawing(self):
+    hw = headless.Hardware()
+    hw.DisplayBig(headless.GREEN, headless.BLACK, 42)
+    hw.HeartBeat(headless.RED)
+    hw.HeartBeat(headless.GREEN)
+    self.assertEqual(list(hw.log)[0],
+                     ('DisplayBig', headless.GREEN, headless.BLACK, 42))
+    self.assertEqual(hw.counts, {'DisplayBig': 1, 'HeartBeat': 2})
+
+  def test_sources(self):
+    hw = headless.Hardware({'a': 1})
+    self.assertEqual(hw.GetURI('http://x/'), '{"a": 1}')
+    hw.source = lambda url: url
+    self.assertEqual(b''.join(hw.GetURIChunks('http://x/', 3)), b'http://x/')
+    hw.source = None
+    with self.assertRaises(headless.HTTPRequestFailedError):
+      hw.GetURI('http://x/')
+    self.assertEqual(hw.requests, 3)
+
+  def test_buttons(self):
+    hw = headless.Hardware()
+    hw.PressButton(headless.BUTTONB)
+    self.assertEqual(hw.WaitForButton(1000), headless.BUTTONB)
+    self.assertIsNone(hw.CheckForButton())
+
+
+class RunTest(unittest.TestCase):
+  """Run the real AQI.Run headless, for a moment."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.interface = LocalAQI.PurpleLocal()
+    self.interface.config_file = os.path.join(self.dir, 'aqi.json')
+    with open(self.interface.config_file, 'w') as f:
+      f.write(json.dumps({'sensor_location': '127.0.0.1'}))
+    self.hardware = aqi.hardware
+    aqi.SetHardware(headless)
+
+  def tearDown(self):
+    aqi.SetHardware(self.hardware)
+    shutil.rmtree(self.dir)
+
+  def test_run(self):
+    hw = headless.Hardware(json.dumps(SENSOR), stop_ms=300)
+    my_aqi = aqi.AQI(self.interface, hw=hw)
+    with self.assertRaises(headless.Stop):
+      my_aqi.Run()
+    self.assertEqual(hw.requests, 1)
+    self.assertEqual(my_aqi.aqi, 46)
+    self.assertEqual(hw.counts['DisplayBig'], 1)
+    self.assertEqual(hw.counts['HeartBeat'], 1)
+    self.assertGreaterEqual(hw.counts['Chase'], 1)
+
+  def test_sensor_down_at_start(self):
+    """Nothing to draw on yet, but it waits longer and longer to retry."""
+    down_ms = 20 * 60 * 1000
+    failed_ms = []
+
+    def Source(unused_url):
+      if hw.TicksMS() < down_ms:
+        failed_ms.append(hw.TicksMS())
+        raise OSError('down')
+      return SENSOR
+
+    hw = headless.Hardware(
+        Source, stop_ms=down_ms + aqi.CIRCUIT_OPEN_MS + 60000,
+        virtual_clock=True)
+    hw.PressButton(headless.BUTTONB, at_ms=1000)
+    my_aqi = aqi.AQI(self.interface, hw=hw)
+    with self.assertRaises(headless.Stop):
+      my_aqi.Run()
+    self.assertEqual(hw.counts['ShowError'], len(failed_ms))
+    # Waited longer each time...
+    waits = [b - a for a, b in zip(failed_ms, failed_ms[1:])]
+    self.assertEqual(waits[:aqi.FAILURES_TO_OPEN - 1],
+                     sorted(waits[:aqi.FAILURES_TO_OPEN - 1]))
+    self.assertGreaterEqual(waits[0], aqi.RETRY_BASE_MS // 2)
+    # ...then only tried once per CIRCUIT_OPEN_MS (or so).
+    for wait in waits[aqi.FAILURES_TO_OPEN - 1:]:
+      self.assertGreaterEqual(wait, aqi.CIRCUIT_OPEN_MS // 2)
+    self.assertEqual(my_aqi.aqi, 46)
+    self.assertEqual(my_aqi.failures.state, my_aqi.failures.CLOSED)
+    self.assertGreaterEqual(my_aqi.failures.last_recovery_ms, down_ms)
+    self.assertGreaterEqual(hw.counts['HeartBeat'], 1)
+
+  def test_virtual_day(self):
+    day_ms = 24 * 3600 * 1000
+    high = dict(SENSOR, pm2_5_atm=60.0, pm2_5_atm_b=60.0)
+    hw = headless.Hardware(
+        [(0, SENSOR), (day_ms // 2, high), (day_ms * 3 // 4, OSError('down'))],
+        stop_ms=day_ms, virtual_clock=True)
+    # Into the brightness sub-mode, down one level, and forget about it.
+    hw.PressButton(headless.BUTTONB, at_ms=60000)
+    hw.PressButton(headless.BUTTONB, at_ms=61000)
+    my_aqi = aqi.AQI(self.interface, hw=hw)
+    with self.assertRaises(headless.Stop):
+      my_aqi.Run()
+    self.assertEqual(hw.TicksMS(), day_ms)
+    # No heartbeat while in the brightness sub-mode.
+    self.assertGreaterEqual(
+        hw.counts['HeartBeat'],
+        (day_ms - aqi.FORGETFUL_USER_MS - 1000) // aqi.HEARTBEAT_MS)
+    self.assertEqual(my_aqi.defaults.Get('brightness', None), 1)
+    # The AQI went up, then the sensor went away & the display went stale.
+    self.assertEqual(my_aqi.aqi, 153)
+    self.assertTrue(my_aqi.stale)
+    self.assertEqual(my_aqi.failures.state, my_aqi.failures.OPEN)
+    # The readings are in the history, until they are too old.
+    self.assertEqual(my_aqi.history.Average(history.HOUR_MS), 60.0)
+    self.assertLess(my_aqi.history.Average(history.DAY_MS), 60.0)
+    self.assertIsNone(my_aqi.history.Average(history.HOUR_MS, now_ms=day_ms))
+    # Polls back off while the AQI is steady.
+    self.assertLess(hw.requests, day_ms // 1000 // self.interface.seconds_between)
+
+
+
+async def RunFor(coroutine, seconds):
+  """Run coroutine for a while (or until it returns)."""
+  try:
+    return await asyncio.wait_for(coroutine, seconds)
+  except asyncio.TimeoutError:
+    return None
+
+
+class RunAsyncTest(unittest.TestCase):
+  """AQI.RunAsync & the async sub-modes, headless, in real time."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.interface = LocalAQI.PurpleLocal()
+    self.interface.config_file = os.path.join(self.dir, 'aqi.json')
+    with open(self.interface.config_file, 'w') as f:
+      f.write(json.dumps({'sensor_location': '127.0.0.1'}))
+    self.hardware = aqi.hardware
+    aqi.SetHardware(headless)
+
+  def tearDown(self):
+    aqi.SetHardware(self.hardware)
+    shutil.rmtree(self.dir)
+
+  def Source(self, *responses):
+    """Each response in turn, then the last one for ever."""
+    responses = list(responses)
+
+    def Source(unused_url):
+      return responses.pop(0) if len(responses) > 1 else responses[0]
+    return Source
+
+  def test_bad_bodies(self):
+    """Neither a body missing fields nor one that isn't JSON stops polling."""
+    hw = headless.Hardware(self.Source('{}', 'not json', SENSOR))
+    my_aqi = aqi.AQI(self.interface, hw=hw)
+    with mock.patch.object(aqi, 'RETRY_BASE_MS', 20):
+      asyncio.run(RunFor(my_aqi.RunAsync(), 0.5))
+    self.assertEqual(my_aqi.failures.total_failures, 2)
+    self.assertEqual(hw.counts['ShowError'], 2)
+    self.assertEqual(my_aqi.aqi, 46)
+    self.assertEqual(my_aqi.failures.state, my_aqi.failures.CLOSED)
+
+  def test_goes_stale(self):
+    self.interface.seconds_between = 0.05
+    hw = headless.Hardware(self.Source(SENSOR, '{}'))
+    my_aqi = aqi.AQI(self.interface, hw=hw)
+    asyncio.run(RunFor(my_aqi.RunAsync(), 0.3))
+    self.assertEqual(my_aqi.aqi, 46)
+    self.assertTrue(my_aqi.stale)
+    self.assertGreaterEqual(my_aqi.failures.consecutive_failures, 1)
+    x, y, width, height = aqi.STALE_MARKER
+    self.assertIn(('Rect', x, y, width, height, my_aqi.text_color), hw.log)
+
+  def test_brightness_while_polling(self):
+    self.interface.seconds_between = 0.05
+    hw = headless.Hardware(self.Source(SENSOR))
+    for button, at_ms in ((headless.BUTTONB, 100), (headless.BUTTONB, 150),
+                          (headless.BUTTONA, 250)):
+      hw.PressButton(button, at_ms=at_ms)
+    my_aqi = aqi.AQI(self.interface, hw=hw)
+    asyncio.run(RunFor(my_aqi.RunAsync(), 0.4))
+    # The first B goes into the sub-mode, the second turns it down.
+    self.assertEqual(my_aqi.defaults.Get('brightness', None), 1)
+    self.assertIsNone(my_aqi.mode)
+    # Polls carried on while in the sub-mode.
+    self.assertGreaterEqual(hw.requests, 4)
+
+  def test_brightness(self):
+    hw = headless.Hardware()
+    brightness = aqi.Brightness(hw, 0)
+    for button in (headless.BUTTONB, headless.BUTTONB, headless.BUTTONA):
+      hw.PressButton(button)
+    self.assertEqual(
+        asyncio.run(RunFor(brightness.RunAsync(headless.GREEN), 1)), 2)
+    self.assertEqual(hw.brightness, aqi.Brightness.BRIGHTNESS[2])
+    with mock.patch.object(aqi, 'FORGETFUL_USER_MS', 50):
+      self.assertEqual(
+          asyncio.run(RunFor(brightness.RunAsync(headless.GREEN), 1)), 2)
+
+  def test_correction(self):
+    hw = headless.Hardware()
+    self.interface.dict_to_data(SENSOR)
+    correction = aqi.Correction(hw, self.interface, 0)
+    for button in (headless.BUTTONB, headless.BUTTONB, headless.BUTTONA):
+      hw.PressButton(button)
+    self.assertEqual(asyncio.run(RunFor(
+        correction.RunAsync(headless.GREEN, headless.BLACK), 1)), 2)
+    self.assertEqual(hw.counts['DisplayBig'], 2)
+    # Forgotten about: Blinks the symbol until it gives up.
+    with mock.patch.object(aqi, 'FORGETFUL_USER_MS', 200), \
+        mock.patch.object(aqi, 'CORRECTION_BLINK_MS', 20):
+      self.assertEqual(asyncio.run(RunFor(
+          correction.RunAsync(headless.GREEN, headless.BLACK), 1)), 2)
+    self.assertGreaterEqual(hw.counts['ClearSmallRight'], 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
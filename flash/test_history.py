@@ -0,0 +1,75 @@
+import random
+import unittest
+
+import history
+from history import DAY_MS
+from history import HOUR_MS
+from history import RESOLUTION_MS
+from history import TEN_MINUTES_MS
+
+
+class HistoryTest(unittest.TestCase):
+
+  def setUp(self):
+    self.history = history.History()
+
+  def test_empty(self):
+    self.assertIsNone(self.history.Average(HOUR_MS))
+    self.assertEqual(len(self.history), 0)
+
+  def test_same_slot(self):
+    self.history.Add(0, 10.0, 12.0, None)
+    self.history.Add(1000, 20.0, 14.0, 40.0)
+    self.assertEqual(len(self.history), 1)
+    self.assertEqual(self.history.Average(TEN_MINUTES_MS), 15.0)
+    self.assertEqual(self.history.Average(TEN_MINUTES_MS, 'pm2_5_cf_1'), 13.0)
+    self.assertEqual(self.history.Average(TEN_MINUTES_MS, 'humidity'), 40.0)
+
+  def test_windows(self):
+    self.history.Add(0, 100.0, 0, None)
+    self.history.Add(HOUR_MS, 10.0, 0, None)
+    self.assertEqual(self.history.Average(TEN_MINUTES_MS), 10.0)
+    self.assertEqual(self.history.Average(HOUR_MS), 10.0)
+    self.assertEqual(self.history.Average(DAY_MS), 55.0)
+    self.assertEqual(self.history.Average(DAY_MS, now_ms=DAY_MS), 10.0)
+    self.assertIsNone(self.history.Average(HOUR_MS, now_ms=2 * HOUR_MS))
+
+  def test_wraps(self):
+    """Matches averaging from scratch, over several days of readings."""
+    rng = random.Random(1)
+    readings = []
+    now = 0
+    for unused in range(3000):
+      now += rng.randint(1, 4 * RESOLUTION_MS)
+      pm = round(rng.uniform(0, 300), 1)
+      humidity = None if rng.random() < 0.1 else round(rng.uniform(0, 99))
+      self.history.Add(now, pm, pm, humidity)
+      readings.append((now // RESOLUTION_MS, pm, humidity))
+    slot = now // RESOLUTION_MS
+    for window_ms in history.WINDOWS_MS:
+      slots = {}
+      for s, pm, humidity in readings:
+        if s > slot - window_ms // RESOLUTION_MS:
+          slots.setdefault(s, []).append((pm, humidity))
+      pms = [sum(r[0] for r in rs) / len(rs) for rs in slots.values()]
+      self.assertAlmostEqual(
+          self.history.Average(window_ms), sum(pms) / len(pms), delta=0.05)
+      humidities = []
+      for rs in slots.values():
+        hs = [r[1] for r in rs if r[1] is not None]
+        if hs:
+          humidities.append(sum(hs) / len(hs))
+      self.assertAlmostEqual(
+          self.history.Average(window_ms, 'humidity'),
+          sum(humidities) / len(humidities), delta=0.05)
+    self.assertEqual(len(self.history), self.history.capacity)
+
+  def test_budget(self):
+    self.assertLessEqual(
+        self.history.capacity * (4 + 3 * 2), history.MAX_BYTES)
+    with self.assertRaises(ValueError):
+      history.History(resolution_ms=1000)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,54 @@
+import json
+import unittest
+from parameterized import parameterized
+
+import json_fields
+
+LOCAL = {
+  'SensorId': '84:f3:eb:7b:c8:c1',
+  'Geo': 'PurpleAir-c8c1 "back" \\ yard',
+  'pm2_5_atm': 12.5,
+  'pm2_5_atm_b': 13.25,
+  'p25aqic': 'rgb(255,255,0)',
+  'current_humidity': 45,
+  'nested': {'pm2_5_atm': 99, 'list': [1, {'x': '}]'}, []]},
+  'flag': True,
+  'nothing': None,
+}
+
+SHAPE = {
+  'pm2_5_atm': None,
+  'pm2_5_atm_b': None,
+  'p25aqic': None,
+  'current_humidity': None,
+  'missing': None,
+  'nested': {'list': None},
+}
+
+EXPECTED = {
+  'pm2_5_atm': 12.5,
+  'pm2_5_atm_b': 13.25,
+  'p25aqic': 'rgb(255,255,0)',
+  'current_humidity': 45,
+  'nested': {'list': [1, {'x': '}]'}, []]},
+}
+
+
+class JsonFieldsTest(unittest.TestCase):
+
+  def test_extract_string(self):
+    self.assertEqual(json_fields.extract(json.dumps(LOCAL), SHAPE), EXPECTED)
+
+  @parameterized.expand([(1,), (2,), (7,), (64,)])
+  def test_extract_chunks(self, size):
+    raw = json.dumps(LOCAL, indent=2).encode()
+    chunks = [raw[i:i + size] for i in range(0, len(raw), size)]
+    self.assertEqual(json_fields.extract(chunks, SHAPE), EXPECTED)
+
+  @parameterized.expand([('{"a": 1',), ('{"a" 1}',), ('{"a": "x',), ('',)])
+  def test_bad_json(self, text):
+    with self.assertRaises(ValueError):
+      json_fields.extract(text, {'a': None})
+
+if __name__ == '__main__':
+  unittest.main()
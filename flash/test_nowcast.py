@@ -0,0 +1,71 @@
+import random
+import unittest
+
+import nowcast
+from nowcast import HOUR_MS
+
+
+def NowCast(hours):
+  """From scratch: hours are averages, newest first, None where missing."""
+  if len([c for c in hours[:3] if c is not None]) < 2:
+    return None
+  present = [c for c in hours if c is not None]
+  weight = min(present) / max(present) if max(present) else 1.0
+  weight = max(weight, nowcast.MIN_WEIGHT)
+  total = weights = 0.0
+  for i, c in enumerate(hours):
+    if c is not None:
+      total += weight**i * c
+      weights += weight**i
+  return total / weights
+
+
+class NowCastTest(unittest.TestCase):
+
+  def setUp(self):
+    self.nowcast = nowcast.NowCast()
+
+  def test_needs_two_hours(self):
+    self.assertIsNone(self.nowcast.Value())
+    self.nowcast.Add(0, 10.0)
+    self.assertIsNone(self.nowcast.Value())
+    self.nowcast.Add(HOUR_MS, 20.0)
+    self.assertEqual(self.nowcast.Value(), (20.0 + 0.5 * 10.0) / 1.5)
+    # Two hours without data.
+    self.nowcast.Add(4 * HOUR_MS, 20.0)
+    self.assertIsNone(self.nowcast.Value())
+
+  def test_steady(self):
+    for hour in range(24):
+      self.nowcast.Add(hour * HOUR_MS, 12.0)
+    self.assertAlmostEqual(self.nowcast.Value(), 12.0)
+
+  def test_zero(self):
+    self.nowcast.Add(0, 0.0)
+    self.nowcast.Add(HOUR_MS, 0.0)
+    self.assertEqual(self.nowcast.Value(), 0.0)
+
+  def test_matches_from_scratch(self):
+    rng = random.Random(3)
+    readings = []
+    now = 0
+    for unused in range(2000):
+      now += rng.choice((60000, 120000, 600000, 3 * HOUR_MS // 2))
+      pm = rng.uniform(0, 200)
+      self.nowcast.Add(now, pm)
+      readings.append((now // HOUR_MS, pm))
+      hour = now // HOUR_MS
+      hours = []
+      for h in range(hour, hour - nowcast.HOURS, -1):
+        pms = [p for r, p in readings if r == h]
+        hours.append(sum(pms) / len(pms) if pms else None)
+      expected = NowCast(hours)
+      if expected is None:
+        self.assertIsNone(self.nowcast.Value())
+      else:
+        self.assertAlmostEqual(self.nowcast.Value(), expected)
+      readings = [r for r in readings if r[0] > hour - nowcast.HOURS]
+
+
+if __name__ == '__main__':
+  unittest.main()
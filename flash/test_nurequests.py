@@ -0,0 +1,298 @@
+import io
+import json
+import time
+import unittest
+
+import mock
+from parameterized import parameterized
+
+import aqi
+import headless
+import nurequests
+from apps import LocalAQI
+
+SENSOR = {
+    'SensorId': '84:f3:eb:7b:c8:c1',
+    'pm2_5_atm': 10.0, 'pm2_5_atm_b': 12.0,
+    'pm2_5_cf_1': 10.0, 'pm2_5_cf_1_b': 12.0,
+    'pm2.5_aqi': 46, 'pm2.5_aqi_b': 50,
+    'p25aqic': 'rgb(0,228,0)', 'p25aqic_b': 'rgb(0,228,0)',
+    'current_humidity': 40,
+    'Geo': 'PurpleAir-c8c1',
+}
+
+
+def _Response(body=b'', *headers, status=b'200 OK'):
+  """A canned HTTP/1.1 response. Content-Length is added unless chunked."""
+  head = [b'HTTP/1.1 ' + status] + list(headers)
+  if not any(h.startswith(b'Transfer-Encoding') for h in headers):
+    head.append(b'Content-Length: %d' % len(body))
+  return b'\r\n'.join(head) + b'\r\n\r\n' + body
+
+
+def _Chunked(body, size):
+  """body, with chunked transfer-encoding, in chunks of size bytes."""
+  out = b''
+  for i in range(0, len(body), size):
+    chunk = body[i:i + size]
+    out += b'%x\r\n%s\r\n' % (len(chunk), chunk)
+  return out + b'0\r\n\r\n'
+
+
+class FakeSocket():
+  """A usocket.socket, connected to a FakeServer."""
+
+  def __init__(self, server):
+    self.server = server
+    self.input = io.BytesIO()
+    self.address = None
+    self.closed = False
+    self.hung_up = False
+
+  def settimeout(self, seconds):
+    pass
+
+  def connect(self, address):
+    if address in self.server.refused:
+      raise OSError(111, 'ECONNREFUSED')
+    self.address = address
+
+  def write(self, data):
+    self.server.requests.append(bytes(data))
+    if not self.hung_up:
+      self.input = io.BytesIO(self.server.responses.pop(0))
+    return len(data)
+
+  def readline(self):
+    return self.input.readline()
+
+  def readinto(self, buf):
+    if self.server.drip:
+      buf = memoryview(buf)[:self.server.drip]
+    return self.input.readinto(buf)
+
+  def read(self, size=-1):
+    return self.input.read(size)
+
+  def close(self):
+    self.closed = True
+
+  def HangUp(self):
+    """The server times out the kept-alive connection."""
+    self.hung_up = True
+    self.input = io.BytesIO()
+
+
+class FakeServer():
+  """Stands in for usocket: Answers each request with the next response."""
+
+  SOCK_STREAM = 1
+
+  def __init__(self):
+    self.responses = []
+    self.requests = []
+    self.sockets = []
+    self.lookups = []
+    self.refused = []  # Addresses whose connections are refused.
+    self.drip = None  # If set, readinto returns at most this many bytes.
+
+  def getaddrinfo(self, host, port, af=0, type=0):
+    self.lookups.append(host)
+    return [(2, self.SOCK_STREAM, 0, '', (host, port))]
+
+  def socket(self, af, type, proto):
+    s = FakeSocket(self)
+    self.sockets.append(s)
+    return s
+
+
+class SessionHardware(headless.Hardware):
+  """headless, but fetching with a nurequests Session, as m5stickc does."""
+
+  def __init__(self):
+    headless.Hardware.__init__(self)
+    self.session = nurequests.Session()
+
+  def GetURI(self, url):
+    return self.session.get(url).text
+
+  def GetURIChunks(self, url, chunk_size=16):
+    return self.session.get(url).iter_content(chunk_size)
+
+
+class NurequestsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.server = FakeServer()
+    patcher = mock.patch.object(nurequests, 'usocket', self.server)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    nurequests._dns_cache.clear()
+    self.session = nurequests.Session()
+    self.url = 'http://sensor/json?live=false'
+
+  def test_get(self):
+    self.server.responses.append(b'HTTP/1.0 200 OK\r\n\r\n{"pm": 1}')
+    resp = nurequests.get(self.url)
+    self.assertEqual(resp.status_code, 200)
+    self.assertEqual(resp.content, b'{"pm": 1}')
+    self.assertEqual(
+        self.server.requests,
+        [b'GET /json?live=false HTTP/1.0\r\nHost: sensor\r\n\r\n'])
+    self.assertTrue(self.server.sockets[0].closed)
+
+  def test_connection_reuse(self):
+    for body in (b'{"pm": 1}', b'{"pm": 2}', b'{"pm": 3}'):
+      self.server.responses.append(_Response(body))
+      self.assertEqual(self.session.get(self.url).content, body)
+    self.assertEqual(len(self.server.sockets), 1)
+    self.assertFalse(self.server.sockets[0].closed)
+    self.assertIn(b'Connection: keep-alive\r\n', self.server.requests[0])
+    self.session.close()
+    self.assertTrue(self.server.sockets[0].closed)
+
+  def test_stale_connection(self):
+    self.server.responses += [_Response(b'1'), _Response(b'2')]
+    self.assertEqual(self.session.get(self.url).content, b'1')
+    self.server.sockets[0].HangUp()
+    self.assertEqual(self.session.get(self.url).content, b'2')
+    self.assertEqual(len(self.server.sockets), 2)
+    self.assertTrue(self.server.sockets[0].closed)
+
+  def test_connection_close(self):
+    self.server.responses += [
+        _Response(b'1', b'Connection: close'), _Response(b'2')]
+    self.assertEqual(self.session.get(self.url).content, b'1')
+    self.assertEqual(self.session.get(self.url).content, b'2')
+    self.assertEqual(len(self.server.sockets), 2)
+
+  def test_redirect(self):
+    self.server.responses += [
+        _Response(b'', b'Location: /v1/sensors/1', status=b'302 Found'),
+        _Response(b'{"pm": 1}')]
+    resp = self.session.get(self.url)
+    self.assertEqual(resp.status_code, 200)
+    self.assertEqual(resp.content, b'{"pm": 1}')
+    self.assertTrue(
+        self.server.requests[1].startswith(b'GET /v1/sensors/1 HTTP/1.1\r\n'))
+
+  def test_chunked(self):
+    body = b'{"pm2_5_atm": 24.74, "humidity": 40}'
+    self.server.responses += [
+        _Response(_Chunked(body, 10), b'Transfer-Encoding: chunked')] * 2
+    self.server.drip = 3
+    resp = self.session.get(self.url)
+    self.assertEqual(resp.headers[b'transfer-encoding'], b'chunked')
+    chunks = list(resp.iter_content(8))
+    self.assertLessEqual(max(len(c) for c in chunks), 8)
+    self.assertEqual(b''.join(chunks), body)
+    # Read to the end: The connection is reused.
+    resp = self.session.get(self.url)
+    buf = bytearray(32)
+    got = b''
+    while True:
+      n = resp.readinto(buf)
+      if not n:
+        break
+      got += buf[:n]
+    self.assertEqual(got, body)
+    self.assertEqual(len(self.server.sockets), 1)
+
+  def test_chunked_without_session(self):
+    self.server.responses.append(
+        _Response(_Chunked(b'0123456789', 4), b'Transfer-Encoding: chunked'))
+    self.assertEqual(nurequests.get(self.url).content, b'0123456789')
+
+  def test_body_cut_short(self):
+    self.server.responses.append(
+        _Response(b'12345')[:-2])  # Content-Length says 5.
+    resp = self.session.get(self.url)
+    with self.assertRaises(OSError):
+      resp.content
+    self.assertTrue(self.server.sockets[0].closed)
+    self.assertEqual(self.session._sockets, {})
+
+  @parameterized.expand([(False,), (True,)])
+  def test_aqi_reuses_connection(self, stream_json):
+    """GetData reads the whole body, even when it only needs some of it."""
+    my_aqi = aqi.AQI(LocalAQI.PurpleLocal())
+    my_aqi.hw = SessionHardware()
+    my_aqi.url = self.url
+    for pm2_5 in (10.0, 20.0):
+      sensor = dict(SENSOR, pm2_5_atm=pm2_5, pm2_5_atm_b=pm2_5)
+      self.server.responses.append(_Response(json.dumps(sensor).encode()))
+      with mock.patch.object(aqi, 'STREAM_JSON', stream_json):
+        self.assertTrue(my_aqi.GetData())
+      self.assertEqual(my_aqi.interface.pm2_5_atm, pm2_5)
+      self.assertEqual(len(my_aqi.hw.session._sockets), 1)
+    self.assertEqual(len(self.server.sockets), 1)
+
+  def test_conditional(self):
+    etag = b'ETag: "1"'
+    modified = b'Last-Modified: Wed, 01 Jan 2025 00:00:00 GMT'
+    self.server.responses += [
+        _Response(b'{"pm": 1}', etag, modified),
+        _Response(status=b'304 Not Modified'),
+        _Response(b'{"pm": 2}', b'ETag: "2"'),
+        _Response(b'{"pm": 2}', b'ETag: "2"'),
+    ]
+    resp = self.session.get(self.url, conditional=True)
+    self.assertEqual(resp.content, b'{"pm": 1}')
+    self.assertNotIn(b'If-None-Match', self.server.requests[0])
+    resp = self.session.get(self.url, conditional=True)
+    self.assertEqual(resp.status_code, 304)
+    self.assertEqual(resp.content, b'')
+    self.assertIn(b'If-None-Match: "1"\r\n', self.server.requests[1])
+    self.assertIn(b'If-Modified-Since: Wed, 01 Jan 2025 00:00:00 GMT\r\n',
+                  self.server.requests[1])
+    resp = self.session.get(self.url, conditional=True)
+    self.assertEqual(resp.content, b'{"pm": 2}')
+    # Without conditional=True, the validators aren't sent.
+    self.assertEqual(self.session.get(self.url).content, b'{"pm": 2}')
+    self.assertNotIn(b'If-None-Match', self.server.requests[3])
+    self.assertEqual(len(self.server.sockets), 1)
+
+  def test_dns_cache(self):
+    self.server.responses += [_Response(b'1'), _Response(b'2'),
+                              _Response(b'3')]
+    nurequests.get(self.url).content
+    nurequests.get(self.url).content
+    self.assertEqual(self.server.lookups, ['sensor'])
+    later = time.time() + nurequests.DNS_TTL + 1
+    with mock.patch.object(nurequests.time, 'time', return_value=later):
+      nurequests.get(self.url).content
+    self.assertEqual(self.server.lookups, ['sensor', 'sensor'])
+
+  def test_dns_cache_eviction(self):
+    now = time.time()
+    hosts = ['host%d' % i for i in range(nurequests.DNS_CACHE_SIZE + 1)]
+    for i, host in enumerate(hosts):
+      with mock.patch.object(nurequests.time, 'time', return_value=now + i):
+        nurequests._resolve(host, 80)
+    # The one that would expire first made room for the last.
+    self.assertEqual(sorted(nurequests._dns_cache),
+                     [(host, 80) for host in hosts[1:]])
+
+  def test_dns_forgotten_when_refused(self):
+    self.server.refused.append(('sensor', 80))
+    with self.assertRaises(OSError):
+      nurequests.get(self.url)
+    self.assertEqual(nurequests._dns_cache, {})
+    self.assertTrue(self.server.sockets[0].closed)
+
+  def test_absolute_url(self):
+    for location, url in (
+        ('http://other/x', 'http://other/x'),
+        ('//other/x', 'http://other/x'),
+        ('/x?a=1', 'http://host:8000/x?a=1'),
+        ('y', 'http://host:8000/v1/y'),
+    ):
+      self.assertEqual(nurequests._absolute_url(
+          'http:', 'host', 8000, 'v1/sensors?a=b/c', location), url)
+    self.assertEqual(
+        nurequests._absolute_url('https:', 'host', 443, '', '/x'),
+        'https://host/x')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import socket
+import unittest
+import urllib.error
+import urllib.request
+
+import async_requests
+from apps import LocalAQI
+from apps import MultiWebAQI
+from apps import WebAQI
+import purpleair_server
+
+
+class PurpleAirServerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.server = purpleair_server.Start(seed=1)
+    self.faults = self.server.faults
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def get(self, path):
+    with urllib.request.urlopen(self.server.url + path) as resp:
+      return resp.read()
+
+  def test_local(self):
+    self.faults.pm2_5 = 40.0
+    interface = LocalAQI.PurpleLocal()
+    interface.dict_to_data(json.loads(self.get('/json?live=false')))
+    self.assertEqual(interface.pm2_5_atm, 40.0)
+
+  def test_web_fields(self):
+    interface = WebAQI.PurpleWeb()
+    interface.dict_to_data(json.loads(self.get(
+        '/v1/sensors/38889?api_key=KEY&fields=pm2.5_atm,pm2.5_cf_1,humidity')))
+    self.assertEqual(interface.pm2_5_atm, 3.9)
+    self.assertEqual(interface.humidity, 36)
+    interface.dict_to_data(json.loads(self.get('/v1/sensors/38889')))
+    self.assertEqual(interface.pm2_5_cf_1, 3.9)
+
+  def test_multi_web(self):
+    interface = MultiWebAQI.PurpleMultiWeb()
+    interface.dict_to_data(json.loads(self.get(
+        '/v1/sensors?show_only=1,2,3&fields=pm2.5_atm,pm2.5_cf_1,humidity')))
+    self.assertEqual(interface.sensor_count, 3)
+
+  def test_faults(self):
+    self.faults.rate_limit_every = 2
+    self.get('/json')
+    with self.assertRaises(urllib.error.HTTPError) as e:
+      self.get('/json')
+    self.assertEqual(e.exception.code, 429)
+    self.faults.rate_limit_every = 0
+    self.faults.error_rate = 1
+    with self.assertRaises(urllib.error.HTTPError) as e:
+      self.get('/json')
+    self.assertEqual(e.exception.code, 503)
+    self.faults.error_rate = 0
+    self.faults.malformed_rate = 1
+    with self.assertRaises(ValueError):
+      json.loads(self.get('/json'))
+    counters = self.server.Counters()
+    self.assertEqual(counters['requests'], 4)
+    self.assertEqual(counters['429'], 1)
+    self.assertEqual(counters['503'], 1)
+    self.assertEqual(counters['malformed'], 1)
+
+  def test_redirect_chunked_drip(self):
+    self.faults.redirect = True
+    self.faults.chunked = True
+    self.faults.chunk_size = 100
+    self.faults.drip_bytes = 500
+    status, body = asyncio.run(async_requests.get(
+        self.server.url + '/json?live=false'))
+    self.assertEqual(status, 302)
+    # urllib follows the redirect, and speaks HTTP/1.1, so gets it chunked.
+    with urllib.request.urlopen(self.server.url + '/json?live=false') as resp:
+      self.assertEqual(resp.headers['Transfer-Encoding'], 'chunked')
+      self.assertEqual(json.loads(resp.read())['pm2_5_atm'], 24.74)
+    counters = self.server.Counters()
+    self.assertEqual(counters['redirects'], 2)
+    self.assertEqual(counters['302'], 2)
+    self.assertEqual(counters['200'], 1)
+
+  def test_http_1_0_not_chunked(self):
+    self.faults.chunked = True
+    with socket.create_connection(self.server.server_address) as s:
+      s.sendall(b'GET /json HTTP/1.0\r\nHost: x\r\n\r\n')
+      response = b''
+      while True:
+        data = s.recv(4096)
+        if not data:
+          break
+        response += data
+    head, body = response.split(b'\r\n\r\n', 1)
+    self.assertNotIn(b'chunked', head)
+    self.assertEqual(json.loads(body)['pm2_5_atm'], 24.74)
+
+  def test_not_modified(self):
+    url = self.server.url + '/json?live=false'
+    with urllib.request.urlopen(url) as resp:
+      etag = resp.headers['ETag']
+      last_modified = resp.headers['Last-Modified']
+    for headers in ({'If-None-Match': etag},
+                    {'If-Modified-Since': last_modified}):
+      with self.assertRaises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+      self.assertEqual(e.exception.code, 304)
+    # Changed: The old ETag doesn't match.
+    self.faults.pm2_5 = 40.0
+    request = urllib.request.Request(url, headers={'If-None-Match': etag})
+    with urllib.request.urlopen(request) as resp:
+      self.assertEqual(json.loads(resp.read())['pm2_5_atm'], 40.0)
+    self.assertEqual(self.server.Counters()['connections'], 4)
+
+if __name__ == '__main__':
+  unittest.main()
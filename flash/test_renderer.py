@@ -0,0 +1,88 @@
+import unittest
+
+import renderer
+
+
+class FakeHardware():
+  """Monospaced: Every glyph is 10x20."""
+
+  def __init__(self):
+    self.calls = []
+
+  def FillScreen(self, color):
+    self.calls.append(('FillScreen', color))
+
+  def FillRect(self, x, y, width, height, color):
+    self.calls.append(('FillRect', x, y, width, height, color))
+
+  def DrawText(self, font, text, x, y, color):
+    self.calls.append(('DrawText', text, x, y, color))
+
+  def TextSize(self, font, text):
+    return 10 * len(text), 20
+
+
+class RendererTest(unittest.TestCase):
+
+  def setUp(self):
+    self.hw = FakeHardware()
+    self.renderer = renderer.Renderer(self.hw)
+    self.renderer.Text('big', 5, 5, 'big', 'green', 'black', 123)
+    self.hw.calls = []
+
+  def test_first_draw_fills(self):
+    hw = FakeHardware()
+    renderer.Renderer(hw).Text('big', 5, 5, 'big', 'green', 'black', 12)
+    self.assertEqual(hw.calls, [
+        ('FillScreen', 'green'),
+        ('DrawText', '1', 5, 5, 'black'),
+        ('DrawText', '2', 15, 5, 'black'),
+    ])
+
+  def test_unchanged(self):
+    self.assertFalse(
+        self.renderer.Text('big', 5, 5, 'big', 'green', 'black', 123))
+    self.assertEqual(self.hw.calls, [])
+
+  def test_one_digit(self):
+    self.assertTrue(
+        self.renderer.Text('big', 5, 5, 'big', 'green', 'black', 124))
+    self.assertEqual(self.hw.calls, [
+        ('FillRect', 25, 5, 10, 20, 'green'),
+        ('DrawText', '4', 25, 5, 'black'),
+    ])
+
+  def test_shorter(self):
+    self.renderer.Text('big', 5, 5, 'big', 'green', 'black', 12)
+    self.assertEqual(self.hw.calls, [('FillRect', 25, 5, 10, 20, 'green')])
+
+  def test_new_background(self):
+    self.renderer.Text('big', 5, 5, 'big', 'yellow', 'black', 123)
+    self.assertEqual(self.hw.calls[0], ('FillScreen', 'yellow'))
+    self.assertEqual(len(self.hw.calls), 4)
+
+  def test_damage_is_repaired(self):
+    self.renderer.Damage(0, 0, 20, 8)
+    self.renderer.Text('big', 5, 5, 'big', 'green', 'black', 123)
+    self.assertEqual(self.hw.calls, [
+        ('FillRect', 0, 0, 20, 8, 'green'),
+        ('DrawText', '1', 5, 5, 'black'),
+        ('DrawText', '2', 15, 5, 'black'),
+    ])
+
+  def test_other_slot_redrawn_under_damage(self):
+    self.renderer.Text('small', 30, 10, 'small', 'green', 'black', 'E')
+    self.renderer.Damage(30, 10, 4, 4)
+    self.hw.calls = []
+    self.renderer.Text('big', 5, 5, 'big', 'green', 'black', 123)
+    self.assertIn(('DrawText', 'E', 30, 10, 'black'), self.hw.calls)
+    self.assertIn(('DrawText', '3', 25, 5, 'black'), self.hw.calls)
+
+  def test_invalidate(self):
+    self.renderer.Invalidate()
+    self.renderer.Text('big', 5, 5, 'big', 'green', 'black', 123)
+    self.assertEqual(self.hw.calls[0], ('FillScreen', 'green'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+
+import scheduler
+
+
+class FakeHardware():
+  """Clock that only moves when we wait."""
+
+  def __init__(self, buttons=None):
+    self.now = 0
+    self.waits = []
+    # {time_ms: button}
+    self.buttons = dict(buttons or {})
+    self.frame_depth = 0
+    self.frames = 0
+
+  def BeginFrame(self):
+    self.frame_depth += 1
+
+  def EndFrame(self):
+    self.frame_depth -= 1
+    self.frames += 1
+
+  def TicksMS(self):
+    return self.now
+
+  def WaitForButton(self, ms):
+    self.waits.append(ms)
+    for when in sorted(self.buttons):
+      if self.now < when <= self.now + ms:
+        self.now = when
+        return self.buttons.pop(when)
+    self.now += ms
+    return None
+
+
+class SchedulerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.hw = FakeHardware()
+    self.tasks = scheduler.Scheduler(self.hw)
+    self.runs = []
+
+  def record(self, name, stop_at=None):
+    def callback():
+      self.runs.append((name, self.hw.now))
+      if stop_at is not None and self.hw.now >= stop_at:
+        return 'done'
+      return None
+    return callback
+
+  def test_intervals_do_not_drift(self):
+    def slow():
+      self.runs.append(('slow', self.hw.now))
+      self.hw.now += 30  # Fetching takes a while.
+    self.tasks.Every(100, slow)
+    self.tasks.After(350, lambda: 'done')
+    self.assertEqual(self.tasks.Run(lambda button: None), 'done')
+    self.assertEqual(self.runs, [('slow', 0), ('slow', 100), ('slow', 200),
+                                 ('slow', 300)])
+
+  def test_sleeps_until_next_deadline(self):
+    self.tasks.Every(200, self.record('a'), 200)
+    self.tasks.Every(300, self.record('b', stop_at=600), 300)
+    self.tasks.Run(lambda button: None)
+    self.assertEqual(self.runs, [('a', 200), ('b', 300), ('a', 400),
+                                 ('b', 600)])
+    self.assertEqual(self.hw.waits, [200, 100, 100, 200])
+
+  def test_button_ends_run(self):
+    self.hw.buttons = {250: 'A'}
+    self.tasks.Every(100, self.record('a'))
+    result = self.tasks.Run(lambda button: 'got %s' % button)
+    self.assertEqual(result, 'got A')
+    self.assertEqual(self.hw.now, 250)
+
+  def test_frames(self):
+    depths = []
+    self.hw.buttons = {150: 'A'}
+    self.tasks.Every(100, lambda: depths.append(self.hw.frame_depth))
+    self.tasks.Run(lambda button: depths.append(self.hw.frame_depth) or 'x')
+    # Both tasks and the button handler draw in a frame, and frames end.
+    self.assertEqual(depths, [1, 1, 1])
+    self.assertEqual(self.hw.frame_depth, 0)
+    self.assertEqual(self.hw.frames, 3)
+
+  def test_reschedule_and_cancel(self):
+    task = self.tasks.Every(100, self.record('a'))
+    other = self.tasks.Every(50, self.record('b'), 50)
+    self.tasks.After(10, lambda: self.tasks.Reschedule(task, 400))
+    self.tasks.After(20, lambda: self.tasks.Cancel(other))
+    self.tasks.After(450, lambda: 'done')
+    self.tasks.Run(lambda button: None)
+    self.assertEqual(self.runs, [('a', 0), ('a', 410)])
+
+  def test_falls_behind_without_bursting(self):
+    def submode():
+      self.hw.now += 1000
+    self.tasks.Every(100, self.record('a'))
+    self.tasks.After(50, submode)
+    self.tasks.After(1250, lambda: 'done')
+    self.tasks.Run(lambda button: None)
+    self.assertEqual(self.runs, [('a', 0), ('a', 1050), ('a', 1150)])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import storage
+
+
+class FileStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, 'aqi.json')
+    self.store = storage.FileStore(self.path)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _Write(self, path, text):
+    with open(path, 'w') as f:
+      f.write(text)
+
+  def test_save_load(self):
+    self._Write(self.path, '{"brightness": 0}')
+    self.store.Save({'brightness': 2})
+    self.assertEqual(self.store.Load(), {'brightness': 2})
+    self.assertEqual(os.listdir(self.dir), ['aqi.json'])
+
+  def test_rename_fails(self):
+    """FAT won't rename over a file: Remove it first."""
+    self._Write(self.path, '{"brightness": 0}')
+    rename = os.rename
+
+    def Rename(src, dst):
+      if mock_rename.call_count == 1:
+        raise OSError('exists')
+      rename(src, dst)
+
+    with mock.patch.object(storage.os, 'rename',
+                           side_effect=Rename) as mock_rename:
+      self.store.Save({'brightness': 2})
+    self.assertEqual(mock_rename.call_count, 2)
+    self.assertEqual(self.store.Load(), {'brightness': 2})
+
+  def test_lost_power_after_remove(self):
+    self._Write(self.path + '.tmp', '{"brightness": 2}')
+    self.assertEqual(self.store.Load(), {'brightness': 2})
+
+  def test_lost_power_while_writing(self):
+    self._Write(self.path, '{"brightness": 0}')
+    self._Write(self.path + '.tmp', '{"bright')
+    self.assertEqual(self.store.Load(), {'brightness': 0})
+
+  def test_corrupt(self):
+    self._Write(self.path, '{"bright')
+    with self.assertRaises(ValueError):
+      self.store.Load()
+
+  def test_missing(self):
+    with self.assertRaises(OSError):
+      self.store.Load()
+
+
+class FakeNVS():
+
+  def __init__(self):
+    self.values = {}
+    self.commits = 0
+
+  def get_i32(self, key):
+    if key not in self.values:
+      raise OSError('ESP_ERR_NVS_NOT_FOUND')
+    return self.values[key]
+
+  def set_i32(self, key, value):
+    self.values[key] = value
+
+  def get_blob(self, key, buf):
+    if key not in self.values:
+      raise OSError('ESP_ERR_NVS_NOT_FOUND')
+    buf[:] = self.values[key]
+    return len(buf)
+
+  def set_blob(self, key, value):
+    self.values[key] = bytes(value)
+
+  def commit(self):
+    self.commits += 1
+
+
+class NVSStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, 'aqi.json')
+    with open(self.path, 'w') as f:
+      json.dump({'sensor_location': '1234', 'brightness': 0}, f)
+    self.nvs = FakeNVS()
+    storage.esp32 = self
+    self.store = storage.NVSStore(self.path)
+
+  def tearDown(self):
+    storage.esp32 = None
+    shutil.rmtree(self.dir)
+
+  def NVS(self, namespace):
+    self.assertEqual(namespace, storage.NVS_NAMESPACE)
+    return self.nvs
+
+  def test_save_load(self):
+    data = self.store.Load()
+    self.assertEqual(data, {'sensor_location': '1234', 'brightness': 0})
+    data['brightness'] = 3
+    self.store.Save(data)
+    self.assertEqual(self.nvs.commits, 1)
+    self.assertEqual(json.loads(self.nvs.values[storage.NVS_KEY]),
+                     {'brightness': 3})
+    with open(self.path) as f:
+      self.assertEqual(json.load(f)['brightness'], 0)
+    self.assertEqual(storage.NVSStore(self.path).Load(),
+                     {'sensor_location': '1234', 'brightness': 3})
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,56 @@
+"""MicroPython's usocket, on top of CPython's socket.
+
+Just enough of usocket for nurequests, which uses this when there's no
+usocket, i.e. on a PC: MicroPython sockets have stream methods (write,
+readline, readinto, read). For tests and benchmarks; it isn't copied to
+the device.
+"""
+import socket as _socket
+
+AF_INET = _socket.AF_INET
+SOCK_STREAM = _socket.SOCK_STREAM
+
+
+def getaddrinfo(host, port, af=0, type=0, proto=0, flags=0):
+  return _socket.getaddrinfo(host, port, af, type, proto, flags)
+
+
+class socket():
+  """A CPython socket, with MicroPython's stream methods."""
+
+  def __init__(self, af=AF_INET, type=SOCK_STREAM, proto=0):
+    self.sock = _socket.socket(af, type, proto)
+    self.file = None  # Buffered reader, for readline.
+
+  def _File(self):
+    if self.file is None:
+      self.file = self.sock.makefile('rb')
+    return self.file
+
+  def settimeout(self, seconds):
+    self.sock.settimeout(seconds)
+
+  def connect(self, address):
+    self.sock.connect(address)
+
+  def write(self, data):
+    if isinstance(data, str):
+      data = data.encode()  # MicroPython writes str as its UTF-8 bytes.
+    self.sock.sendall(data)
+    return len(data)
+
+  def readline(self):
+    return self._File().readline()
+
+  def readinto(self, buf):
+    return self._File().readinto(buf)
+
+  def read(self, size=-1):
+    return self._File().read(size)
+
+  def close(self):
+    if self.file is not None:
+      self.file.close()
+      self.file = None
+    self.sock.close()
+